@@ -10,13 +10,14 @@ from django.forms.models import BaseInlineFormSet
 from django.http import HttpResponseRedirect
 from django.template.defaultfilters import slugify
 from django.urls import reverse
-import PyPDF2
 
 from django_object_actions import (
     DjangoObjectActions, takes_instance_or_queryset)
 
 from nemi_project.admin import method_admin
 from common import models
+from common.utils.cache import bump_data_version, bump_method_versions
+from common.utils.pdf_validation import check_pdf_structure, schedule_validation
 
 
 class ReadOnlyMixin:
@@ -75,13 +76,10 @@ class PDFFileField(forms.FileField):
     def clean(self, value, initial=None):
         value = super(PDFFileField, self).clean(value)
 
-        # To validate the PDF, try to read it with PyPDF2.
-        if value:
-            try:
-                PyPDF2.PdfFileReader(value)
-                value.seek(0)
-            except PyPDF2.utils.PdfReadError:
-                raise ValidationError('Please upload a valid PDF file.')
+        # Only the header and trailer are checked here. The whole PDF is read in the background once
+        # it has been saved.
+        if value and not check_pdf_structure(value):
+            raise ValidationError('Please upload a valid PDF file.')
 
         return value
 
@@ -106,7 +104,7 @@ class AbstractRevisionForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         initial = kwargs.get('initial', {})
         revision = kwargs.get('instance')
-        if revision and revision.method_pdf:
+        if revision and revision.has_pdf():
             initial['pdf_file'] = RevisionFile(revision, self.STAGE)
         kwargs['initial'] = initial
         super(AbstractRevisionForm, self).__init__(*args, **kwargs)
@@ -115,8 +113,9 @@ class AbstractRevisionForm(forms.ModelForm):
         instance = super(AbstractRevisionForm, self).save(commit=False)
 
         if self.cleaned_data['pdf_file']:
-            instance.method_pdf = self.cleaned_data['pdf_file'].read()
-            instance.mimetype = 'application/pdf'
+            # Re-uploading a PDF which is already stored only adds a reference to it.
+            instance.set_pdf(self.cleaned_data['pdf_file'])
+            schedule_validation(instance.pdf_blob_id)
 
         if commit:
             instance.save()
@@ -168,13 +167,13 @@ class AbstractRevisionInline(ReadOnlyMixin, admin.TabularInline):
 
 
 class AbstractEditableRevisionInline(AbstractRevisionInline):
-    fields = ('revision_flag', 'revision_information', 'pdf_file')
+    fields = ('revision_flag', 'revision_information', 'pdf_file', 'pdf_status')
     class Meta:
         abstract = True
 
     def pdf_file(self):
         # If we have a method_pdf, use the revision name as the PDF label.
-        return '%s.pdf' % self.revision_information if self.method_pdf else None
+        return '%s.pdf' % self.revision_information if self.has_pdf() else None
 
     def save_model(self, request, obj, form, change):
         if not change:
@@ -189,7 +188,25 @@ class AbstractEditableRevisionInline(AbstractRevisionInline):
         # return super(AbstractEditableRevisionInline, self).get_readonly_fields(request, obj=obj)
 
         # For now, allow any admin to edit the online and staging tables.
-        return ()
+        return ('pdf_status',)
+
+    def pdf_status(self, obj):
+        # The result of the background validation of the revision's PDF.
+        if not obj.pdf_blob_id:
+            return ''
+        # Only the status columns are read, obj.pdf_blob would also load the PDF.
+        blob = models.PdfBlob.objects.filter(checksum=obj.pdf_blob_id).values(
+            'validation_status', 'page_count', 'validation_message').first()
+        if blob is None:
+            return ''
+        if blob['validation_status'] == models.PdfBlob.VALID:
+            return 'Valid PDF, %s page%s' % (blob['page_count'], '' if blob['page_count'] == 1 else 's')
+        elif blob['validation_status'] == models.PdfBlob.INVALID:
+            return 'Invalid PDF: %s' % blob['validation_message']
+        else:
+            return 'Checking the PDF, reload the page to see the result'
+
+    pdf_status.short_description = 'PDF status'
 
     def has_add_permission(self, request, obj=None):
         # As an inline, we defer to the parent permissions
@@ -375,8 +392,9 @@ class AbstractMethodAdmin(admin.ModelAdmin):
         ActiveRevisionCountFilter,
         list_q_filter(
             'active revision has PDF',
-            Q(revisions__revision_flag=True) and Q(
-                revisions__method_pdf__isnull=False)
+            Q(revisions__revision_flag=True) and (
+                Q(revisions__method_pdf__isnull=False) |
+                Q(revisions__pdf_blob__isnull=False))
         ),
         list_q_filter(
             'has analytes',
@@ -646,7 +664,10 @@ class MethodStgAdmin(DjangoObjectActions, AbstractEditableMethodAdmin):
 
     @takes_instance_or_queryset
     def publish(self, request, queryset):
+        method_ids = list(queryset.values_list('method_id', flat=True))
         rows_updated = queryset.update(approved='Y')
+        bump_data_version()
+        bump_method_versions(method_ids)
         self.message_user(request, 'published %d method%s' % (
             rows_updated, 's' if rows_updated > 1 else ''))
 
@@ -655,7 +676,7 @@ class MethodStgAdmin(DjangoObjectActions, AbstractEditableMethodAdmin):
 
     @takes_instance_or_queryset
     def archive(self, request, queryset):
-        method_ids = queryset.values_list('method_id', flat=True)
+        method_ids = list(queryset.values_list('method_id', flat=True))
         try:
             cursor = connection.cursor()
             for method_id in method_ids:
@@ -668,6 +689,8 @@ class MethodStgAdmin(DjangoObjectActions, AbstractEditableMethodAdmin):
                 )
         finally:
             cursor.close()
+            bump_data_version()
+            bump_method_versions(method_ids)
 
         rows_updated = len(method_ids)
         self.message_user(request, 'archived %d method%s' % (
@@ -0,0 +1,32 @@
+"""
+This command extracts the text of the published revision PDFs into the
+directory in settings.PDF_TEXT_DIR, where it is used by the keyword search
+backends. Only revisions which are new or have changed since the last run are
+extracted. The data version is changed if any text was extracted or removed so
+that the search indexes are rebuilt.
+"""
+from django.core.management.base import BaseCommand
+
+from common.utils.cache import bump_data_version
+from common.utils.pdf_text import PdfTextStore, update_pdf_texts
+
+
+class Command(BaseCommand):
+    help = 'Extracts the text of new or changed revision PDFs for the keyword search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Number of extraction processes. Defaults to the number of CPUs.')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Check the checksum of every revision PDF, not just those with a changed checksum or dates.')
+
+    def handle(self, *args, **options):
+        extracted, removed = update_pdf_texts(
+            PdfTextStore(), processes=options['processes'], force=options['force'])
+
+        if extracted or removed:
+            bump_data_version()
+
+        self.stdout.write('Extracted the text of %s revisions and removed %s.' % (extracted, removed))
@@ -0,0 +1,58 @@
+"""
+This command moves the PDFs kept in the method_pdf column of the online,
+staging, and published revisions into the shared pdf_blob table, so that each
+distinct PDF is stored once and revisions refer to it by checksum. If
+settings.PDF_BLOB_ONLY is True, the method_pdf columns of the online and staging
+revisions are then cleared. Otherwise they are kept, because the database
+procedures which copy revisions between the tables only copy method_pdf. A
+cleared copy is shared again first even if the revision already has a checksum.
+The published revisions keep their copy unless --clear-published is also given,
+because the Oracle Text keyword index is built on revision_join.method_pdf.
+Finally the reference counts of the shared PDFs are recomputed, which also
+corrects the counts of revisions copied by the database procedures.
+"""
+import io
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from common.models import PdfBlob, RevisionJoin, RevisionJoinOnline, RevisionJoinStg
+
+
+class Command(BaseCommand):
+    help = 'Moves the revision PDFs into the shared, deduplicated PDF table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clear-published', action='store_true',
+            help='Also clear the method_pdf column of the published revisions. Requires settings.PDF_BLOB_ONLY.')
+
+    def handle(self, *args, **options):
+        blob_only = getattr(settings, 'PDF_BLOB_ONLY', False)
+        if options['clear_published'] and not blob_only:
+            raise CommandError('--clear-published requires settings.PDF_BLOB_ONLY')
+
+        models = [(RevisionJoinOnline, blob_only), (RevisionJoinStg, blob_only),
+                  (RevisionJoin, options['clear_published'])]
+
+        for (model, clear) in models:
+            revisions = model.objects.filter(method_pdf__isnull=False)
+            if not clear:
+                revisions = revisions.filter(pdf_blob__isnull=True)
+            # Copies which are cleared are shared again even if the revision has a checksum, as the database
+            # procedures may have replaced the copy without changing the checksum.
+            revision_ids = list(revisions.values_list('revision_id', flat=True))
+            for revision_id in revision_ids:
+                with transaction.atomic():
+                    pdf = model.objects.filter(revision_id=revision_id).values_list('method_pdf', flat=True)[0]
+                    checksum = PdfBlob.objects.store(io.BytesIO(bytes(pdf)))
+                    values = {'pdf_blob': checksum}
+                    if clear:
+                        values['method_pdf'] = None
+                    model.objects.filter(revision_id=revision_id).update(**values)
+
+            self.stdout.write('Shared the PDFs of %s %s.' % (len(revision_ids), model._meta.verbose_name_plural))
+
+        deleted = PdfBlob.objects.recount()
+        self.stdout.write('Removed %s unused PDFs.' % deleted)
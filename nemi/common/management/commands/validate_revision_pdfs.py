@@ -0,0 +1,29 @@
+"""
+This command validates the shared revision PDFs which have not been validated
+in the background, recording whether each is a valid PDF and its number of
+pages. Use --all to validate every PDF again.
+"""
+from django.core.management.base import BaseCommand
+
+from common.models import PdfBlob
+from common.utils.pdf_validation import validate_pdf_blob
+
+
+class Command(BaseCommand):
+    help = 'Validates the revision PDFs which are pending validation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Validate all of the PDFs, not just those which are pending.')
+
+    def handle(self, *args, **options):
+        blobs = PdfBlob.objects.all()
+        if not options['all']:
+            blobs = blobs.filter(validation_status=PdfBlob.PENDING)
+
+        statuses = [validate_pdf_blob(checksum, force=options['all'])
+                    for checksum in list(blobs.values_list('checksum', flat=True))]
+
+        self.stdout.write('Validated %s PDFs, %s invalid.' % (
+            len(statuses), statuses.count(PdfBlob.INVALID)))
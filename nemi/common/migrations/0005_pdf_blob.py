@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+REVISION_MODELS = (
+    ('revisionjoin', 'REVISION_JOIN'),
+    ('revisionjoinonline', 'REVISION_JOIN_ONLINE'),
+    ('revisionjoinstg', 'REVISION_JOIN_STG'),
+    ('protocolrevisionjoinstg', None),  # Shares the REVISION_JOIN_STG table
+)
+
+
+def _add_pdf_checksum(model_name, table):
+    field = migrations.AddField(
+        model_name=model_name,
+        name='pdf_blob',
+        field=models.ForeignKey(blank=True, db_column='pdf_checksum', editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='common.PdfBlob'),
+    )
+    if table is None:
+        return migrations.SeparateDatabaseAndState(state_operations=[field])
+    return migrations.RunSQL(
+        'ALTER TABLE "%s" ADD "PDF_CHECKSUM" VARCHAR2(64 CHAR) NULL REFERENCES "PDF_BLOB" ("CHECKSUM");' % table,
+        reverse_sql='ALTER TABLE "%s" DROP COLUMN "PDF_CHECKSUM";' % table,
+        state_operations=[field]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_increase_method_id_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE TABLE "PDF_BLOB" ('
+            '"CHECKSUM" VARCHAR2(64 CHAR) NOT NULL PRIMARY KEY, '
+            '"PDF" BLOB NOT NULL, '
+            '"PDF_SIZE" NUMBER(11) NOT NULL, '
+            '"REFERENCE_COUNT" NUMBER(11) NOT NULL, '
+            '"INSERT_DATE" DATE NULL);',
+            reverse_sql='DROP TABLE "PDF_BLOB";',
+            state_operations=[
+                migrations.CreateModel(
+                    name='PdfBlob',
+                    fields=[
+                        ('checksum', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                        ('pdf', models.BinaryField()),
+                        ('pdf_size', models.IntegerField()),
+                        ('reference_count', models.IntegerField(default=0)),
+                        ('insert_date', models.DateField(auto_now_add=True, null=True)),
+                    ],
+                    options={
+                        'verbose_name': 'revision PDF',
+                        'db_table': 'pdf_blob',
+                        'managed': False,
+                    },
+                ),
+            ]
+        ),
+    ] + [_add_pdf_checksum(model_name, table) for (model_name, table) in REVISION_MODELS]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_pdf_blob'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'ALTER TABLE "PDF_BLOB" ADD ('
+            '"VALIDATION_STATUS" VARCHAR2(10 CHAR) DEFAULT \'pending\' NOT NULL, '
+            '"PAGE_COUNT" NUMBER(11) NULL, '
+            '"VALIDATION_MESSAGE" VARCHAR2(400 CHAR) NULL);',
+            reverse_sql='ALTER TABLE "PDF_BLOB" DROP ("VALIDATION_STATUS", "PAGE_COUNT", "VALIDATION_MESSAGE");',
+            state_operations=[
+                migrations.AddField(
+                    model_name='pdfblob',
+                    name='validation_status',
+                    field=models.CharField(choices=[('pending', 'Pending'), ('valid', 'Valid'), ('invalid', 'Invalid')], default='pending', max_length=10),
+                ),
+                migrations.AddField(
+                    model_name='pdfblob',
+                    name='page_count',
+                    field=models.IntegerField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='pdfblob',
+                    name='validation_message',
+                    field=models.CharField(blank=True, max_length=400, null=True),
+                ),
+            ]
+        ),
+    ]
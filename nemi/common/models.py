@@ -1,5 +1,8 @@
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connection, IntegrityError, models, transaction
 
 from reference import models as refs
 
@@ -965,6 +968,137 @@ class LegacyUserAccount(models.Model):
         db_table = 'user_account'
 
 
+class PdfBlobManager(models.Manager):
+    '''Extends the Manager class to store each distinct PDF once, keyed by the sha256 checksum of its contents,
+    with a count of the revisions which refer to it.
+    '''
+
+    def get_queryset(self):
+        return super(PdfBlobManager, self).get_queryset().defer('pdf')
+
+    def checksum(self, pdf_file, chunk_size=64 * 1024):
+        ''' Returns a tuple of the checksum and the size of the contents of the seekable file like object pdf_file,
+        read in chunks of chunk_size bytes.
+        '''
+        digest = hashlib.sha256()
+        size = 0
+        pdf_file.seek(0)
+        for chunk in iter(lambda: pdf_file.read(chunk_size), b''):
+            digest.update(chunk)
+            size += len(chunk)
+        pdf_file.seek(0)
+        return (digest.hexdigest(), size)
+
+    def store(self, pdf_file, chunk_size=64 * 1024):
+        ''' Stores the contents of the seekable file like object pdf_file, read in chunks of chunk_size bytes,
+        if they are not already stored, and adds a reference to them. Returns the checksum of the contents.
+        '''
+        (checksum, size) = self.checksum(pdf_file, chunk_size)
+
+        if not self.add_reference(checksum):
+            pdf_file.seek(0)
+            try:
+                with transaction.atomic():
+                    self._insert(checksum, pdf_file, size, chunk_size)
+            except IntegrityError:
+                # Stored by another request in the meantime.
+                self.add_reference(checksum)
+
+        return checksum
+
+    def _insert(self, checksum, pdf_file, size, chunk_size):
+        # Write the pdf to the BLOB a chunk at a time rather than binding all of it at once.
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        if connection.vendor != 'oracle':
+            self.create(checksum=checksum, pdf=b'', pdf_size=size, reference_count=1)
+            with connection.cursor() as cursor:
+                for chunk in iter(lambda: pdf_file.read(chunk_size), b''):
+                    # SQLite concatenates as text, so the result is cast back to a BLOB.
+                    cursor.execute('UPDATE %s SET pdf = CAST(pdf || %%s AS BLOB) WHERE checksum = %%s' % table,
+                                   [chunk, checksum])
+            return
+
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                'INSERT INTO %s (checksum, pdf, pdf_size, reference_count, insert_date, validation_status) '
+                'VALUES (%%s, EMPTY_BLOB(), %%s, 1, SYSDATE, %%s)' % table,
+                [checksum, size, PdfBlob.PENDING])
+            cursor.execute('SELECT pdf FROM %s WHERE checksum = %%s FOR UPDATE' % table, [checksum])
+            lob = cursor.fetchone()[0]
+            offset = 1
+            for chunk in iter(lambda: pdf_file.read(chunk_size), b''):
+                lob.write(chunk, offset)
+                offset += len(chunk)
+        finally:
+            cursor.close()
+
+    def add_reference(self, checksum):
+        ''' Adds a reference to the PDF with checksum. Returns False if there is no such PDF.'''
+        return self.filter(checksum=checksum).update(reference_count=models.F('reference_count') + 1) > 0
+
+    def release(self, checksum):
+        ''' Removes a reference to the PDF with checksum and deletes it once there are no references left.'''
+        self.filter(checksum=checksum).update(reference_count=models.F('reference_count') - 1)
+        try:
+            self.filter(checksum=checksum, reference_count__lte=0).delete()
+        except models.ProtectedError:
+            # The count was wrong, which recount corrects.
+            self.filter(checksum=checksum).update(reference_count=models.F('reference_count') + 1)
+
+    def recount(self):
+        ''' Sets the reference counts from the revisions which refer to each PDF, including those copied
+        by the database procedures, and deletes the PDFs which are no longer referred to. Returns the number
+        of PDFs deleted.
+        '''
+        counts = {}
+        for model in (RevisionJoin, RevisionJoinOnline, RevisionJoinStg):
+            revisions = model.objects.filter(pdf_blob__isnull=False).values('pdf_blob').annotate(count=models.Count('pk'))
+            for revision in revisions:
+                counts[revision['pdf_blob']] = counts.get(revision['pdf_blob'], 0) + revision['count']
+
+        for (checksum, reference_count) in self.values_list('checksum', 'reference_count'):
+            if counts.get(checksum, 0) != reference_count:
+                self.filter(checksum=checksum).update(reference_count=counts.get(checksum, 0))
+
+        deleted, _ = self.filter(reference_count__lte=0).delete()
+        return deleted
+
+
+class PdfBlob(models.Model):
+    ''' A PDF shared by the online, staging, and published revisions which have the same PDF contents.
+    New PDFs are pending until they have been read by the background validation, which records
+    whether they are valid and their number of pages.
+    '''
+    PENDING = 'pending'
+    VALID = 'valid'
+    INVALID = 'invalid'
+    VALIDATION_STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (VALID, 'Valid'),
+        (INVALID, 'Invalid')
+    )
+
+    objects = PdfBlobManager()
+
+    checksum = models.CharField(max_length=64, primary_key=True)
+    pdf = models.BinaryField()
+    pdf_size = models.IntegerField()
+    reference_count = models.IntegerField(default=0)
+    insert_date = models.DateField(blank=True, null=True, auto_now_add=True)
+    validation_status = models.CharField(max_length=10, default=PENDING, choices=VALIDATION_STATUS_CHOICES)
+    page_count = models.IntegerField(blank=True, null=True)
+    validation_message = models.CharField(max_length=400, blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'pdf_blob'
+        verbose_name = 'revision PDF'
+
+    def __str__(self):
+        return self.checksum
+
+
 class RevisionManager(models.Manager):
     def get_queryset(self):
         queryset = super(RevisionManager, self).get_queryset()
@@ -972,6 +1106,9 @@ class RevisionManager(models.Manager):
 
 
 class AbstractRevision(models.Model):
+    ''' A revision of a method. The references to the shared PdfBlobs are changed when the revision is saved
+    or deleted, in the same transaction, so that they are not changed by revisions which are never saved.
+    '''
     objects = RevisionManager()
 
     revision_id = models.AutoField(primary_key=True)
@@ -991,13 +1128,71 @@ class AbstractRevision(models.Model):
     pdf_insert_date = models.DateField(blank=True, null=True)
     method_pdf = models.BinaryField(blank=True, null=True)
     mimetype = models.CharField(max_length=50, blank=True, null=True)
+    # The shared copy of the PDF. A revision's own copy in method_pdf, if it has one, is used in preference,
+    # as the database procedures may have replaced it without changing pdf_checksum.
+    pdf_blob = models.ForeignKey(
+        PdfBlob, models.PROTECT, db_column='pdf_checksum',
+        blank=True, null=True, related_name='+', editable=False)
 
     class Meta:
         abstract = True
 
+    def __init__(self, *args, **kwargs):
+        super(AbstractRevision, self).__init__(*args, **kwargs)
+        # The PdfBlob referred to by the saved revision and the file to store when the revision is saved.
+        self._saved_pdf_blob_id = None
+        self._pdf_file = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(AbstractRevision, cls).from_db(db, field_names, values)
+        instance._saved_pdf_blob_id = instance.__dict__.get('pdf_blob_id')
+        return instance
+
     def __str__(self):
         return self.revision_information
 
+    def has_pdf(self):
+        return bool(self.pdf_blob_id or self.method_pdf)
+
+    def set_pdf(self, pdf_file, mimetype='application/pdf'):
+        ''' Sets the revision's PDF to the contents of the seekable file like object pdf_file. The contents are
+        stored when the revision is saved. Unless settings.PDF_BLOB_ONLY is True, the revision also keeps its own
+        copy in method_pdf, which is the copy used by the database procedures.
+        '''
+        (self.pdf_blob_id, size) = PdfBlob.objects.checksum(pdf_file)
+        self._pdf_file = pdf_file
+        if getattr(settings, 'PDF_BLOB_ONLY', False):
+            self.method_pdf = None
+        else:
+            self.method_pdf = pdf_file.read()
+            pdf_file.seek(0)
+        self.mimetype = mimetype
+
+    def save(self, *args, **kwargs):
+        old_checksum = self._saved_pdf_blob_id
+        new_checksum = self.pdf_blob_id
+        with transaction.atomic(using=kwargs.get('using')):
+            if new_checksum and new_checksum != old_checksum:
+                if self._pdf_file is not None:
+                    PdfBlob.objects.store(self._pdf_file)
+                else:
+                    PdfBlob.objects.add_reference(new_checksum)
+            super(AbstractRevision, self).save(*args, **kwargs)
+            if old_checksum and old_checksum != new_checksum:
+                PdfBlob.objects.release(old_checksum)
+
+        self._saved_pdf_blob_id = new_checksum
+        self._pdf_file = None
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            result = super(AbstractRevision, self).delete(*args, **kwargs)
+            if self._saved_pdf_blob_id:
+                PdfBlob.objects.release(self._saved_pdf_blob_id)
+        self._saved_pdf_blob_id = None
+        return result
+
 
 class RevisionJoin(AbstractRevision):
     method = models.ForeignKey(
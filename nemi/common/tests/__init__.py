@@ -6,6 +6,11 @@ from . import test_utils
 from . import test_views
 from . import test_context_processors
 from . import test_method_admin
+from . import test_pdf_text
+from . import test_query_budget
+from . import test_admission
+from . import test_pdf_cache
+from . import test_pdf_validation
 
 
 def suite():
@@ -16,6 +21,11 @@ def suite():
         unittest.TestLoader().loadTestsFromModule(test_views),
         unittest.TestLoader().loadTestsFromModule(test_context_processors),
         unittest.TestLoader().loadTestsFromModule(test_method_admin),
+        unittest.TestLoader().loadTestsFromModule(test_pdf_text),
+        unittest.TestLoader().loadTestsFromModule(test_query_budget),
+        unittest.TestLoader().loadTestsFromModule(test_admission),
+        unittest.TestLoader().loadTestsFromModule(test_pdf_cache),
+        unittest.TestLoader().loadTestsFromModule(test_pdf_validation),
     ])
 
 
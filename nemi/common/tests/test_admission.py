@@ -0,0 +1,178 @@
+
+import threading
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.urls import reverse
+
+from nemi_project.middleware import AdmissionControlMiddleware
+
+from ..utils.admission import get_client_address, AdmissionController, TokenBucket, stats
+
+
+class TokenBucketTestCase(SimpleTestCase):
+
+    @mock.patch('common.utils.admission.time.monotonic')
+    def test_take(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket(0.5, 2)
+
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 2.0)
+
+        mock_monotonic.return_value = 101.0
+        self.assertEqual(bucket.take(), 1.0)
+
+        mock_monotonic.return_value = 102.0
+        self.assertEqual(bucket.take(), 0)
+
+        # The bucket never holds more than capacity tokens.
+        mock_monotonic.return_value = 200.0
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertNotEqual(bucket.take(), 0)
+
+
+class AdmissionControllerTestCase(SimpleTestCase):
+
+    def setUp(self):
+        stats.reset()
+
+    def test_rate_limited(self):
+        controller = AdmissionController({'search': (60, 2)}, {})
+
+        self.assertEqual(controller.admit('1.1.1.1', 'search'), ('admitted', 0))
+        controller.release('search')
+        self.assertEqual(controller.admit('1.1.1.1', 'search'), ('admitted', 0))
+        controller.release('search')
+        self.assertEqual(controller.admit('1.1.1.1', 'search'), ('rate_limited', 1))
+
+        # Other clients and endpoint classes have their own limits.
+        self.assertEqual(controller.admit('2.2.2.2', 'search')[0], 'admitted')
+        self.assertEqual(controller.admit('1.1.1.1', 'page')[0], 'admitted')
+
+        self.assertEqual(stats.requests[('search', 'admitted')], 3)
+        self.assertEqual(stats.requests[('search', 'rate_limited')], 1)
+
+    def test_overloaded(self):
+        controller = AdmissionController({}, {'export': 2})
+
+        self.assertEqual(controller.admit('1.1.1.1', 'export')[0], 'admitted')
+        self.assertEqual(controller.admit('2.2.2.2', 'export')[0], 'admitted')
+        self.assertEqual(controller.admit('3.3.3.3', 'export'), ('overloaded', 1))
+        self.assertEqual(stats.in_flight['export'], 2)
+
+        controller.release('export')
+        self.assertEqual(controller.admit('3.3.3.3', 'export')[0], 'admitted')
+        self.assertEqual(stats.requests[('export', 'overloaded')], 1)
+
+    def test_max_clients(self):
+        controller = AdmissionController({'search': (60, 1)}, {}, max_clients=2)
+
+        controller.admit('1.1.1.1', 'search')
+        controller.admit('2.2.2.2', 'search')
+        controller.admit('3.3.3.3', 'search')
+
+        # The least recently seen client was forgotten so its bucket is full again.
+        self.assertEqual(len(controller._buckets), 2)
+        self.assertEqual(controller.admit('1.1.1.1', 'search')[0], 'admitted')
+        self.assertEqual(controller.admit('3.3.3.3', 'search')[0], 'rate_limited')
+
+    def test_to_text(self):
+        controller = AdmissionController({}, {})
+        controller.admit('1.1.1.1', 'search')
+
+        text = stats.to_text()
+        self.assertIn('nemi_admission_requests_total{endpoint_class="search",outcome="admitted"} 1\n', text)
+        self.assertIn('nemi_admission_in_flight{endpoint_class="search"} 1\n', text)
+
+
+@override_settings(ADMISSION_ENDPOINT_CLASSES={'methods-keyword': 'search', 'nemi_admission_metrics': 'metrics'},
+                   ADMISSION_RATE_LIMITS={'search': (60, 1), 'page': (60, 100)},
+                   ADMISSION_MAX_IN_FLIGHT={'search': 1},
+                   ADMISSION_CLIENT_IP_HEADER=None)
+class AdmissionControlMiddlewareTestCase(SimpleTestCase):
+
+    def setUp(self):
+        stats.reset()
+        self.factory = RequestFactory()
+
+    def test_rate_limited(self):
+        middleware = AdmissionControlMiddleware(lambda request: HttpResponse('OK'))
+
+        response = middleware(self.factory.get(reverse('methods-keyword')))
+        self.assertEqual(response.status_code, 200)
+
+        response = middleware(self.factory.get(reverse('methods-keyword')))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+        response = middleware(self.factory.get(reverse('methods-keyword'), REMOTE_ADDR='10.0.0.1'))
+        self.assertEqual(response.status_code, 200)
+
+        response = middleware(self.factory.get(reverse('home')))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats.requests[('page', 'admitted')], 1)
+
+    @override_settings(ADMISSION_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR', ADMISSION_TRUSTED_PROXY_HOPS=1)
+    def test_forwarded_client(self):
+        middleware = AdmissionControlMiddleware(lambda request: HttpResponse('OK'))
+
+        response = middleware(self.factory.get(reverse('methods-keyword'), HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2'))
+        self.assertEqual(response.status_code, 200)
+        # The addresses supplied by the client are ignored.
+        response = middleware(self.factory.get(reverse('methods-keyword'), HTTP_X_FORWARDED_FOR='10.0.0.3, 10.0.0.2'))
+        self.assertEqual(response.status_code, 429)
+        response = middleware(self.factory.get(reverse('methods-keyword'), HTTP_X_FORWARDED_FOR='10.0.0.1'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ADMISSION_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR', ADMISSION_TRUSTED_PROXY_HOPS=2)
+    def test_get_client_address(self):
+        request = self.factory.get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.1, 10.0.0.2')
+        self.assertEqual(get_client_address(request), '10.0.0.1')
+        request = self.factory.get('/', HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(get_client_address(request), '10.0.0.1')
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(get_client_address(request), '10.0.0.3')
+
+    def test_overloaded(self):
+        started = threading.Event()
+        finish = threading.Event()
+
+        def get_response(request):
+            started.set()
+            finish.wait(5)
+            return HttpResponse('OK')
+
+        middleware = AdmissionControlMiddleware(get_response)
+        thread = threading.Thread(target=middleware, args=(self.factory.get(reverse('methods-keyword')),))
+        thread.start()
+        try:
+            started.wait(5)
+            response = middleware(self.factory.get(reverse('methods-keyword'), REMOTE_ADDR='10.0.0.1'))
+            self.assertEqual(response.status_code, 429)
+        finally:
+            finish.set()
+            thread.join()
+
+        self.assertEqual(stats.in_flight['search'], 0)
+        response = middleware(self.factory.get(reverse('methods-keyword'), REMOTE_ADDR='10.0.0.2'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(INTERNAL_IPS=['127.0.0.1'])
+    def test_metrics(self):
+        response = self.client.get(reverse('nemi_admission_metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'nemi_admission_requests_total{endpoint_class="metrics",outcome="admitted"} 1', response.content)
+
+    @override_settings(INTERNAL_IPS=['127.0.0.1'])
+    def test_metrics_forbidden(self):
+        response = self.client.get(reverse('nemi_admission_metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+        with override_settings(ADMISSION_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR'):
+            response = self.client.get(reverse('nemi_admission_metrics'), HTTP_X_FORWARDED_FOR='127.0.0.1, 10.0.0.1')
+        self.assertEqual(response.status_code, 403)
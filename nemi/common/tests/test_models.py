@@ -4,13 +4,20 @@ Created on Aug 1, 2012
 @author: mbucknel
 '''
 
+import hashlib
+import io
+from io import StringIO
+
 from django.contrib.auth.models import User
-from django.db import models
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, models
+from django.test import TestCase, override_settings
 
 from factory.django import DjangoModelFactory
 
-from common.models import MethodAbstract, StatisticalItemType, MethodTypeRef, SourceCitationRef, InstrumentationRef
+from common.models import MethodAbstract, StatisticalItemType, MethodTypeRef, SourceCitationRef, InstrumentationRef, \
+    PdfBlob, RevisionJoin, RevisionJoinOnline, RevisionJoinStg
 
 
 class TestMethodGetInsertUser(TestCase):
@@ -78,3 +85,159 @@ class TestProtocoSourceCitationManagerTestCase(TestCase):
         self.assertEqual(result.count(), 2)
         self.assertIsNotNone(result.get(source_citation_id=4))
         self.assertIsNotNone(result.get(source_citation_id=5))
+
+
+class PdfBlobTestCase(TestCase):
+
+    def _checksum(self, pdf):
+        return hashlib.sha256(pdf).hexdigest()
+
+    def _revision(self, model, revision_id, pdf=None):
+        revision = model(revision_id=revision_id, revision_flag=True, revision_information='Rev %s' % revision_id)
+        if pdf is not None:
+            revision.set_pdf(io.BytesIO(pdf))
+        revision.save()
+        return revision
+
+    def test_set_pdf(self):
+        online = self._revision(RevisionJoinOnline, 1, b'%PDF-1.4 data')
+        self._revision(RevisionJoinOnline, 2, b'%PDF-1.4 data')
+
+        blob = PdfBlob.objects.get()
+        self.assertEqual(blob.checksum, self._checksum(b'%PDF-1.4 data'))
+        self.assertEqual(bytes(blob.pdf), b'%PDF-1.4 data')
+        self.assertEqual(blob.pdf_size, 13)
+        self.assertEqual(blob.reference_count, 2)
+
+        online = RevisionJoinOnline.objects.get(revision_id=1)
+        self.assertEqual(online.pdf_blob_id, blob.checksum)
+        # The database procedures only copy the revision's own copy.
+        self.assertEqual(bytes(online.method_pdf), b'%PDF-1.4 data')
+        self.assertEqual(online.mimetype, 'application/pdf')
+        self.assertTrue(online.has_pdf())
+
+        # Uploading a different pdf releases the old one.
+        online.set_pdf(io.BytesIO(b'%PDF-1.4 new data'))
+        online.save()
+        self.assertEqual(PdfBlob.objects.get(checksum=blob.checksum).reference_count, 1)
+        self.assertEqual(PdfBlob.objects.get(checksum=self._checksum(b'%PDF-1.4 new data')).reference_count, 1)
+        self.assertEqual(bytes(RevisionJoinOnline.objects.get(revision_id=1).method_pdf), b'%PDF-1.4 new data')
+
+    @override_settings(PDF_BLOB_ONLY=True)
+    def test_set_pdf_blob_only(self):
+        self._revision(RevisionJoinOnline, 1, b'%PDF-1.4 data')
+
+        online = RevisionJoinOnline.objects.get(revision_id=1)
+        self.assertEqual(online.pdf_blob_id, self._checksum(b'%PDF-1.4 data'))
+        self.assertIsNone(online.method_pdf)
+        self.assertTrue(online.has_pdf())
+
+    def test_unsaved_pdf(self):
+        online = self._revision(RevisionJoinOnline, 1, b'%PDF-1.4 data')
+
+        # The references are only changed when the revision is saved.
+        online.set_pdf(io.BytesIO(b'%PDF-1.4 new data'))
+        self.assertEqual(list(PdfBlob.objects.values_list('checksum', 'reference_count')),
+                         [(self._checksum(b'%PDF-1.4 data'), 1)])
+
+        online = RevisionJoinOnline.objects.get(revision_id=1)
+        online.set_pdf(io.BytesIO(b'%PDF-1.4 new data'))
+        online.revision_information = None
+        with self.assertRaises(IntegrityError):
+            online.save()
+        self.assertEqual(list(PdfBlob.objects.values_list('checksum', 'reference_count')),
+                         [(self._checksum(b'%PDF-1.4 data'), 1)])
+
+    def test_store_in_chunks(self):
+        pdf = b'%PDF-1.4\x00\xff\x00 binary data'
+        checksum = PdfBlob.objects.store(io.BytesIO(pdf), chunk_size=4)
+
+        blob = PdfBlob.objects.get(checksum=checksum)
+        self.assertEqual(bytes(blob.pdf), pdf)
+        self.assertEqual(blob.pdf_size, len(pdf))
+        self.assertEqual(blob.reference_count, 1)
+
+    def test_same_pdf(self):
+        online = self._revision(RevisionJoinOnline, 1, b'%PDF-1.4 data')
+        online.set_pdf(io.BytesIO(b'%PDF-1.4 data'))
+        online.save()
+        self.assertEqual(PdfBlob.objects.get().reference_count, 1)
+
+    def test_shared_checksum(self):
+        online = self._revision(RevisionJoinOnline, 1, b'%PDF-1.4 data')
+        staging = self._revision(RevisionJoinStg, 1)
+        staging.pdf_blob_id = online.pdf_blob_id
+        staging.save()
+        published = self._revision(RevisionJoin, 1)
+        published.pdf_blob_id = staging.pdf_blob_id
+        published.save()
+
+        checksum = self._checksum(b'%PDF-1.4 data')
+        self.assertEqual(PdfBlob.objects.get().reference_count, 3)
+        self.assertEqual(RevisionJoin.objects.get(revision_id=1).pdf_blob_id, checksum)
+
+        online.delete()
+        staging.delete()
+        self.assertEqual(PdfBlob.objects.get().reference_count, 1)
+        published.delete()
+        self.assertFalse(PdfBlob.objects.exists())
+
+    def test_recount(self):
+        self._revision(RevisionJoinOnline, 1, b'%PDF-1')
+        self._revision(RevisionJoinOnline, 2, b'%PDF-2')
+        # Rows copied by the database procedures do not update the reference counts.
+        RevisionJoinStg.objects.create(revision_id=1, revision_flag=True, revision_information='Rev 1',
+                                       pdf_blob_id=self._checksum(b'%PDF-1'))
+        RevisionJoinOnline.objects.filter(revision_id=2).delete()
+
+        self.assertEqual(PdfBlob.objects.recount(), 1)
+        self.assertEqual(list(PdfBlob.objects.values_list('checksum', 'reference_count')),
+                         [(self._checksum(b'%PDF-1'), 2)])
+
+    def _create_unshared_revisions(self):
+        RevisionJoinOnline.objects.create(revision_id=1, revision_flag=True, revision_information='Rev 1',
+                                          method_pdf=b'%PDF-1.4 data')
+        RevisionJoinStg.objects.create(revision_id=1, revision_flag=True, revision_information='Rev 1',
+                                       method_pdf=b'%PDF-1.4 data')
+        RevisionJoin.objects.create(revision_id=1, revision_flag=True, revision_information='Rev 1',
+                                    method_pdf=b'%PDF-1.4 data')
+        RevisionJoin.objects.create(revision_id=2, revision_flag=True, revision_information='Rev 2')
+
+    def test_share_revision_pdfs(self):
+        self._create_unshared_revisions()
+
+        call_command('share_revision_pdfs', stdout=StringIO())
+
+        checksum = self._checksum(b'%PDF-1.4 data')
+        self.assertEqual(list(PdfBlob.objects.values_list('checksum', 'reference_count')), [(checksum, 3)])
+        # The copies used by the database procedures are kept.
+        for model in (RevisionJoinOnline, RevisionJoinStg, RevisionJoin):
+            revision = model.objects.get(revision_id=1)
+            self.assertEqual(revision.pdf_blob_id, checksum)
+            self.assertEqual(bytes(revision.method_pdf), b'%PDF-1.4 data')
+        self.assertIsNone(RevisionJoin.objects.get(revision_id=2).pdf_blob_id)
+
+        with self.assertRaises(CommandError):
+            call_command('share_revision_pdfs', '--clear-published', stdout=StringIO())
+        self.assertEqual(bytes(RevisionJoin.objects.get(revision_id=1).method_pdf), b'%PDF-1.4 data')
+
+    @override_settings(PDF_BLOB_ONLY=True)
+    def test_share_revision_pdfs_blob_only(self):
+        self._create_unshared_revisions()
+        call_command('share_revision_pdfs', stdout=StringIO())
+
+        checksum = self._checksum(b'%PDF-1.4 data')
+        for model in (RevisionJoinOnline, RevisionJoinStg):
+            revision = model.objects.get(revision_id=1)
+            self.assertEqual(revision.pdf_blob_id, checksum)
+            self.assertIsNone(revision.method_pdf)
+        self.assertEqual(bytes(RevisionJoin.objects.get(revision_id=1).method_pdf), b'%PDF-1.4 data')
+
+        # A copy replaced without changing the checksum is shared again before it is cleared.
+        RevisionJoin.objects.filter(revision_id=1).update(method_pdf=b'%PDF-1.4 new data')
+        call_command('share_revision_pdfs', '--clear-published', stdout=StringIO())
+        revision = RevisionJoin.objects.get(revision_id=1)
+        self.assertIsNone(revision.method_pdf)
+        self.assertEqual(revision.pdf_blob_id, self._checksum(b'%PDF-1.4 new data'))
+        self.assertEqual(sorted(PdfBlob.objects.values_list('checksum', 'reference_count')),
+                         sorted([(checksum, 2), (self._checksum(b'%PDF-1.4 new data'), 1)]))
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..utils.pdf_cache import PdfFileCache, SCAN_INTERVAL, TMP_FILE_AGE
+
+
+class PdfFileCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = PdfFileCache(self.directory, max_size=25)
+
+    def test_store_and_open(self):
+        checksum = self.cache.store([b'%PDF-', b'1.4 data'])
+        self.assertEqual(checksum, hashlib.sha256(b'%PDF-1.4 data').hexdigest())
+
+        with self.cache.open(checksum) as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 data')
+        self.assertIsNone(self.cache.open(hashlib.sha256(b'other').hexdigest()))
+
+        # Identical contents are stored once.
+        self.assertEqual(self.cache.store([b'%PDF-1.4 data']), checksum)
+        files = [name for (directory, dirnames, filenames) in os.walk(self.directory) for name in filenames]
+        self.assertEqual(files, ['%s.pdf' % checksum])
+
+    def test_failed_store(self):
+        def chunks():
+            yield b'%PDF-'
+            raise IOError('Read failed')
+
+        with self.assertRaises(IOError):
+            self.cache.store(chunks())
+        files = [name for (directory, dirnames, filenames) in os.walk(self.directory) for name in filenames]
+        self.assertEqual(files, [])
+
+    def test_evict_least_recently_used(self):
+        first = self.cache.store([b'1' * 10])
+        second = self.cache.store([b'2' * 10])
+        os.utime(self.cache._file_path(first), (1000, 1000))
+        os.utime(self.cache._file_path(second), (2000, 2000))
+
+        self.cache.open(first).close()
+        third = self.cache.store([b'3' * 10])
+
+        self.assertIsNone(self.cache.open(second))
+        self.assertIsNotNone(self.cache.open(first))
+        self.assertIsNotNone(self.cache.open(third))
+
+    def test_evict_when_size_exceeded(self):
+        self.cache.store([b'1' * 10])
+        with mock.patch.object(self.cache, 'evict', wraps=self.cache.evict) as mock_evict:
+            # The cache is only scanned once it may be larger than max_size.
+            self.cache.store([b'2' * 10])
+            self.cache.store([b'2' * 10])
+            mock_evict.assert_not_called()
+
+            self.cache.store([b'3' * 10])
+            mock_evict.assert_called_once_with(keep=hashlib.sha256(b'3' * 10).hexdigest())
+
+    def test_scan_interval(self):
+        self.cache.store([b'1' * 10])
+        with mock.patch.object(self.cache, 'evict') as mock_evict:
+            with mock.patch('common.utils.pdf_cache.time.monotonic', return_value=time.monotonic() + SCAN_INTERVAL + 1):
+                self.cache.store([b'2' * 10])
+        mock_evict.assert_called_once_with(keep=hashlib.sha256(b'2' * 10).hexdigest())
+
+    def test_evict_removes_old_tmp_files(self):
+        os.makedirs(self.cache.files_directory)
+        old_tmp = os.path.join(self.cache.files_directory, 'old.tmp')
+        new_tmp = os.path.join(self.cache.files_directory, 'new.tmp')
+        for path in (old_tmp, new_tmp):
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-')
+        old_time = time.time() - TMP_FILE_AGE - 1
+        os.utime(old_tmp, (old_time, old_time))
+
+        self.cache.evict()
+        self.assertFalse(os.path.exists(old_tmp))
+        # A store in progress is left alone.
+        self.assertTrue(os.path.exists(new_tmp))
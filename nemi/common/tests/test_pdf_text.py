@@ -0,0 +1,185 @@
+
+import datetime
+import hashlib
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ..models import PdfBlob, RevisionJoin
+from ..utils.cache import DATA_VERSION_KEY, bump_data_version, get_data_version
+from ..utils.pdf_text import extract_text, update_pdf_texts, PdfTextStore
+
+
+def make_pdf(text):
+    ''' Returns the contents of a one page PDF file containing text.'''
+    stream = b'BT /F1 12 Tf 72 712 Td (' + text.encode('latin-1') + b') Tj ET'
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+               b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+               b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+
+    result = b'%PDF-1.4\n'
+    offsets = []
+    for (i, obj) in enumerate(objects):
+        offsets.append(len(result))
+        result += b'%d 0 obj\n' % (i + 1) + obj + b'\nendobj\n'
+    xref_offset = len(result)
+    result += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    result += b''.join([b'%010d 00000 n \n' % offset for offset in offsets])
+    result += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+
+    return result
+
+
+class ExtractTextTestCase(SimpleTestCase):
+
+    def test_extract_text(self):
+        self.assertEqual(extract_text(make_pdf('Nitrate in water')), 'Nitrate in water')
+
+    def test_invalid_pdf(self):
+        self.assertEqual(extract_text(b'Not a PDF'), '')
+
+
+class PdfTextStoreTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = PdfTextStore(self.directory)
+
+    def test_empty_store(self):
+        self.assertEqual(self.store.load_manifest(), {})
+        self.assertEqual(self.store.read(1), '')
+        self.assertEqual(self.store.texts_by_method(), {})
+
+    def test_texts_by_method(self):
+        self.store.write(1, 'Revision 1')
+        self.store.write(2, 'Revision 2')
+        self.store.write(3, 'Revision 3')
+        self.store.save_manifest({1: {'method_id': 10, 'checksum': 'a', 'changed': ''},
+                                  2: {'method_id': 20, 'checksum': 'b', 'changed': ''},
+                                  3: {'method_id': 10, 'checksum': 'c', 'changed': ''}})
+
+        self.assertEqual(sorted(self.store.load_manifest().keys()), [1, 2, 3])
+        self.assertEqual(self.store.texts_by_method(), {10: 'Revision 1\nRevision 3', 20: 'Revision 2'})
+
+
+class UpdatePdfTextsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = PdfTextStore(self.directory)
+
+        self.rev1 = RevisionJoin.objects.create(revision_id=1, revision_flag=True, revision_information='Rev 1',
+                                                method_pdf=make_pdf('Nitrate'))
+        self.rev2 = RevisionJoin.objects.create(revision_id=2, revision_flag=True, revision_information='Rev 2',
+                                                method_pdf=make_pdf('Chloride'))
+        RevisionJoin.objects.create(revision_id=3, revision_flag=True, revision_information='Rev 3')
+
+    def test_first_run(self):
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (2, 0))
+        self.assertEqual(self.store.read(1), 'Nitrate')
+        self.assertEqual(self.store.read(2), 'Chloride')
+        self.assertEqual(sorted(self.store.load_manifest().keys()), [1, 2])
+
+    @mock.patch('common.utils.pdf_text.extract_text', side_effect=extract_text)
+    def test_only_changed_revisions_extracted(self, mock_extract):
+        update_pdf_texts(self.store, processes=1)
+        self.assertEqual(mock_extract.call_count, 2)
+
+        mock_extract.reset_mock()
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (0, 0))
+        mock_extract.assert_not_called()
+
+        # A changed date with the same PDF is not extracted again.
+        RevisionJoin.objects.filter(revision_id=1).update(pdf_insert_date=datetime.date(2020, 1, 1))
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (0, 0))
+        mock_extract.assert_not_called()
+
+        RevisionJoin.objects.filter(revision_id=2).update(method_pdf=make_pdf('Sulfate'),
+                                                          pdf_insert_date=datetime.date(2020, 1, 1))
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (1, 0))
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual(self.store.read(2), 'Sulfate')
+
+    def test_force(self):
+        update_pdf_texts(self.store, processes=1)
+
+        # A PDF changed without changing the dates is only found when forced.
+        RevisionJoin.objects.filter(revision_id=2).update(method_pdf=make_pdf('Sulfate'))
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (0, 0))
+        self.assertEqual(update_pdf_texts(self.store, processes=1, force=True), (1, 0))
+        self.assertEqual(self.store.read(2), 'Sulfate')
+
+    @mock.patch('common.utils.pdf_text.extract_text', side_effect=extract_text)
+    def test_shared_pdf_compared_by_checksum(self, mock_extract):
+        checksum = PdfBlob.objects.store(io.BytesIO(make_pdf('Lead')))
+        RevisionJoin.objects.create(revision_id=4, revision_flag=True, revision_information='Rev 4', pdf_blob_id=checksum)
+        update_pdf_texts(self.store, processes=1)
+        self.assertEqual(self.store.read(4), 'Lead')
+        self.assertEqual(self.store.load_manifest()[4]['checksum'], checksum)
+
+        # Changed dates with the same shared PDF do not read the PDF.
+        mock_extract.reset_mock()
+        RevisionJoin.objects.filter(revision_id=4).update(pdf_insert_date=datetime.date(2020, 1, 1))
+        with self.assertNumQueries(2):
+            self.assertEqual(update_pdf_texts(self.store, processes=1), (0, 0))
+
+        # A changed shared PDF is found without changing the dates.
+        checksum = PdfBlob.objects.store(io.BytesIO(make_pdf('Copper')))
+        RevisionJoin.objects.filter(revision_id=4).update(pdf_blob_id=checksum)
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (1, 0))
+        self.assertEqual(self.store.read(4), 'Copper')
+        self.assertEqual(mock_extract.call_count, 1)
+
+    def test_own_copy_used_before_shared_pdf(self):
+        checksum = PdfBlob.objects.store(io.BytesIO(make_pdf('Lead')))
+        RevisionJoin.objects.filter(revision_id=1).update(pdf_blob_id=checksum)
+
+        update_pdf_texts(self.store, processes=1)
+        self.assertEqual(self.store.read(1), 'Nitrate')
+
+    def test_removed_revisions(self):
+        update_pdf_texts(self.store, processes=1)
+
+        RevisionJoin.objects.filter(revision_id=1).update(method_pdf=None)
+        self.assertEqual(update_pdf_texts(self.store, processes=1), (0, 1))
+        self.assertEqual(self.store.read(1), '')
+        self.assertEqual(list(self.store.load_manifest().keys()), [2])
+
+    def test_command(self):
+        version = get_data_version()
+        with self.settings(PDF_TEXT_DIR=self.directory):
+            call_command('extract_pdf_text', processes=1, stdout=mock.Mock())
+            self.assertEqual(self.store.read(1), 'Nitrate')
+            self.assertNotEqual(get_data_version(), version)
+
+            version = get_data_version()
+            call_command('extract_pdf_text', processes=1, stdout=mock.Mock())
+            self.assertEqual(get_data_version(), version)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'versions': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_version_cache'},
+    })
+    def test_command_changes_shared_version(self):
+        call_command('createcachetable', verbosity=0)
+        # The cache of a server process.
+        server_cache = DatabaseCache('test_version_cache', {})
+        version = bump_data_version()
+        self.assertEqual(server_cache.get(DATA_VERSION_KEY), version)
+
+        with self.settings(PDF_TEXT_DIR=self.directory):
+            call_command('extract_pdf_text', processes=1, stdout=mock.Mock())
+        self.assertNotEqual(server_cache.get(DATA_VERSION_KEY), version)
+
+    def test_sha256_checksum(self):
+        update_pdf_texts(self.store, processes=1)
+        self.assertEqual(self.store.load_manifest()[1]['checksum'], hashlib.sha256(make_pdf('Nitrate')).hexdigest())
@@ -0,0 +1,141 @@
+import io
+from io import StringIO
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from nemi_project.admin import method_admin
+
+from ..admin import PDFFileField, RevisionOnlineAdmin, RevisionOnlineForm
+from ..models import MethodOnline, PdfBlob, RevisionJoinOnline
+from ..utils.pdf_validation import check_pdf_structure, schedule_validation, validate_pdf_blob, \
+    _validate_in_background
+from .test_pdf_text import make_pdf
+from .test_utils import FakeLob
+
+
+class CheckPdfStructureTestCase(SimpleTestCase):
+
+    def test_check_pdf_structure(self):
+        pdf_file = io.BytesIO(make_pdf('Nitrate') + b'\n' * 2000)
+        self.assertFalse(check_pdf_structure(pdf_file))
+        self.assertEqual(pdf_file.tell(), 0)
+
+        self.assertTrue(check_pdf_structure(io.BytesIO(make_pdf('Nitrate'))))
+        self.assertFalse(check_pdf_structure(io.BytesIO(b'Not a PDF')))
+        self.assertFalse(check_pdf_structure(io.BytesIO(make_pdf('Nitrate')[:-20])))
+        self.assertFalse(check_pdf_structure(io.BytesIO(b'')))
+
+    def test_pdf_file_field(self):
+        field = PDFFileField(required=False)
+
+        pdf_file = field.clean(SimpleUploadedFile('method.pdf', make_pdf('Nitrate')))
+        self.assertEqual(pdf_file.read(), make_pdf('Nitrate'))
+
+        with self.assertRaises(ValidationError):
+            field.clean(SimpleUploadedFile('method.pdf', b'Not a PDF'))
+
+
+class ValidatePdfBlobTestCase(TestCase):
+
+    def _revision(self, revision_id, pdf):
+        revision = RevisionJoinOnline(revision_id=revision_id, revision_flag=True,
+                                      revision_information='Rev %s' % revision_id)
+        revision.set_pdf(io.BytesIO(pdf))
+        revision.save()
+        return revision
+
+    def test_validate_pdf_blob(self):
+        valid = self._revision(1, make_pdf('Nitrate'))
+        # Passes the header and trailer check but can not be read.
+        invalid = self._revision(2, b'%PDF-1.4\nnot really a pdf\n%%EOF\n')
+        self.assertEqual(PdfBlob.objects.get(checksum=valid.pdf_blob_id).validation_status, PdfBlob.PENDING)
+
+        self.assertEqual(validate_pdf_blob(valid.pdf_blob_id), PdfBlob.VALID)
+        self.assertEqual(validate_pdf_blob(invalid.pdf_blob_id), PdfBlob.INVALID)
+        self.assertIsNone(validate_pdf_blob(valid.pdf_blob_id))
+        self.assertEqual(validate_pdf_blob(valid.pdf_blob_id, force=True), PdfBlob.VALID)
+        self.assertIsNone(validate_pdf_blob('missing'))
+
+        blob = PdfBlob.objects.get(checksum=valid.pdf_blob_id)
+        self.assertEqual(blob.page_count, 1)
+        self.assertIsNone(blob.validation_message)
+        blob = PdfBlob.objects.get(checksum=invalid.pdf_blob_id)
+        self.assertIsNone(blob.page_count)
+        self.assertTrue(blob.validation_message)
+
+    def test_missing_trailer(self):
+        revision = self._revision(1, make_pdf('Nitrate') + b'\n' * 2000)
+        with mock.patch('common.utils.pdf_validation.read_page_count') as mock_read_page_count:
+            self.assertEqual(validate_pdf_blob(revision.pdf_blob_id), PdfBlob.INVALID)
+        mock_read_page_count.assert_not_called()
+        self.assertEqual(PdfBlob.objects.get(checksum=revision.pdf_blob_id).validation_message,
+                         'The PDF header or trailer is missing.')
+
+    def test_lob_read_in_ranges(self):
+        pdf = make_pdf('x' * 100000)
+        revision = self._revision(1, pdf)
+        lob = FakeLob(pdf)
+        with mock.patch('common.utils.pdf_validation.connection') as mock_connection:
+            cursor = mock_connection.cursor.return_value.__enter__.return_value
+            cursor.fetchone.return_value = (lob,)
+            self.assertEqual(validate_pdf_blob(revision.pdf_blob_id), PdfBlob.VALID)
+
+        # The page contents are not read.
+        self.assertLess(sum([amount for (offset, amount) in lob.reads]), len(pdf) / 2)
+
+    def test_validate_revision_pdfs(self):
+        valid = self._revision(1, make_pdf('Nitrate'))
+        self._revision(2, b'%PDF-1.4\nnot really a pdf\n%%EOF\n')
+
+        stdout = StringIO()
+        call_command('validate_revision_pdfs', stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Validated 2 PDFs, 1 invalid.')
+
+        stdout = StringIO()
+        call_command('validate_revision_pdfs', stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Validated 0 PDFs, 0 invalid.')
+
+        PdfBlob.objects.filter(checksum=valid.pdf_blob_id).update(page_count=None)
+        call_command('validate_revision_pdfs', '--all', stdout=StringIO())
+        self.assertEqual(PdfBlob.objects.get(checksum=valid.pdf_blob_id).page_count, 1)
+
+    @override_settings(PDF_VALIDATION_WORKERS=1)
+    @mock.patch('common.utils.pdf_validation._get_executor')
+    @mock.patch('common.utils.pdf_validation.transaction.on_commit', side_effect=lambda func: func())
+    def test_schedule_validation(self, mock_on_commit, mock_get_executor):
+        schedule_validation('abc')
+        mock_get_executor.return_value.submit.assert_called_once_with(_validate_in_background, 'abc')
+
+    @override_settings(PDF_VALIDATION_WORKERS=0)
+    @mock.patch('common.utils.pdf_validation.transaction.on_commit')
+    def test_no_workers(self, mock_on_commit):
+        schedule_validation('abc')
+        mock_on_commit.assert_not_called()
+
+    @mock.patch('common.admin.schedule_validation')
+    def test_revision_form(self, mock_schedule_validation):
+        form = RevisionOnlineForm(data={'revision_information': 'Rev 1'},
+                                  files={'pdf_file': SimpleUploadedFile('method.pdf', make_pdf('Nitrate'))})
+        self.assertTrue(form.is_valid(), form.errors)
+        revision = form.save()
+
+        blob = PdfBlob.objects.get()
+        self.assertEqual(revision.pdf_blob_id, blob.checksum)
+        mock_schedule_validation.assert_called_once_with(blob.checksum)
+
+        inline = RevisionOnlineAdmin(MethodOnline, method_admin)
+        revision = RevisionJoinOnline.objects.get(revision_id=revision.revision_id)
+        self.assertEqual(inline.pdf_status(revision), 'Checking the PDF, reload the page to see the result')
+        validate_pdf_blob(blob.checksum)
+        revision = RevisionJoinOnline.objects.get(revision_id=revision.revision_id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(inline.pdf_status(revision), 'Valid PDF, 1 page')
+        # The PDF itself is not read.
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"pdf"', queries[0]['sql'])
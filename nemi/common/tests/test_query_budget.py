@@ -0,0 +1,99 @@
+
+import time
+from unittest import mock
+
+from django.db import connection, OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ..utils.cache import SingleFlightError
+from ..utils.query_budget import get_remaining_time, query_time_budget, QueryBudget
+
+
+SLOW_QUERY = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < %s) SELECT COUNT(*) FROM c'
+
+
+def _count(n):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(SLOW_QUERY % n)
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+class QueryBudgetTestCase(SimpleTestCase):
+
+    def test_budget(self):
+        budget = QueryBudget(10)
+        self.assertFalse(budget.expired())
+        self.assertTrue(9 < budget.remaining() <= 10)
+
+        budget = QueryBudget(0.01)
+        time.sleep(0.02)
+        self.assertTrue(budget.expired())
+        self.assertEqual(budget.remaining(), 0)
+
+    def test_get_remaining_time(self):
+        request = mock.Mock(spec=[])
+        self.assertIsNone(get_remaining_time(request))
+
+        request.query_budget = QueryBudget(10)
+        self.assertTrue(9 < get_remaining_time(request) <= 10)
+
+
+class QueryTimeBudgetTestCase(TestCase):
+
+    def test_within_budget(self):
+        with query_time_budget(10) as budget:
+            self.assertEqual(_count(1000), 1000)
+        self.assertFalse(budget.expired())
+
+    def test_statement_cancelled(self):
+        start = time.monotonic()
+        with self.assertRaises(OperationalError):
+            with query_time_budget(0.05) as budget:
+                _count(1000000000)
+
+        self.assertTrue(budget.expired())
+        self.assertLess(time.monotonic() - start, 5)
+
+        # The budget no longer applies after the block.
+        time.sleep(0.06)
+        self.assertEqual(_count(1000), 1000)
+
+
+class QueryTimeBudgetMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('methods.views.KeywordSearchResults')
+        mock_results = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        mock_results.return_value.count.side_effect = lambda: _count(1000000000)
+
+    @override_settings(QUERY_TIME_BUDGETS={'methods-keyword': 0.05})
+    def test_query_too_broad(self):
+        response = self.client.get(reverse('methods-keyword'), {'keyword_search_field': 'water'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTemplateUsed(response, 'query_too_broad.html')
+
+    @override_settings(QUERY_TIME_BUDGETS={'methods-keyword': 0.05})
+    def test_other_errors(self):
+        with mock.patch('methods.views.KeywordSearchResults', side_effect=OperationalError('Other error')):
+            with self.assertRaises(OperationalError):
+                self.client.get(reverse('methods-keyword'), {'keyword_search_field': 'water'})
+
+    @override_settings(QUERY_TIME_BUDGETS={'methods-keyword': 5})
+    def test_shared_failure(self):
+        with mock.patch('methods.views.KeywordSearchResults', side_effect=SingleFlightError('Failed')):
+            response = self.client.get(reverse('methods-keyword'), {'keyword_search_field': 'water'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTemplateUsed(response, 'query_too_broad.html')
+
+    @override_settings(QUERY_TIME_BUDGETS={'methods-results': 0.05})
+    def test_within_budget(self):
+        response = self.client.get(reverse('methods-results'))
+        self.assertEqual(response.status_code, 200)
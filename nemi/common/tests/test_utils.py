@@ -3,12 +3,24 @@ Created on Mar 15, 2012
 
 @author: mbucknel
 '''
+import io
+from io import BytesIO
+import os
+import threading
+import time
+from unittest import mock
 
 from django import forms
-from django.test import SimpleTestCase, TestCase
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
 
 from nemi_project.test_settings_mgr import TestSettingsManager
 
+from ..utils.blobs import blob_length, BlobReader, BlobStream
+from ..utils.cache import DATA_VERSION_KEY, bump_data_version, bump_method_versions, get_data_version, get_method_version, single_flight, \
+    SingleFlightError
 from ..utils.forms import get_criteria, get_criteria_from_field_data, get_multi_choice
 from ..utils.view_utils import tsv_response, xls_response
 from .models import TestModel
@@ -172,3 +184,211 @@ class XlsResponseTestCase(SimpleTestCase):
 
         self.assertEqual(response['Content-Type'], 'application/vnd.ms-excel')
         self.assertEqual(response['Content-Disposition'], 'attachment; filename=%s.xls' % filename)
+
+
+class DataVersionTestCase(SimpleTestCase):
+
+    def test_get_data_version(self):
+        version = get_data_version()
+        self.assertEqual(get_data_version(), version)
+
+        new_version = bump_data_version()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(get_data_version(), new_version)
+
+    def test_method_versions(self):
+        version1 = get_method_version(1)
+        version2 = get_method_version(2)
+        self.assertEqual(get_method_version(1), version1)
+
+        bump_method_versions([1])
+        self.assertNotEqual(get_method_version(1), version1)
+        self.assertEqual(get_method_version(2), version2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'versions': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_version_cache'},
+})
+class SharedVersionTestCase(TestCase):
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        # The cache of another server process.
+        self.other_cache = DatabaseCache('test_version_cache', {})
+
+    def test_bump_in_other_process(self):
+        data_version = get_data_version()
+        method_version = get_method_version(1)
+
+        # The other process's data version is seen once this process reads the version again.
+        self.other_cache.set(DATA_VERSION_KEY, 'other', 60)
+        self.assertEqual(get_data_version(), data_version)
+        with mock.patch('common.utils.cache.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(get_data_version(), 'other')
+
+        with mock.patch('common.utils.cache._version_cache', return_value=self.other_cache):
+            bump_method_versions([1])
+        self.assertNotEqual(get_method_version(1), method_version)
+
+    def test_data_version_not_read_on_every_use(self):
+        get_data_version()
+        with self.assertNumQueries(0):
+            for i in range(10):
+                get_data_version()
+
+
+class SingleFlightTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.key = 'single_flight_test:%s' % bump_data_version()
+        self.calls = []
+
+    def _compute(self, value, delay=0):
+        def compute():
+            self.calls.append(value)
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_cached(self):
+        self.assertEqual(single_flight(self.key, self._compute('a'), 10), 'a')
+        self.assertEqual(single_flight(self.key, self._compute('b'), 10), 'a')
+        self.assertEqual(self.calls, ['a'])
+
+    def test_concurrent_calls_share_result(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight(self.key, self._compute('a', 0.2), 10)))
+                   for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['a'] * 5)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_wait_timeout(self):
+        # Another caller holds the lock but never finishes.
+        caches['single_flight'].add('%s:lock' % self.key, True, 10)
+
+        self.assertEqual(single_flight(self.key, self._compute('a'), 10, wait=0.1), 'a')
+        self.assertEqual(self.calls, ['a'])
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.1)
+    def test_wait_limited_by_setting(self):
+        caches['single_flight'].add('%s:lock' % self.key, True, 10)
+
+        self.assertEqual(single_flight(self.key, self._compute('a'), 10, wait=5), 'a')
+        self.assertEqual(self.calls, ['a'])
+
+    def test_failed_computation(self):
+        def fail():
+            raise ValueError('Failed')
+
+        with self.assertRaises(ValueError):
+            single_flight(self.key, fail, 10, failure_timeout=10)
+
+        # The failure is not repeated by the next callers.
+        with self.assertRaises(SingleFlightError):
+            single_flight(self.key, self._compute('a'), 10, wait=5)
+        self.assertEqual(self.calls, [])
+
+    def test_failure_not_recorded(self):
+        def fail():
+            raise ValueError('Failed')
+
+        with self.assertRaises(ValueError):
+            single_flight(self.key, fail, 10, failure_timeout=0)
+
+        # The lock is released so that the next caller computes the value.
+        self.assertEqual(single_flight(self.key, self._compute('a'), 10, wait=5), 'a')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'versions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'single_flight': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_single_flight_cache'},
+})
+class SharedSingleFlightTestCase(TestCase):
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        # The cache of another server process.
+        self.other_cache = DatabaseCache('test_single_flight_cache', {})
+
+    def test_value_computed_in_other_process(self):
+        self.other_cache.set('shared', 'other', 10)
+        self.assertEqual(single_flight('shared', lambda: 'this', 10), 'other')
+
+    def test_value_shared_with_other_process(self):
+        self.assertEqual(single_flight('computed', lambda: 'this', 10), 'this')
+        self.assertEqual(self.other_cache.get('computed'), 'this')
+
+
+class FakeLob(object):
+    ''' Implements the parts of the cx_Oracle LOB interface used to stream blobs.'''
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = []
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, offset, amount):
+        self.reads.append((offset, amount))
+        return self.data[offset - 1:offset - 1 + amount]
+
+
+class BlobStreamTestCase(SimpleTestCase):
+
+    def test_blob_length(self):
+        self.assertEqual(blob_length(b'abc'), 3)
+        self.assertEqual(blob_length(FakeLob(b'abcd')), 4)
+        self.assertEqual(blob_length(BytesIO(b'abcde')), 5)
+        self.assertIsNone(blob_length(iter([b'a'])))
+
+    def test_bytes(self):
+        self.assertEqual(list(BlobStream(b'0123456789', chunk_size=4)), [b'0123', b'4567', b'89'])
+        self.assertEqual(list(BlobStream(b'0123456789', start=3, length=5, chunk_size=4)), [b'3456', b'7'])
+        self.assertEqual(list(BlobStream(b'', chunk_size=4)), [])
+
+    def test_lob(self):
+        lob = FakeLob(b'0123456789')
+
+        self.assertEqual(list(BlobStream(lob, chunk_size=4)), [b'0123', b'4567', b'89'])
+        self.assertEqual(lob.reads, [(1, 4), (5, 4), (9, 4), (11, 4)])
+        self.assertEqual(b''.join(BlobStream(lob, start=8, length=10)), b'89')
+
+    def test_file(self):
+        self.assertEqual(list(BlobStream(BytesIO(b'0123456789'), start=6, chunk_size=3)), [b'678', b'9'])
+
+    def test_close(self):
+        on_close = mock.Mock()
+        stream = BlobStream(b'abc', on_close=on_close)
+        stream.close()
+        stream.close()
+        on_close.assert_called_once_with()
+
+
+class BlobReaderTestCase(SimpleTestCase):
+
+    def test_lob(self):
+        lob = FakeLob(b'0123456789')
+        reader = BlobReader(lob)
+
+        self.assertEqual(reader.read(3), b'012')
+        self.assertEqual(reader.seek(-2, os.SEEK_END), 8)
+        self.assertEqual(reader.read(), b'89')
+        self.assertEqual(reader.read(), b'')
+        reader.seek(4)
+        self.assertEqual(reader.read(2), b'45')
+        # Only the requested ranges are read.
+        self.assertEqual(lob.reads, [(1, 3), (9, 2), (5, 2)])
+
+    def test_buffered(self):
+        reader = io.BufferedReader(BlobReader(b'0123456789'), 4)
+        self.assertEqual(reader.read(1), b'0')
+        reader.seek(-3, os.SEEK_END)
+        self.assertEqual(reader.read(), b'789')
@@ -1,44 +1,157 @@
-from io import StringIO
+import datetime
+from io import BytesIO, StringIO
 from unittest import mock
 
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.test import SimpleTestCase
 from django.test.client import RequestFactory
+from django.views.generic import View
 
-from ..views import ChoiceJsonView, PdfView, SimpleWebProxyView
+from ..utils.cache import bump_data_version
+from ..utils.query_budget import QueryBudget
+from ..views import ChoiceJsonView, PdfView, SimpleWebProxyView, SingleFlightMixin
 
 
 class CommonJsonViewTestCase(SimpleTestCase):
 
+    def setUp(self):
+        self.factory = RequestFactory()
+
     def test_response(self):
         class TestView(ChoiceJsonView):
             def get_choices(self, request, *args, **kwargs):
-                return [('value1', 'Value 1'), ('value2', 'Value 2'), ('value3', 'Value 3')]
+                return [('value1', 'Value 1'), ('value2', 'Value 2'), ('value3', 'Value "3"')]
 
-        test_view = TestView()
-        request = ''
-        resp = test_view.get(request)
+        resp = TestView.as_view()(self.factory.get('/choices/'))
 
-        self.assertContains(resp, '{"choices" : [{"value" : "value1", "display_value" : "Value 1"},{"value" : "value2", "display_value" : "Value 2"},{"value" : "value3", "display_value" : "Value 3"}]}')
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertJSONEqual(resp.content.decode('utf-8'),
+                             {'choices': [{'value': 'value1', 'display_value': 'Value 1'},
+                                          {'value': 'value2', 'display_value': 'Value 2'},
+                                          {'value': 'value3', 'display_value': 'Value "3"'}]})
 
     def test_no_data_response(self):
         class TestView(ChoiceJsonView):
             def get_choices(self, request, *args, **kwargs):
                 return []
 
-        test_view = TestView()
-        request = ''
-        resp = test_view.get(request)
+        resp = TestView.as_view()(self.factory.get('/choices/'))
+
+        self.assertJSONEqual(resp.content.decode('utf-8'), {'choices': []})
+
+    def test_cached_response(self):
+        get_choices = mock.Mock(side_effect=lambda request: [(request.GET.get('category', ''), 'Choice')])
+
+        class TestCachedView(ChoiceJsonView):
+            def get_choices(self, request, *args, **kwargs):
+                return get_choices(request)
+
+        view = TestCachedView.as_view()
+        resp1 = view(self.factory.get('/choices/', {'category': 'A'}))
+        resp2 = view(self.factory.get('/choices/', {'category': 'A'}))
+        self.assertEqual(get_choices.call_count, 1)
+        self.assertEqual(resp1.content, resp2.content)
+
+        resp3 = view(self.factory.get('/choices/', {'category': 'B'}))
+        self.assertEqual(get_choices.call_count, 2)
+        self.assertNotEqual(resp1.content, resp3.content)
+
+        bump_data_version()
+        view(self.factory.get('/choices/', {'category': 'A'}))
+        self.assertEqual(get_choices.call_count, 3)
+
+    def test_not_cached_response(self):
+        get_choices = mock.Mock(return_value=[])
+
+        class TestNotCachedView(ChoiceJsonView):
+            cache_alias = None
+
+            def get_choices(self, request, *args, **kwargs):
+                return get_choices(request)
+
+        view = TestNotCachedView.as_view()
+        view(self.factory.get('/choices/'))
+        view(self.factory.get('/choices/'))
+        self.assertEqual(get_choices.call_count, 2)
+
+    def test_etag(self):
+        class TestEtagView(ChoiceJsonView):
+            def get_choices(self, request, *args, **kwargs):
+                return [('value1', 'Value 1')]
+
+        view = TestEtagView.as_view()
+        resp = view(self.factory.get('/choices/'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('must-revalidate', resp['Cache-Control'])
+        etag = resp['ETag']
+
+        resp = view(self.factory.get('/choices/', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+        resp = view(self.factory.get('/choices/', HTTP_IF_NONE_MATCH='"other"'))
+        self.assertEqual(resp.status_code, 200)
+
+
+class SingleFlightMixinTestCase(SimpleTestCase):
+
+    class TestView(SingleFlightMixin, View):
+        compute = None
+
+        def get(self, request, *args, **kwargs):
+            return HttpResponse(self.single_flight('content', self.compute))
+
+        def post(self, request, *args, **kwargs):
+            return self.get(request, *args, **kwargs)
+
+    def setUp(self):
+        bump_data_version()
+        self.factory = RequestFactory()
+        self.view = self.TestView.as_view(compute=mock.Mock(side_effect=['1', '2', '3', '4']))
 
-        self.assertContains(resp, '{"choices" : []}')
+    def _content(self, request, **kwargs):
+        return self.view(request, **kwargs).content.decode('utf-8')
+
+    def test_same_parameters_share_result(self):
+        self.assertEqual(self._content(self.factory.get('/test/', {'a': '1', 'b': ['2', '3']})), '1')
+        self.assertEqual(self._content(self.factory.get('/test/', {'b': ['3', '2'], 'a': '1'})), '1')
+
+    def test_different_parameters(self):
+        self.assertEqual(self._content(self.factory.get('/test/', {'a': '1'})), '1')
+        self.assertEqual(self._content(self.factory.get('/test/', {'a': '2'})), '2')
+        self.assertEqual(self._content(self.factory.get('/test/', {'a': '1'}), export='tsv'), '3')
+        self.assertEqual(self._content(self.factory.post('/test/?a=1', {'method_id': ['1', '2']})), '4')
+
+    def test_csrf_token_ignored(self):
+        self.assertEqual(self._content(self.factory.post('/test/', {'method_id': '1', 'csrfmiddlewaretoken': 'a'})), '1')
+        self.assertEqual(self._content(self.factory.post('/test/', {'method_id': '1', 'csrfmiddlewaretoken': 'b'})), '1')
+
+    def test_data_version(self):
+        self.assertEqual(self._content(self.factory.get('/test/')), '1')
+        bump_data_version()
+        self.assertEqual(self._content(self.factory.get('/test/')), '2')
+
+    @mock.patch('common.views.single_flight', return_value='1')
+    def test_wait_limited_by_query_budget(self, mock_single_flight):
+        self._content(self.factory.get('/test/'))
+        self.assertIsNone(mock_single_flight.call_args[1]['wait'])
+
+        request = self.factory.get('/test/')
+        request.query_budget = QueryBudget(5)
+        self._content(request)
+        self.assertTrue(4 < mock_single_flight.call_args[1]['wait'] <= 5)
 
 
 class PdfViewTestCase(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
     def test_response_no_data(self):
         test_view = PdfView()
-        request = ''
+        request = self.factory.get('/test/')
 
-        self.assertEquals(test_view.get(request), Http404)
+        with self.assertRaises(Http404):
+            test_view.get(request)
 
     def test_response_with_data(self):
         class TestPdfView(PdfView):
@@ -47,13 +160,138 @@ class PdfViewTestCase(SimpleTestCase):
             filename = 'test'
 
         test_view = TestPdfView()
-        request = ''
+        request = self.factory.get('/test/')
 
         resp = test_view.get(request)
         self.assertEquals(resp['Content-Type'], 'application/pdf')
         self.assertEquals(resp['content-disposition'], 'attachment;filename=test.pdf')
+        self.assertEquals(resp['Content-Length'], '15')
         self.assertContains(resp, 'Test PDF String')
 
+    def test_streamed_in_chunks(self):
+        close_pdf = mock.Mock()
+
+        class TestPdfView(PdfView):
+            mimetype = 'application/pdf'
+            filename = 'test'
+            chunk_size = 4
+
+            def get_pdf_info(self):
+                self.pdf = BytesIO(b'0123456789')
+
+        test_view = TestPdfView()
+        test_view.close_pdf = close_pdf
+
+        resp = test_view.get(self.factory.get('/test/'))
+        self.assertTrue(resp.streaming)
+        self.assertEquals(resp['Content-Length'], '10')
+        self.assertEquals(list(resp.streaming_content), [b'0123', b'4567', b'89'])
+
+        close_pdf.assert_not_called()
+        resp.close()
+        close_pdf.assert_called_once_with()
+
+
+class PdfViewRangeTestCase(SimpleTestCase):
+
+    class TestPdfView(PdfView):
+        mimetype = 'application/pdf'
+        filename = 'test'
+        chunk_size = 4
+        checksum = None
+        last_modified = None
+
+        def get_pdf_info(self):
+            self.pdf = BytesIO(b'0123456789')
+
+        def get_checksum(self):
+            return self.checksum
+
+        def get_last_modified(self):
+            return self.last_modified
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _get(self, view=None, **headers):
+        view = view or self.TestPdfView()
+        return view.get(self.factory.get('/test/', **headers))
+
+    def test_range(self):
+        resp = self._get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(resp['Content-Length'], '4')
+        self.assertEqual(b''.join(resp.streaming_content), b'2345')
+
+        resp = self._get(HTTP_RANGE='bytes=7-')
+        self.assertEqual(b''.join(resp.streaming_content), b'789')
+        resp = self._get(HTTP_RANGE='bytes=-3')
+        self.assertEqual(resp['Content-Range'], 'bytes 7-9/10')
+        resp = self._get(HTTP_RANGE='bytes=8-100')
+        self.assertEqual(resp['Content-Range'], 'bytes 8-9/10')
+
+    def test_unsatisfiable_range(self):
+        resp = self._get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], 'bytes */10')
+
+    def test_ignored_range(self):
+        for header in ['bytes=0-1,4-5', 'bytes=5-2', 'lines=1-2', 'bytes=a-']:
+            resp = self._get(HTTP_RANGE=header)
+            self.assertEqual(resp.status_code, 200, header)
+            self.assertEqual(resp['Accept-Ranges'], 'bytes')
+            self.assertEqual(b''.join(resp.streaming_content), b'0123456789')
+
+    def test_etag(self):
+        view = self.TestPdfView()
+        view.checksum = 'abc'
+        resp = self._get(view)
+        self.assertEqual(resp['ETag'], '"abc"')
+
+        view = self.TestPdfView()
+        view.checksum = 'abc'
+        resp = self._get(view, HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], '"abc"')
+
+        view = self.TestPdfView()
+        view.checksum = 'abc'
+        resp = self._get(view, HTTP_IF_NONE_MATCH='"def"')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_last_modified(self):
+        view = self.TestPdfView()
+        view.last_modified = datetime.datetime(2020, 1, 2)
+        resp = self._get(view)
+        self.assertEqual(resp['Last-Modified'], 'Thu, 02 Jan 2020 00:00:00 GMT')
+
+        view = self.TestPdfView()
+        view.last_modified = datetime.datetime(2020, 1, 2)
+        resp = self._get(view, HTTP_IF_MODIFIED_SINCE='Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertEqual(resp.status_code, 304)
+
+        view = self.TestPdfView()
+        view.last_modified = datetime.datetime(2020, 1, 3)
+        resp = self._get(view, HTTP_IF_MODIFIED_SINCE='Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_if_range(self):
+        view = self.TestPdfView()
+        view.checksum = 'abc'
+        resp = self._get(view, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"abc"')
+        self.assertEqual(resp.status_code, 206)
+
+        view = self.TestPdfView()
+        view.checksum = 'def'
+        resp = self._get(view, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"abc"')
+        self.assertEqual(resp.status_code, 200)
+
+        view = self.TestPdfView()
+        view.last_modified = datetime.datetime(2020, 1, 2)
+        resp = self._get(view, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertEqual(resp.status_code, 206)
+
 
 class SimpleWebProxyViewTestCase(SimpleTestCase):
 
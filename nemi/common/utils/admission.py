@@ -0,0 +1,159 @@
+'''
+Admission control for requests. Requests are grouped into endpoint classes (for instance cheap pages,
+searches, exports, and proxied requests). Each client has a token bucket for each endpoint class which
+limits the rate of its requests, and the number of requests of each class being handled at the same time
+can be capped. The state is kept in the process, so the limits apply to each server process separately.
+'''
+from collections import Counter, OrderedDict
+import math
+import threading
+import time
+
+from django.conf import settings
+
+
+def get_client_address(request):
+    ''' Returns the address of the client making request. If settings.ADMISSION_CLIENT_IP_HEADER is set, the
+    address is taken from that request header, which is a comma separated list of addresses to which each proxy
+    appends the address it received the request from. The left-most addresses are supplied by the client, so the
+    address added by the outermost of the settings.ADMISSION_TRUSTED_PROXY_HOPS trusted proxies is used.
+    Otherwise REMOTE_ADDR is used.
+    '''
+    header = getattr(settings, 'ADMISSION_CLIENT_IP_HEADER', None)
+    if header and request.META.get(header):
+        addresses = [address.strip() for address in request.META[header].split(',')]
+        hops = max(getattr(settings, 'ADMISSION_TRUSTED_PROXY_HOPS', 1), 1)
+        return addresses[max(len(addresses) - hops, 0)]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class TokenBucket(object):
+    '''
+    Allows capacity requests at once and then rate requests per second.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        ''' Takes a token if one is available and returns 0. Otherwise returns the number of
+        seconds until a token will be available.
+        '''
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionStats(object):
+    '''
+    Counts the requests of each endpoint class by outcome (admitted, rate_limited, or overloaded)
+    and the number of requests of each class currently being handled.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (endpoint class, outcome) to count
+        self.in_flight = Counter()  # endpoint class to count
+
+    def count(self, endpoint_class, outcome):
+        with self._lock:
+            self.requests[(endpoint_class, outcome)] += 1
+
+    def add_in_flight(self, endpoint_class, count):
+        with self._lock:
+            self.in_flight[endpoint_class] += count
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.in_flight.clear()
+
+    def to_text(self):
+        ''' Returns the counters in the Prometheus text exposition format.'''
+        with self._lock:
+            requests = sorted(self.requests.items())
+            in_flight = sorted(self.in_flight.items())
+
+        lines = ['# HELP nemi_admission_requests_total Requests by endpoint class and admission outcome.',
+                 '# TYPE nemi_admission_requests_total counter']
+        lines.extend(['nemi_admission_requests_total{endpoint_class="%s",outcome="%s"} %s' % (endpoint_class, outcome, count)
+                      for ((endpoint_class, outcome), count) in requests])
+        lines.extend(['# HELP nemi_admission_in_flight Requests currently being handled by endpoint class.',
+                      '# TYPE nemi_admission_in_flight gauge'])
+        lines.extend(['nemi_admission_in_flight{endpoint_class="%s"} %s' % (endpoint_class, count)
+                      for (endpoint_class, count) in in_flight])
+
+        return '\n'.join(lines) + '\n'
+
+
+# Statistics for all admission controllers in the process.
+stats = AdmissionStats()
+
+
+class AdmissionController(object):
+    '''
+    Decides whether requests are admitted.
+
+    rate_limits is a dictionary of endpoint class to a (requests per minute, burst) tuple. Each client may make
+    burst requests of that class at once and then requests per minute. Classes not in rate_limits are not rate limited.
+    max_in_flight is a dictionary of endpoint class to the maximum number of requests of that class handled at
+    the same time. Classes not in max_in_flight are not capped. At most max_clients clients are tracked; the
+    least recently seen clients are forgotten first.
+    '''
+
+    def __init__(self, rate_limits, max_in_flight, max_clients=10000):
+        self.rate_limits = rate_limits
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # (client, endpoint class) to TokenBucket
+        self._in_flight = Counter()
+
+    def _bucket(self, client, endpoint_class):
+        key = (client, endpoint_class)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            (per_minute, burst) = self.rate_limits[endpoint_class]
+            bucket = TokenBucket(per_minute / 60.0, burst)
+            if len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)
+        self._buckets[key] = bucket
+        return bucket
+
+    def admit(self, client, endpoint_class):
+        ''' Returns a tuple containing the outcome, admitted, rate_limited, or overloaded, and the number of whole
+        seconds after which the client should retry if the request was not admitted. If the request is admitted,
+        release must be called once it has been handled.
+        '''
+        with self._lock:
+            if endpoint_class in self.rate_limits:
+                wait = self._bucket(client, endpoint_class).take()
+                if wait:
+                    result = ('rate_limited', int(math.ceil(wait)))
+                    stats.count(endpoint_class, result[0])
+                    return result
+
+            if endpoint_class in self.max_in_flight and self._in_flight[endpoint_class] >= self.max_in_flight[endpoint_class]:
+                stats.count(endpoint_class, 'overloaded')
+                return ('overloaded', 1)
+
+            self._in_flight[endpoint_class] += 1
+
+        stats.count(endpoint_class, 'admitted')
+        stats.add_in_flight(endpoint_class, 1)
+        return ('admitted', 0)
+
+    def release(self, endpoint_class):
+        ''' Records that an admitted request of endpoint_class has been handled.'''
+        with self._lock:
+            self._in_flight[endpoint_class] -= 1
+        stats.add_in_flight(endpoint_class, -1)
@@ -0,0 +1,147 @@
+'''
+Reading binary large objects in chunks so that they can be streamed to the client rather than held in memory.
+A blob may be bytes, a cx_Oracle LOB, or a seekable file like object.
+'''
+
+import io
+import os
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def blob_length(blob):
+    ''' Returns the size of blob in bytes, or None if it can not be determined.'''
+    if isinstance(blob, (bytes, bytearray, memoryview)):
+        return len(blob)
+    elif hasattr(blob, 'size'):
+        # cx_Oracle LOB
+        return blob.size()
+    elif hasattr(blob, 'seek') and hasattr(blob, 'tell'):
+        position = blob.tell()
+        length = blob.seek(0, os.SEEK_END)
+        blob.seek(position)
+        return length
+    else:
+        return None
+
+
+def read_blob(blob, offset, amount):
+    ''' Returns at most amount bytes of blob starting at the zero based offset.'''
+    if isinstance(blob, (bytes, bytearray, memoryview)):
+        return bytes(blob[offset:offset + amount])
+    elif hasattr(blob, 'size'):
+        # cx_Oracle LOB offsets start at one.
+        return blob.read(offset + 1, amount)
+    else:
+        blob.seek(offset)
+        return blob.read(amount)
+
+
+class BlobReader(io.RawIOBase):
+    '''
+    Read only, seekable file like object over blob, which reads only the requested bytes with read_blob.
+    It can be wrapped in an io.BufferedReader to read a LOB in fewer, larger ranges.
+    '''
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.length = blob_length(blob)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        if offset < 0:
+            raise ValueError('Negative seek position %s' % offset)
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        amount = min(len(buffer), max(self.length - self.position, 0))
+        data = read_blob(self.blob, self.position, amount) if amount else b''
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_byte_range(header, length):
+    ''' Returns a tuple containing the start and stop offsets of the single byte range in the value of an
+    HTTP Range header, for a blob of length bytes. Returns None if header is not a valid single byte range,
+    in which case the header should be ignored. Raises RangeNotSatisfiable if the range is outside the blob.
+    '''
+    units, _, ranges = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+
+    first, dash, last = ranges.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        first = int(first) if first.strip() else None
+        last = int(last) if last.strip() else None
+    except ValueError:
+        return None
+
+    if first is None:
+        # Suffix range containing the last bytes.
+        if last is None:
+            return None
+        if last == 0 or length == 0:
+            raise RangeNotSatisfiable
+        return (max(length - last, 0), length)
+
+    if first < 0 or (last is not None and last < first):
+        return None
+    if first >= length:
+        raise RangeNotSatisfiable
+    return (first, length if last is None else min(last + 1, length))
+
+
+class BlobStream(object):
+    '''
+    Iterates over the bytes of blob from start, in chunks of at most chunk_size bytes. If length is specified,
+    only that many bytes are returned. on_close, if specified, is called when the stream is closed, which
+    a StreamingHttpResponse does once the response has been sent.
+    '''
+
+    def __init__(self, blob, start=0, length=None, chunk_size=DEFAULT_CHUNK_SIZE, on_close=None):
+        self.blob = blob
+        self.start = start
+        self.length = length
+        self.chunk_size = chunk_size
+        self.on_close = on_close
+
+    def __iter__(self):
+        offset = self.start
+        remaining = self.length
+        while remaining is None or remaining > 0:
+            amount = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            chunk = read_blob(self.blob, offset, amount)
+            if not chunk:
+                break
+
+            yield chunk
+            offset += len(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def close(self):
+        if self.on_close is not None:
+            on_close = self.on_close
+            self.on_close = None
+            on_close()
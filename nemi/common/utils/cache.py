@@ -0,0 +1,144 @@
+'''
+Helpers for keeping derived data (in memory indexes, cached responses) in step with the
+published NEMI data. Anything computed from the published methods should be keyed on the
+data version returned by get_data_version so that it is rebuilt when the data changes.
+
+The versions are kept in the cache named by settings.VERSION_CACHE, which must be shared by all of the
+server processes and the management commands so that a change made by one of them is seen by the others.
+Reading that cache may need a database query, so each process keeps the data version it last read for
+settings.DATA_VERSION_CHECK_INTERVAL seconds. A change made by another process is therefore seen within
+that time, and a change made by the process itself is seen at once.
+'''
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+DATA_VERSION_KEY = 'nemi_data_version'
+
+# The (data version, time after which it is read again) of this process.
+_local_data_version = (None, 0)
+
+
+def _version_cache():
+    return caches[getattr(settings, 'VERSION_CACHE', 'default')]
+
+
+def _single_flight_cache():
+    return caches[getattr(settings, 'SINGLE_FLIGHT_CACHE', 'default')]
+
+
+def _data_version_timeout():
+    return getattr(settings, 'DATA_VERSION_TIMEOUT', 60 * 60)
+
+
+def _remember_data_version(version):
+    global _local_data_version
+    _local_data_version = (version, time.monotonic() + getattr(settings, 'DATA_VERSION_CHECK_INTERVAL', 5))
+
+
+def get_data_version():
+    ''' Returns a string identifying the current version of the published data. A new version
+    is created if none exists. The version expires after settings.DATA_VERSION_TIMEOUT seconds
+    so that data loaded outside of the application is eventually picked up.
+    '''
+    (version, check_time) = _local_data_version
+    if version is not None and time.monotonic() < check_time:
+        return version
+
+    version_cache = _version_cache()
+    version = version_cache.get(DATA_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not version_cache.add(DATA_VERSION_KEY, version, _data_version_timeout()):
+            version = version_cache.get(DATA_VERSION_KEY) or version
+
+    _remember_data_version(version)
+    return version
+
+
+def bump_data_version():
+    ''' Creates and returns a new data version. This should be called whenever the application
+    changes the published data.
+    '''
+    version = uuid.uuid4().hex
+    _version_cache().set(DATA_VERSION_KEY, version, _data_version_timeout())
+    _remember_data_version(version)
+    return version
+
+
+def _method_version_key(method_id):
+    return 'nemi_method_version:%s' % method_id
+
+
+def get_method_version(method_id):
+    ''' Returns a string identifying the current version of the published method with method_id.
+    A new version is created if none exists. Anything cached for a single method should be keyed on
+    this version so that it is invalidated by bump_method_versions.
+    '''
+    key = _method_version_key(method_id)
+    version_cache = _version_cache()
+    version = version_cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not version_cache.add(key, version, None):
+            version = version_cache.get(key) or version
+
+    return version
+
+
+def bump_method_versions(method_ids):
+    ''' Creates new versions for the methods in method_ids. This should be called whenever the
+    application changes the published data for those methods.
+    '''
+    _version_cache().set_many(dict([(_method_version_key(method_id), uuid.uuid4().hex) for method_id in method_ids]), None)
+
+
+class SingleFlightError(Exception):
+    '''
+    Raised by single_flight when the computation of the requested value failed within the last failure_timeout
+    seconds, so that the callers sharing that computation do not repeat it.
+    '''
+    pass
+
+
+def single_flight(key, compute, timeout, wait=None, poll_interval=0.05, failure_timeout=None):
+    ''' Returns the value cached under key in settings.SINGLE_FLIGHT_CACHE, calling compute to create it and caching
+    it for timeout seconds if it is not cached. Concurrent callers with the same key, in any process sharing the cache,
+    wait for a single call of compute rather than each calling it. A caller which has waited settings.SINGLE_FLIGHT_WAIT
+    seconds, or wait seconds if that is less, for another caller's value calls compute itself.
+    If compute raises an exception, it is re-raised and the failure is recorded for failure_timeout seconds
+    (defaults to settings.SINGLE_FLIGHT_FAILURE_TIMEOUT), during which the callers with the same key raise
+    SingleFlightError rather than calling compute again. compute must not return None.
+    '''
+    max_wait = getattr(settings, 'SINGLE_FLIGHT_WAIT', 10)
+    wait = max_wait if wait is None else min(wait, max_wait)
+    if failure_timeout is None:
+        failure_timeout = getattr(settings, 'SINGLE_FLIGHT_FAILURE_TIMEOUT', 5)
+    lock_key = '%s:lock' % key
+    failed_key = '%s:failed' % key
+    deadline = time.monotonic() + wait
+    shared_cache = _single_flight_cache()
+
+    while True:
+        values = shared_cache.get_many([key, failed_key])
+        if values.get(key) is not None:
+            return values[key]
+        if values.get(failed_key):
+            raise SingleFlightError('The computation of %s failed' % key)
+
+        if shared_cache.add(lock_key, True, max(wait, 1)) or time.monotonic() >= deadline:
+            try:
+                value = compute()
+                shared_cache.set(key, value, timeout)
+            except Exception:
+                if failure_timeout:
+                    shared_cache.set(failed_key, True, failure_timeout)
+                raise
+            finally:
+                shared_cache.delete(lock_key)
+            return value
+
+        time.sleep(poll_interval)
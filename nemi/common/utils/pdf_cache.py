@@ -0,0 +1,140 @@
+'''
+A content addressed cache of PDF files on local disk, so that popular PDFs are not read out of the
+database LOBs for every download. Each PDF is stored once, in a file named by the sha256 checksum of
+its contents. The least recently used files are removed when the cache grows beyond its maximum size.
+
+Each process keeps an estimate of the size of the cache, which is the size found by its last scan of the
+directory plus the size of the files it has stored since. The directory is only scanned again when the
+estimate exceeds the maximum size, or SCAN_INTERVAL seconds after the last scan so that the files stored
+by the other processes are counted. A scan also removes the temporary files older than TMP_FILE_AGE seconds,
+which were left by stores that did not finish, for instance because their process was killed.
+'''
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+SCAN_INTERVAL = 5 * 60
+TMP_FILE_AGE = 60 * 60
+
+# The (estimated size, time of the last scan) of each cache directory.
+_sizes = {}
+_sizes_lock = threading.Lock()
+
+
+class PdfFileCache(object):
+    '''
+    The cached PDFs in directory, which defaults to settings.PDF_CACHE_DIR. max_size, which defaults to
+    settings.PDF_CACHE_MAX_SIZE, is the maximum number of bytes of PDF files kept.
+    '''
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or settings.PDF_CACHE_DIR
+        self.max_size = max_size if max_size is not None else getattr(settings, 'PDF_CACHE_MAX_SIZE', 2 * 1024 ** 3)
+        self.files_directory = os.path.join(self.directory, 'files')
+
+    def _file_path(self, checksum):
+        return os.path.join(self.files_directory, checksum[:2], '%s.pdf' % checksum)
+
+    def open(self, checksum):
+        ''' Returns the open file containing the PDF with checksum, or None if it is not cached. The file's
+        modification time is updated so that it is kept in preference to less recently used files.
+        '''
+        path = self._file_path(checksum)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def store(self, chunks):
+        ''' Stores the PDF whose contents are the iterable of bytes chunks and returns its checksum. The contents
+        are written to a temporary file which is then renamed, so that readers never see a partial file.
+        Less recently used files are then removed if the cache is larger than max_size.
+        '''
+        os.makedirs(self.files_directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.files_directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            checksum = digest.hexdigest()
+            path = self._file_path(checksum)
+            if os.path.exists(path):
+                # Identical contents are stored once.
+                os.remove(tmp_path)
+                size = 0
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self._add_size(size):
+            self.evict(keep=checksum)
+        return checksum
+
+    def _add_size(self, size):
+        ''' Adds size to the estimated size of the cache. Returns True if the directory should be scanned.'''
+        with _sizes_lock:
+            (total_size, scanned) = _sizes.get(self.directory, (None, None))
+            if total_size is None:
+                return True
+            _sizes[self.directory] = (total_size + size, scanned)
+            return total_size + size > self.max_size or time.monotonic() - scanned > SCAN_INTERVAL
+
+    def evict(self, keep=None):
+        ''' Scans the cache and removes the least recently used files until the cache is no larger than max_size.
+        The file with checksum keep is not removed. Temporary files older than TMP_FILE_AGE seconds are removed.
+        '''
+        files = []
+        total_size = 0
+        tmp_expired = time.time() - TMP_FILE_AGE
+        for (directory, dirnames, filenames) in os.walk(self.files_directory):
+            for filename in filenames:
+                if not filename.endswith(('.pdf', '.tmp')):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                if filename.endswith('.pdf'):
+                    files.append((stat.st_mtime, path, stat.st_size))
+                    total_size += stat.st_size
+                elif stat.st_mtime < tmp_expired:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+        keep_path = self._file_path(keep) if keep else None
+        for (mtime, path, size) in sorted(files):
+            if total_size <= self.max_size:
+                break
+            if path != keep_path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total_size -= size
+
+        with _sizes_lock:
+            _sizes[self.directory] = (total_size, time.monotonic())
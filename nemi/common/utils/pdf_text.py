@@ -0,0 +1,188 @@
+'''
+Extraction of the text of the published revision PDFs so that it can be indexed by the keyword
+search backends. The text of each revision is kept in a file in a PdfTextStore directory along
+with a manifest recording the revision's method, checksum and last change dates, so that only
+new or changed revisions are extracted again.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+import hashlib
+import io
+import json
+import os
+
+from django.conf import settings
+from django.db.models import Q
+import PyPDF2
+
+from common.models import RevisionJoin
+
+
+def extract_text(pdf):
+    ''' Returns the text of the pages in the PDF file contents pdf. An empty string is
+    returned if pdf can not be read.
+    '''
+    try:
+        reader = PyPDF2.PdfFileReader(io.BytesIO(pdf), strict=False)
+        pages = [reader.getPage(i).extractText() for i in range(reader.getNumPages())]
+    except Exception:
+        # PyPDF2 raises a variety of exceptions for damaged or encrypted files.
+        return ''
+
+    return '\n'.join(pages)
+
+
+class PdfTextStore(object):
+    '''
+    The extracted revision texts stored in directory, which defaults to settings.PDF_TEXT_DIR.
+    '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.PDF_TEXT_DIR
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+
+    def load_manifest(self):
+        ''' Returns a dictionary of revision id to a dictionary containing the revision's method_id,
+        checksum and changed keys.
+        '''
+        try:
+            with open(self.manifest_path) as f:
+                return dict([(int(revision_id), entry) for (revision_id, entry) in json.load(f).items()])
+        except (IOError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        ''' Replaces the manifest with manifest.'''
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _text_path(self, revision_id):
+        return os.path.join(self.directory, '%s.txt' % revision_id)
+
+    def read(self, revision_id):
+        ''' Returns the stored text of the revision with revision_id or an empty string.'''
+        try:
+            with open(self._text_path(revision_id), encoding='utf-8') as f:
+                return f.read()
+        except IOError:
+            return ''
+
+    def write(self, revision_id, text):
+        ''' Stores text for the revision with revision_id.'''
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._text_path(revision_id), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def delete(self, revision_id):
+        ''' Removes the stored text of the revision with revision_id.'''
+        try:
+            os.remove(self._text_path(revision_id))
+        except OSError:
+            pass
+
+    def texts_by_method(self):
+        ''' Returns a dictionary of method id to the stored text of the method's revisions.'''
+        texts = defaultdict(list)
+        for (revision_id, entry) in sorted(self.load_manifest().items()):
+            texts[entry['method_id']].append(self.read(revision_id))
+
+        return dict([(method_id, '\n'.join(method_texts)) for (method_id, method_texts) in texts.items()])
+
+
+def _changed(last_update_date, pdf_insert_date):
+    return '%s %s' % (last_update_date, pdf_insert_date)
+
+
+def _current_revisions():
+    ''' Returns a dictionary of the id of each published revision with a PDF to a tuple containing its method id,
+    the checksum of its shared PDF or None, its change dates, and whether it has its own copy in method_pdf.
+    '''
+    current = {}
+    for (own_pdf, has_pdf) in ((True, Q(method_pdf__isnull=False)),
+                               (False, Q(method_pdf__isnull=True, pdf_blob__isnull=False))):
+        revisions = RevisionJoin.objects.filter(has_pdf).values_list(
+            'revision_id', 'method_id', 'pdf_blob_id', 'last_update_date', 'pdf_insert_date')
+        for (revision_id, method_id, checksum, last_update_date, pdf_insert_date) in revisions:
+            current[revision_id] = (method_id, checksum, _changed(last_update_date, pdf_insert_date), own_pdf)
+
+    return current
+
+
+def _is_stale(entry, checksum, changed, own_pdf):
+    ''' Returns True if the manifest entry may not describe the revision's PDF.'''
+    if entry is None:
+        return True
+    if checksum is None:
+        return entry['changed'] != changed
+    # A revision's own copy can be replaced by the database procedures without changing its checksum.
+    return entry['checksum'] != checksum or (own_pdf and entry['changed'] != changed)
+
+
+def update_pdf_texts(store, processes=None, force=False, batch_size=10):
+    ''' Extracts the text of the published revisions which are new or have changed since they were
+    last extracted into store, and removes the text of revisions which no longer have a PDF. Revisions
+    with a shared PDF are considered changed if its checksum has changed, revisions with their own copy if
+    their last update or PDF insert date has changed, and all revisions if force is True. The text is only
+    extracted again if the checksum of the PDF read differs. The PDFs are read batch_size at a time and
+    extracted by a pool of processes, processes (defaults to the number of CPUs) in size. A process pool is not
+    used if processes is 1.
+
+    Returns a tuple containing the number of revisions extracted and removed.
+    '''
+    manifest = store.load_manifest()
+    current = _current_revisions()
+
+    removed = [revision_id for revision_id in manifest if revision_id not in current]
+    for revision_id in removed:
+        store.delete(revision_id)
+        del manifest[revision_id]
+
+    stale = sorted([revision_id for (revision_id, (method_id, checksum, changed, own_pdf)) in current.items()
+                    if force or _is_stale(manifest.get(revision_id), checksum, changed, own_pdf)])
+
+    pool = ProcessPoolExecutor(processes) if processes != 1 else None
+    extracted = 0
+    try:
+        for i in range(0, len(stale), batch_size):
+            batch = stale[i:i + batch_size]
+            # Only the copy which is used is read: the revision's own, or else the shared PDF.
+            own_batch = [revision_id for revision_id in batch if current[revision_id][3]]
+            shared_batch = [revision_id for revision_id in batch if not current[revision_id][3]]
+            revision_pdfs = list(RevisionJoin.objects.filter(revision_id__in=own_batch).values_list(
+                'revision_id', 'method_pdf'))
+            revision_pdfs.extend(RevisionJoin.objects.filter(revision_id__in=shared_batch).values_list(
+                'revision_id', 'pdf_blob__pdf'))
+
+            to_extract = []
+            for (revision_id, pdf) in revision_pdfs:
+                if pdf is None:
+                    # Changed since the revisions were listed.
+                    continue
+                pdf = bytes(pdf)
+                method_id, stored_checksum, changed, own_pdf = current[revision_id]
+                checksum = hashlib.sha256(pdf).hexdigest()
+                if revision_id in manifest and manifest[revision_id]['checksum'] == checksum:
+                    manifest[revision_id].update({'method_id': method_id, 'changed': changed})
+                else:
+                    to_extract.append((revision_id, pdf, {'method_id': method_id, 'checksum': checksum, 'changed': changed}))
+
+            pdfs = [pdf for (revision_id, pdf, entry) in to_extract]
+            texts = pool.map(extract_text, pdfs) if pool else map(extract_text, pdfs)
+            for ((revision_id, pdf, entry), text) in zip(to_extract, texts):
+                store.write(revision_id, text)
+                manifest[revision_id] = entry
+                extracted += 1
+
+            # Save after each batch so that an interrupted run does not have to start over.
+            store.save_manifest(manifest)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if removed:
+        store.save_manifest(manifest)
+
+    return (extracted, len(removed))
@@ -0,0 +1,112 @@
+'''
+Validation of uploaded revision PDFs. Reading a whole PDF with PyPDF2 is too slow to do while the
+upload request is handled, so uploads only get a quick check of the PDF header and trailer. The
+shared PdfBlob is then read in the background, after the upload has been committed, to record
+whether it is a valid PDF and its number of pages. Only the parts of the BLOB needed for the checks
+are read, rather than the whole PDF. PDFs which were not validated in the background,
+for instance because the server was restarted, are validated by the validate_revision_pdfs command.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+import PyPDF2
+
+from common.models import PdfBlob
+from common.utils.blobs import BlobReader
+
+PDF_HEADER = b'%PDF-'
+PDF_TRAILER = b'%%EOF'
+
+# Number of bytes at each end of a PDF in which the header and trailer are looked for.
+CHECK_SIZE = 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def check_pdf_structure(pdf_file):
+    ''' Returns True if the seekable file like object pdf_file starts with a PDF header and ends with a
+    PDF trailer. Only the first and last CHECK_SIZE bytes are read.
+    '''
+    pdf_file.seek(0)
+    head = pdf_file.read(CHECK_SIZE)
+    size = pdf_file.seek(0, os.SEEK_END)
+    pdf_file.seek(max(size - CHECK_SIZE, 0))
+    tail = pdf_file.read(CHECK_SIZE)
+    pdf_file.seek(0)
+
+    return PDF_HEADER in head and PDF_TRAILER in tail
+
+
+def read_page_count(pdf_file):
+    ''' Returns the number of pages in the seekable file like object pdf_file. Raises PyPDF2.utils.PdfReadError,
+    or the other exceptions raised by PyPDF2 for malformed files, if pdf_file can not be read. PyPDF2 only reads
+    the cross reference tables and the objects of the page tree, not the page contents.
+    '''
+    pdf_file.seek(0)
+    return PyPDF2.PdfFileReader(pdf_file).getNumPages()
+
+
+def validate_pdf_blob(checksum, force=False):
+    ''' Reads the PdfBlob with checksum and records whether it is valid and its number of pages. PdfBlobs
+    which have already been validated are skipped unless force is True. Returns the validation status,
+    or None if there is no such PdfBlob.
+    '''
+    query = 'SELECT pdf FROM %s WHERE checksum = %%s' % connection.ops.quote_name(PdfBlob._meta.db_table)
+    params = [checksum]
+    if not force:
+        query += ' AND validation_status = %s'
+        params.append(PdfBlob.PENDING)
+
+    with connection.cursor() as cursor:
+        # The raw cursor returns a LOB on Oracle, which is read in ranges rather than all at once.
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        pdf_file = io.BufferedReader(BlobReader(row[0]), CHECK_SIZE)
+        if not check_pdf_structure(pdf_file):
+            values = {'validation_status': PdfBlob.INVALID, 'page_count': None,
+                      'validation_message': 'The PDF header or trailer is missing.'}
+        else:
+            try:
+                page_count = read_page_count(pdf_file)
+            except Exception as e:
+                # PyPDF2 raises many different exceptions for malformed files.
+                values = {'validation_status': PdfBlob.INVALID, 'page_count': None,
+                          'validation_message': (str(e) or e.__class__.__name__)[:400]}
+            else:
+                values = {'validation_status': PdfBlob.VALID, 'page_count': page_count, 'validation_message': None}
+
+    PdfBlob.objects.filter(checksum=checksum).update(**values)
+    return values['validation_status']
+
+
+def _validate_in_background(checksum):
+    try:
+        validate_pdf_blob(checksum)
+    finally:
+        # The thread's database connection is not closed by the request handling.
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.PDF_VALIDATION_WORKERS)
+        return _executor
+
+
+def schedule_validation(checksum):
+    ''' Validates the PdfBlob with checksum in a background thread once the current transaction has been
+    committed. Nothing is done if settings.PDF_VALIDATION_WORKERS is 0, in which case the PdfBlob is
+    validated by the validate_revision_pdfs command.
+    '''
+    if getattr(settings, 'PDF_VALIDATION_WORKERS', 0):
+        transaction.on_commit(lambda: _get_executor().submit(_validate_in_background, checksum))
@@ -0,0 +1,78 @@
+'''
+Time budgets for the database statements run while handling a request. When the budget runs out the
+statement being executed is cancelled by the database driver: on Oracle by setting the cx_Oracle
+connection's callTimeout and on SQLite with a progress handler. Other databases are not limited.
+'''
+from contextlib import contextmanager
+import time
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+class QueryBudget(object):
+    '''
+    The time allowed for the statements executed within a query_time_budget block.
+    '''
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self):
+        ''' Returns the number of seconds left in the budget.'''
+        return max(self.deadline - time.monotonic(), 0)
+
+    def expired(self):
+        ''' Returns True if the budget has run out.'''
+        return time.monotonic() >= self.deadline
+
+
+def get_remaining_time(request):
+    ''' Returns the number of seconds left in the query time budget of request, or None if its statements are
+    not limited.
+    '''
+    budget = getattr(request, 'query_budget', None)
+    return budget.remaining() if budget is not None else None
+
+
+def _sqlite_progress_handler(budget):
+    def handler():
+        # A non zero return value interrupts the statement.
+        return 1 if budget.expired() else 0
+    return handler
+
+
+@contextmanager
+def query_time_budget(seconds, using=DEFAULT_DB_ALIAS):
+    '''
+    Context manager which limits the time taken by the statements executed on the database connection
+    using to seconds, in total. Yields the QueryBudget. A statement still running when the budget runs
+    out raises a DatabaseError, which can be recognized as a timeout by checking whether the budget has expired.
+    '''
+    budget = QueryBudget(seconds)
+    connection = connections[using]
+    connection.ensure_connection()
+    raw_connection = connection.connection
+
+    if connection.vendor == 'oracle':
+        previous_timeout = raw_connection.callTimeout
+        # callTimeout applies to each round trip, so it is reset before each statement.
+        def set_call_timeout(execute, sql, params, many, context):
+            raw_connection.callTimeout = max(int(budget.remaining() * 1000), 1)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(set_call_timeout):
+            try:
+                yield budget
+            finally:
+                raw_connection.callTimeout = previous_timeout
+
+    elif connection.vendor == 'sqlite':
+        raw_connection.set_progress_handler(_sqlite_progress_handler(budget), 1000)
+        try:
+            yield budget
+        finally:
+            raw_connection.set_progress_handler(None, 0)
+
+    else:
+        yield budget
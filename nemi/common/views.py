@@ -1,28 +1,111 @@
 
+import calendar
+import hashlib
+import io
+import json
+
 import requests
 
+from django.conf import settings
+from django.core.cache import caches
 from django.forms import Form
-from django.http import Http404, HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
 from django.views.generic import View
 from django.views.generic.edit import TemplateResponseMixin
 
 from .models import DefinitionsDOM
+from .utils.blobs import blob_length, parse_byte_range, BlobStream, RangeNotSatisfiable
+from .utils.cache import get_data_version, single_flight
+from .utils.query_budget import get_remaining_time
 from .utils.view_utils import xls_response, tsv_response
 
 
 class ChoiceJsonView(View):
-    ''' Extends the standard View to return a JSON object representing a list of choices
+    ''' Extends the standard View to return a JSON object representing a list of choices.
+    The response is cached, keyed on the view, the query parameters, and the data version, and has an
+    ETag so that browsers can revalidate their copy and receive a 304 (Not Modified) response.
     '''
+
+    cache_alias = 'default'  # Name of the cache, in settings.CACHES, used to cache responses. If None, responses are not cached.
+    cache_timeout = None  # Number of seconds responses are cached. If None, settings.CHOICE_CACHE_TIMEOUT is used.
+    max_age = 0  # Number of seconds that browsers may use the response without revalidating it.
+
     def get_choices(self, request, *args, **kwargs):
         ''' Returns a list of tuples representing the choices. The first element in the tuple is the value
         and the second is the display value.
         '''
 
-    def get(self, request, *args, **kwargs):
-        choices = ['{"value" : "' + value + '", "display_value" : "' + display_value + '"}'
+    def get_cache_key(self, request, *args, **kwargs):
+        ''' Returns the key used to cache the response content.'''
+        query = sorted([(k, request.GET.getlist(k)) for k in request.GET.keys()])
+        return 'choices:%s.%s:%s:%s' % (self.__class__.__module__,
+                                        self.__class__.__qualname__,
+                                        get_data_version(),
+                                        hashlib.md5(json.dumps([args, sorted(kwargs.items()), query]).encode('utf-8')).hexdigest())
+
+    def get_content(self, request, *args, **kwargs):
+        ''' Returns the json string of the choices.'''
+        choices = [{'value': value, 'display_value': display_value}
                    for (value, display_value) in self.get_choices(request, *args, **kwargs)]
 
-        return HttpResponse('{"choices" : [' + ','.join(choices) + ']}', content_type='application/json')
+        return json.dumps({'choices': choices})
+
+    def get(self, request, *args, **kwargs):
+        if self.cache_alias is None:
+            content = self.get_content(request, *args, **kwargs)
+        else:
+            cache = caches[self.cache_alias]
+            key = self.get_cache_key(request, *args, **kwargs)
+            content = cache.get(key)
+            if content is None:
+                content = self.get_content(request, *args, **kwargs)
+                timeout = self.cache_timeout if self.cache_timeout is not None else getattr(settings, 'CHOICE_CACHE_TIMEOUT', 60 * 60)
+                cache.set(key, content, timeout)
+
+        etag = '"%s"' % hashlib.md5(content.encode('utf-8')).hexdigest()
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, max_age=self.max_age, must_revalidate=True)
+
+        return response
+
+
+class SingleFlightMixin(object):
+    '''
+    Mixin for views which compute expensive results. Concurrent requests to the view with the same
+    parameters share a single computation of the result, which is kept for single_flight_timeout seconds.
+    '''
+
+    single_flight_timeout = None  # If None, settings.SINGLE_FLIGHT_TIMEOUT is used.
+
+    def get_single_flight_key(self, name):
+        ''' Returns the cache key for the result called name of the current request. The key depends
+        on the view, the url arguments, the query and form parameters, and the data version.
+        '''
+        query = sorted([(k, sorted(self.request.GET.getlist(k))) for k in self.request.GET.keys()])
+        form = sorted([(k, sorted(self.request.POST.getlist(k))) for k in self.request.POST.keys() if k != 'csrfmiddlewaretoken'])
+        params = json.dumps([self.request.method, self.args, sorted(self.kwargs.items()), query, form])
+        return 'single_flight:%s.%s:%s:%s:%s' % (self.__class__.__module__,
+                                                 self.__class__.__qualname__,
+                                                 name,
+                                                 get_data_version(),
+                                                 hashlib.md5(params.encode('utf-8')).hexdigest())
+
+    def single_flight(self, name, compute):
+        ''' Returns the result called name for the current request, calling compute to create it
+        unless another request is already doing so. The wait for another request's result is limited to
+        the rest of the request's query time budget. The result must be data which can be pickled rather
+        than a response.
+        '''
+        timeout = self.single_flight_timeout
+        if timeout is None:
+            timeout = getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 10)
+        return single_flight(self.get_single_flight_key(name), compute, timeout, wait=get_remaining_time(self.request))
 
 
 class PdfView(View):
@@ -30,11 +113,21 @@ class PdfView(View):
     Extends the standard View to return a response containing a downloadable file, which is assumed to be a pdf file.
     The mimetype pdf and filename suffix can be specified as attributes or by overriding get_response_info to retrieve
     the mimetype, pdf, and filename from the request, args, and/or kwargs.
+    The pdf is streamed to the client in chunks of chunk_size bytes so that it is never held in memory all at once.
+
+    Requests for a single byte range are answered with a 206 (Partial Content) response. If get_etag returns an
+    ETag, by default the checksum returned by get_checksum as a strong ETag, and if get_last_modified returns a
+    datetime, they are sent so that clients can revalidate their copy and receive a 304 (Not Modified) response.
+    A weak ETag is never used to resume a download with If-Range.
+
+    A pdf which is a file opened on disk is closed once it has been sent. When the whole file is sent, a FileResponse
+    is used so that the server can send the file directly, and close_pdf is called before the response is returned.
     '''
 
     mimetype = ''
-    pdf = None
+    pdf = None  # bytes, a cx_Oracle LOB, or a seekable file like object
     filename = ''
+    chunk_size = 64 * 1024
 
     def get_pdf_info(self):
         '''This should be overridden if the above parameters are not defined when extending the class
@@ -42,16 +135,105 @@ class PdfView(View):
          '''
         pass
 
+    def close_pdf(self):
+        '''This should be overridden if resources used to read the pdf need to be released once it has been sent.'''
+        pass
+
+    def get_checksum(self):
+        '''Returns the stored hex digest of the sha256 checksum of the pdf, or None if it is not known.'''
+        return None
+
+    def get_last_modified(self):
+        '''Returns the UTC datetime when the pdf was last changed, or None if it is not known.'''
+        return None
+
+    def get_etag(self):
+        '''Returns the ETag of the pdf, or None if it has none. By default the checksum is used as a strong ETag.'''
+        checksum = self.get_checksum()
+        return '"%s"' % checksum if checksum else None
+
+    def _if_range_matches(self, request, etag, last_modified):
+        ''' Returns True unless the request has an If-Range header which does not match the current pdf.'''
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            return etag is not None and not etag.startswith('W/') and if_range == etag
+        return last_modified is not None and parse_http_date_safe(if_range) == last_modified
+
+    def get_pdf_response(self, request, pdf, etag, last_modified):
+        length = blob_length(pdf)
+        start = 0
+        stop = length
+        byte_range = None
+
+        if length is not None and request.META.get('HTTP_RANGE') and self._if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_byte_range(request.META['HTTP_RANGE'], length)
+            except RangeNotSatisfiable:
+                self.close_pdf()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%s' % length
+                return response
+            if byte_range is not None:
+                start, stop = byte_range
+
+        is_file = isinstance(pdf, io.BufferedReader)
+
+        if is_file and byte_range is None:
+            self.close_pdf()
+            response = FileResponse(pdf, content_type=self.mimetype)
+
+        else:
+            def on_close():
+                try:
+                    if is_file:
+                        pdf.close()
+                finally:
+                    self.close_pdf()
+
+            stream = BlobStream(pdf,
+                                start=start,
+                                length=None if length is None else stop - start,
+                                chunk_size=self.chunk_size,
+                                on_close=on_close)
+            response = StreamingHttpResponse(stream, content_type=self.mimetype)
+
+        response['Content-Disposition'] = 'attachment;filename=%s.pdf' % self.filename
+
+        if length is not None:
+            response['Accept-Ranges'] = 'bytes'
+            response['Content-Length'] = str(stop - start)
+        if byte_range is not None:
+            response.status_code = 206
+            response['Content-Range'] = 'bytes %s-%s/%s' % (start, stop - 1, length)
+
+        return response
+
     def get(self, request, *args, **kwargs):
         self.get_pdf_info()
 
         if not self.mimetype or not self.pdf:
-            return Http404
+            self.close_pdf()
+            raise Http404
 
-        response = HttpResponse(content_type=self.mimetype)
-        response['Content-Disposition'] = 'attachment;filename=%s.pdf' % self.filename
+        pdf = self.pdf.encode('utf-8') if isinstance(self.pdf, str) else self.pdf
+
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        if last_modified is not None:
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_pdf_response(request, pdf, etag, last_modified)
+        else:
+            self.close_pdf()
 
-        response.write(self.pdf)
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
 
         return response
 
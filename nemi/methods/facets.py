@@ -0,0 +1,272 @@
+''' This module contains a process local index of the filterable columns of the method
+search views. The index answers the standard method search filters by set intersection so
+that only the matching rows need to be retrieved from the database, by primary key.
+'''
+
+from collections import defaultdict
+import threading
+
+from django.core.exceptions import ValidationError
+
+from common.models import PublicationSourceRel, SourceCitationRef, StatAnalysisRel, StatDesignRel, StatMediaRel
+from common.models import StatTopicRel
+from common.utils.cache import get_data_version
+
+from .models import MethodVW, MethodAnalyteAllVW
+
+
+# Columns which can be used to filter method searches.
+FACET_FIELDS = ('method_category',
+                'method_subcategory',
+                'media_name',
+                'method_source',
+                'instrumentation_id',
+                'method_type_desc',
+                'matrix')
+
+# Additional columns of analyte searches. The selected analyte names and codes are matched using their variants.
+ANALYTE_FACET_FIELDS = FACET_FIELDS + ('analyte_name', 'analyte_code')
+
+# Additional columns which can be used to filter statistical method searches.
+STATISTICAL_FACET_FIELDS = FACET_FIELDS + ('sam_complexity',)
+
+# Statistical method attributes which are held in other tables. Each entry is the index field name,
+# the model holding the attribute, the model's key field and value field, and the MethodVW field
+# which the key matches.
+STATISTICAL_RELATED_FIELDS = (
+    ('item_type', SourceCitationRef, 'source_citation_id', 'item_type', 'source_citation_id'),
+    ('analysis_type', StatAnalysisRel, 'method_id', 'analysis_type', 'method_id'),
+    ('publication_source_type', PublicationSourceRel, 'source_citation_ref', 'source', 'source_citation_id'),
+    ('study_objective', StatDesignRel, 'method_id', 'design_objective', 'method_id'),
+    ('media_emphasized', StatMediaRel, 'method_id', 'media_name', 'method_id'),
+    ('special_topic', StatTopicRel, 'method_id', 'topic', 'method_id'),
+)
+
+
+class FacetIndexSnapshot(object):
+    '''
+    The contents of a FacetIndex loaded for one data version. A snapshot is never changed, so
+    all of the lookups made while answering one request should use the same snapshot, even if the
+    index is reloaded meanwhile.
+    '''
+
+    def __init__(self, index, version, all_pks, values):
+        self.index = index
+        self.version = version
+        self.all_pks = frozenset(all_pks)
+        self._values = dict([(field, dict([(v, frozenset(pks)) for (v, pks) in field_values.items()]))
+                             for (field, field_values) in values.items()])
+        self._variants = dict([(field, self._fold(field_values))
+                               for (field, field_values) in self._values.items()])
+
+    @staticmethod
+    def _fold(field_values):
+        ''' Returns a dictionary of each case folded value in field_values and the values which fold to it.'''
+        folded = defaultdict(set)
+        for value in field_values:
+            folded[str(value).lower()].add(value)
+
+        return dict([(value, frozenset(values)) for (value, values) in folded.items()])
+
+    def all(self):
+        ''' Returns the primary keys of all rows in the snapshot.'''
+        return self.all_pks
+
+    def values(self, field):
+        ''' Returns a dictionary of the distinct values of field and their primary key sets.'''
+        return self._values[field]
+
+    def variants(self, field, values):
+        ''' Returns the set of the distinct values of field which are equal to one of values, ignoring case.'''
+        field_variants = self._variants[field]
+        return frozenset().union(*[field_variants.get(str(value).lower(), frozenset()) for value in values])
+
+    def lookup(self, field, lookup, value):
+        ''' Returns the primary keys of the rows which match the ORM style lookup on field.
+        Supported lookups are exact, iexact, in, and contains.
+        '''
+        field_values = self.values(field)
+
+        if lookup == 'exact':
+            try:
+                value = self.index.get_model_field(field).to_python(value)
+            except ValidationError:
+                return frozenset()
+            return field_values.get(value, frozenset())
+
+        elif lookup == 'iexact':
+            matches = [field_values[v] for v in self.variants(field, [value])]
+
+        elif lookup == 'in':
+            matches = [field_values.get(v, frozenset()) for v in value]
+
+        elif lookup == 'contains':
+            matches = [pks for (v, pks) in field_values.items() if value in str(v)]
+
+        else:
+            raise ValueError('Unsupported lookup: %s' % lookup)
+
+        return frozenset().union(*matches)
+
+    def filter(self, filters):
+        ''' Returns the primary keys of the rows matching all of filters, a sequence of
+        (field, lookup, value) tuples.
+        '''
+        result = self.all_pks
+        for (field, lookup, value) in filters:
+            result = result & self.lookup(field, lookup, value)
+            if not result:
+                break
+
+        return result
+
+    def counts(self, field, pks):
+        ''' Returns a dictionary of each distinct value of field and the number of the primary keys
+        in pks having that value.
+        '''
+        return dict([(value, len(value_pks & pks)) for (value, value_pks) in self.values(field).items()])
+
+    def facet_counts(self, filters, fields=None, within=None):
+        ''' Returns a dictionary with an entry for each field in fields (defaults to all index fields).
+        Each entry is a dictionary of the field's values and the number of rows which would match filters
+        if that value were selected. Filters on field itself are ignored when counting field's values so
+        that alternative choices are counted. If within is specified, only those primary keys are counted.
+        '''
+        fields = fields or self.index.fields
+        result = {}
+        for field in fields:
+            pks = self.filter([f for f in filters if f[0] != field])
+            if within is not None:
+                pks = pks & within
+            result[field] = self.counts(field, pks)
+
+        return result
+
+
+class FacetIndex(object):
+    '''
+    Keeps, for each field in fields, a map of the field's distinct values to the set of
+    primary keys of model having that value. The index is loaded on first use and reloaded
+    whenever the data version changes. The data version is checked once for each call; callers
+    making several lookups which must agree should use snapshot() and make them on the snapshot.
+    '''
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def load(self):
+        ''' Returns a tuple containing the set of all primary keys and a dictionary
+        mapping each field to a dictionary of value to primary key set.
+        '''
+        all_pks = set()
+        values = dict([(field, defaultdict(set)) for field in self.fields])
+
+        qs = self.model.objects.values_list(self.model._meta.pk.name, *self.fields)
+        for row in qs.iterator():
+            pk = row[0]
+            all_pks.add(pk)
+            for field, value in zip(self.fields, row[1:]):
+                if value is not None:
+                    values[field][value].add(pk)
+
+        return (all_pks, values)
+
+    def snapshot(self):
+        ''' Returns the FacetIndexSnapshot for the current data version, loading it if necessary.'''
+        version = get_data_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    all_pks, values = self.load()
+                    snapshot = FacetIndexSnapshot(self, version, all_pks, values)
+                    self._snapshot = snapshot
+
+        return snapshot
+
+    def clear(self):
+        ''' Forces the index to be reloaded the next time it is used.'''
+        with self._lock:
+            self._snapshot = None
+
+    def get_model_field(self, field):
+        ''' Returns the model field used to convert values of the index field.'''
+        return self.model._meta.get_field(field)
+
+    def all(self):
+        ''' Returns the primary keys of all rows in the index.'''
+        return self.snapshot().all()
+
+    def values(self, field):
+        ''' Returns a dictionary of the distinct values of field and their primary key sets.'''
+        return self.snapshot().values(field)
+
+    def variants(self, field, values):
+        ''' See FacetIndexSnapshot.variants.'''
+        return self.snapshot().variants(field, values)
+
+    def lookup(self, field, lookup, value):
+        ''' See FacetIndexSnapshot.lookup.'''
+        return self.snapshot().lookup(field, lookup, value)
+
+    def filter(self, filters):
+        ''' See FacetIndexSnapshot.filter.'''
+        return self.snapshot().filter(filters)
+
+    def counts(self, field, pks):
+        ''' See FacetIndexSnapshot.counts.'''
+        return self.snapshot().counts(field, pks)
+
+    def facet_counts(self, filters, fields=None, within=None):
+        ''' See FacetIndexSnapshot.facet_counts.'''
+        return self.snapshot().facet_counts(filters, fields, within)
+
+
+class RelatedFacetIndex(FacetIndex):
+    '''
+    Extends FacetIndex to also index attributes held in other tables, which may have
+    several values for each row. related_fields is a sequence of (index field, model, key field,
+    value field, row field) tuples. A row has a value of the index field for each instance of model
+    whose key field matches the row's row field. The related fields can be used in filter, lookup, and values
+    but are only counted by facet_counts when requested.
+    '''
+
+    def __init__(self, model, fields, related_fields):
+        super(RelatedFacetIndex, self).__init__(model, fields)
+        self.related_fields = tuple(related_fields)
+
+    def load(self):
+        all_pks, values = super(RelatedFacetIndex, self).load()
+
+        pks_by_row_field = {}
+        for row_field in set([related_field[4] for related_field in self.related_fields]):
+            pks_by_key = defaultdict(set)
+            for (pk, key) in self.model.objects.values_list(self.model._meta.pk.name, row_field).iterator():
+                pks_by_key[key].add(pk)
+            pks_by_row_field[row_field] = pks_by_key
+
+        for (field, model, key_field, value_field, row_field) in self.related_fields:
+            field_values = defaultdict(set)
+            pks_by_key = pks_by_row_field[row_field]
+            for (key, value) in model.objects.values_list(key_field, value_field).iterator():
+                if value is not None and key in pks_by_key:
+                    field_values[value].update(pks_by_key[key])
+            values[field] = field_values
+
+        return (all_pks, values)
+
+    def get_model_field(self, field):
+        for (related_field, model, key_field, value_field, row_field) in self.related_fields:
+            if field == related_field:
+                return model._meta.get_field(value_field)
+        return super(RelatedFacetIndex, self).get_model_field(field)
+
+
+method_index = FacetIndex(MethodVW, FACET_FIELDS)
+statistical_method_index = RelatedFacetIndex(MethodVW, STATISTICAL_FACET_FIELDS, STATISTICAL_RELATED_FIELDS)
+method_analyte_index = FacetIndex(MethodAnalyteAllVW, ANALYTE_FACET_FIELDS)
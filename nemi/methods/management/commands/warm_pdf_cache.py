@@ -0,0 +1,59 @@
+"""
+This command copies the method and revision PDFs which are not yet in the PDF
+cache, in settings.PDF_CACHE_DIR, from the database into the cache, so that the
+first downloads after a deployment do not have to read them from the database.
+Only the PDFs shared in pdf_blob are cached, so share_revision_pdfs should be
+run first. Revisions whose own copy no longer matches the shared PDF are
+skipped, as they are served from the database.
+"""
+import io
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from common.utils.pdf_cache import PdfFileCache
+
+from methods.views import MethodPdfView, RevisionPdfView
+
+
+class Command(BaseCommand):
+    help = 'Copies the method and revision PDFs into the PDF cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--methods-only', action='store_true',
+            help='Only cache the PDFs of the current method revisions.')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'PDF_CACHE_DIR', None):
+            raise CommandError('settings.PDF_CACHE_DIR is not set')
+
+        view_classes = [MethodPdfView]
+        if not options['methods_only']:
+            view_classes.append(RevisionPdfView)
+
+        count = 0
+        for view_class in view_classes:
+            cursor = connection.cursor()
+            try:
+                if view_class.checksum_table:
+                    cursor.execute('SELECT t.%s from %s t, %s c where t.revision_id = c.revision_id and c.%s is not null' % (
+                        view_class.key, view_class.table, view_class.checksum_table, view_class.checksum_column))
+                else:
+                    cursor.execute('SELECT %s from %s where %s is not null' % (
+                        view_class.key, view_class.table, view_class.checksum_column))
+                keys = [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+            for key in keys:
+                view = view_class(kwargs={view_class.key: str(key)})
+                view.get_pdf_info()
+                view.close_pdf()
+                if isinstance(view.pdf, io.BufferedReader):
+                    view.pdf.close()
+                if view.checksum:
+                    count += 1
+
+        self.stdout.write('Cached %s PDFs in %s.' % (count, PdfFileCache().directory))
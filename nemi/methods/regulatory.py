@@ -0,0 +1,119 @@
+''' This module contains a process local store of the regulatory method search results. The
+regulatory data set is small and changes rarely, so the results for every analyte are computed
+at once, in display order, rather than querying the regulatory view for each search.
+'''
+
+import threading
+
+from common.utils.cache import get_data_version
+
+from .models import RegQueryVW
+
+
+# Subcategories which are not shown in regulatory results.
+EXCLUDED_SUBCATEGORIES = ['SAMPLE/PREPARATION', 'GENERAL']
+
+# Order of the regulatory results.
+REGULATORY_ORDERING = ('regulation', 'method_source', 'source_method_identifier')
+
+# Fields in the regulatory results download.
+REGULATORY_EXPORT_FIELDS = ('regulation',
+                            'regulation_name',
+                            'reg_location',
+                            'method_source',
+                            'source_method_identifier',
+                            'method_descriptive_name',
+                            'revision_information',
+                            'dl_value',
+                            'dl_units',
+                            'dl_type',
+                            'instrumentation',
+                            'instrumentation_description',
+                            'relative_cost_symbol',
+                            'relative_cost')
+
+
+def normalize_analyte(value):
+    ''' Returns the key used to look up an analyte name or code.'''
+    return value.strip().lower()
+
+
+class RegulatoryResults(object):
+    '''
+    The regulatory results for an analyte. rows is the list of RegQueryVW instances in display order and
+    export_rows is the list of tuples containing method_id followed by the export_fields of each row.
+    '''
+
+    def __init__(self, export_fields):
+        self.export_fields = export_fields
+        self.rows = []
+        self.export_rows = []
+
+    def append(self, row):
+        self.rows.append(row)
+        self.export_rows.append(tuple([row.method_id] + [getattr(row, field) for field in self.export_fields]))
+
+
+class RegulatoryResultStore(object):
+    '''
+    Keeps the regulatory results of all analytes, keyed by normalized analyte name and by normalized
+    analyte code. Only the preferred analyte names are included when looking up by code. The store is
+    loaded on first use and reloaded whenever the data version changes.
+    '''
+
+    def __init__(self, export_fields=REGULATORY_EXPORT_FIELDS):
+        self.export_fields = tuple(export_fields)
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._all = RegulatoryResults(self.export_fields)
+        self._by_name = {}
+        self._by_code = {}
+
+    def load(self):
+        ''' Returns a tuple containing the RegulatoryResults for all analytes and dictionaries of normalized
+        analyte name and normalized analyte code to RegulatoryResults.
+        '''
+        all_results = RegulatoryResults(self.export_fields)
+        by_name = {}
+        by_code = {}
+
+        qs = RegQueryVW.objects.exclude(method_subcategory__in=EXCLUDED_SUBCATEGORIES).order_by(*REGULATORY_ORDERING)
+        for row in qs.iterator():
+            all_results.append(row)
+            if row.analyte_name:
+                by_name.setdefault(normalize_analyte(row.analyte_name), RegulatoryResults(self.export_fields)).append(row)
+            if row.analyte_code and row.preferred == -1:
+                by_code.setdefault(normalize_analyte(row.analyte_code), RegulatoryResults(self.export_fields)).append(row)
+
+        return (all_results, by_name, by_code)
+
+    def _refresh(self):
+        version = get_data_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._all, self._by_name, self._by_code = self.load()
+                    self._version = version
+
+    def clear(self):
+        ''' Forces the store to be reloaded the next time it is used.'''
+        with self._lock:
+            self._version = None
+
+    def get(self, analyte_name='', analyte_code=''):
+        ''' Returns the RegulatoryResults for analyte_name if specified, otherwise for analyte_code if specified,
+        otherwise for all analytes.
+        '''
+        self._refresh()
+
+        empty = RegulatoryResults(self.export_fields)
+        if analyte_name:
+            return self._by_name.get(normalize_analyte(analyte_name), empty)
+        elif analyte_code:
+            return self._by_code.get(normalize_analyte(analyte_code), empty)
+        else:
+            return self._all
+
+
+regulatory_results = RegulatoryResultStore()
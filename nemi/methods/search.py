@@ -0,0 +1,296 @@
+''' This module contains the keyword search over the method identifiers, names, summaries and
+revision PDFs. The search is done by the backend named in settings.KEYWORD_SEARCH_BACKEND,
+either Oracle Text or a local SQLite FTS5 index. The ordered list of matching method ids and
+scores is cached for each normalized keyword and data version, so paging through the results
+and repeating a search does not run the search again.
+'''
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from common.utils.cache import get_data_version, single_flight
+from common.utils.pdf_text import PdfTextStore
+from common.utils.view_utils import dictfetchall
+
+from .models import MethodSummaryVW
+
+
+MATCHES_QUERY = "SELECT mf.method_id, MAX(score(1)) method_summary_score \
+FROM nemi_data.method_fact mf, nemi_data.revision_join rj \
+WHERE mf.revision_id = rj.revision_id (+) AND \
+(CONTAINS(mf.source_method_identifier, %s, 1) > 0 \
+OR CONTAINS(rj.method_pdf, %s, 2) > 0) \
+GROUP BY mf.method_id \
+ORDER BY method_summary_score DESC, mf.method_id"
+
+# method_fact has a row for each revision of a method. The row of the current revision is used, or
+# of the latest revision if none is current.
+METHODS_QUERY = "SELECT method_id, method_number, link_to_full_method, mimetype, \
+method_official_name, method_descriptive_name, method_source, method_category \
+FROM (SELECT mf.method_id, mf.source_method_identifier method_number, mf.link_to_full_method, mf.mimetype, \
+mf.method_official_name, mf.method_descriptive_name, mf.method_source, mf.method_category, \
+ROW_NUMBER() OVER (PARTITION BY mf.method_id ORDER BY rj.revision_flag DESC NULLS LAST, mf.revision_id DESC NULLS LAST) revision_rank \
+FROM nemi_data.method_fact mf, nemi_data.revision_join rj \
+WHERE mf.revision_id = rj.revision_id (+) AND mf.method_id IN (%s)) \
+WHERE revision_rank = 1"
+
+
+def clean_keyword(k):
+    ''' Returns the Oracle Text query for keyword k. Special characters are escaped
+    and the keyword is surrounded by wildcards.
+    '''
+    special_char_pattern = re.compile(r'(?P<special>[^a-zA-Z0-9])')
+    return '%' + re.sub(special_char_pattern, r'\\\g<special>', k) + '%'
+
+
+def normalize_keyword(k):
+    ''' Returns keyword k in lower case with leading and trailing whitespace removed and other
+    whitespace collapsed to a single space. The search backends ignore these differences.
+    '''
+    return ' '.join(k.lower().split())
+
+
+class OracleTextBackend(object):
+    '''
+    Searches the Oracle Text indexes on method_fact.source_method_identifier and revision_join.method_pdf.
+    The keyword is passed as a bind variable so that Oracle can share the cursors between searches.
+    '''
+
+    def _execute(self, query, params):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params)
+            return dictfetchall(cursor)
+        finally:
+            cursor.close()
+
+    def search(self, keyword):
+        ''' Returns a list of (method_id, score) tuples for the methods matching keyword in descending score order.'''
+        query_text = clean_keyword(keyword)
+        return [(row['METHOD_ID'], row['METHOD_SUMMARY_SCORE']) for row in self._execute(MATCHES_QUERY, [query_text, query_text])]
+
+    def get_methods(self, method_ids):
+        ''' Returns a dictionary of method id to the method's keyword result columns for method_ids.
+        Column names are in upper case.
+        '''
+        query = METHODS_QUERY % ', '.join(['%s'] * len(method_ids))
+        return dict([(row['METHOD_ID'], row) for row in self._execute(query, list(method_ids))])
+
+
+class SqliteFtsBackend(object):
+    '''
+    Searches a SQLite FTS5 index of the published methods stored in the file at path (defaults to
+    settings.KEYWORD_SEARCH_INDEX_PATH). The index is built from the database on first use and rebuilt
+    whenever the data version changes. Each keyword term matches the words it is a prefix of and
+    the methods are ranked with bm25, weighting the method identifier and names over the summary
+    and PDF text.
+    '''
+
+    # Column name and bm25 weight. Columns with no weight are stored but not searched.
+    columns = (('method_id', None),
+               ('method_number', 10.0),
+               ('method_official_name', 5.0),
+               ('method_descriptive_name', 5.0),
+               ('brief_method_summary', 2.0),
+               ('pdf_text', 1.0),
+               ('link_to_full_method', None),
+               ('mimetype', None),
+               ('method_source', None),
+               ('method_category', None))
+
+    result_columns = ('method_id', 'method_number', 'link_to_full_method', 'mimetype',
+                      'method_official_name', 'method_descriptive_name', 'method_source', 'method_category')
+
+    def __init__(self, path=None):
+        self.path = path or settings.KEYWORD_SEARCH_INDEX_PATH
+        self._lock = threading.Lock()
+        self._version = None
+
+    def get_pdf_texts(self):
+        ''' Returns a dictionary of method id to the text of the method's revision PDFs, as extracted
+        by the extract_pdf_text command.
+        '''
+        return PdfTextStore().texts_by_method()
+
+    def get_documents(self):
+        ''' Returns an iterable of tuples containing the values of columns for each published method.'''
+        pdf_texts = self.get_pdf_texts()
+        qs = MethodSummaryVW.objects.values_list('method_id', 'source_method_identifier', 'method_official_name',
+                                                 'method_descriptive_name', 'brief_method_summary', 'link_to_full_method',
+                                                 'mimetype', 'method_source', 'method_category')
+        for (method_id, number, official_name, descriptive_name, summary, link, mimetype, source, category) in qs.iterator():
+            yield (method_id, number, official_name, descriptive_name, summary, pdf_texts.get(method_id, ''),
+                   link, mimetype, source, category)
+
+    def build(self, version):
+        ''' Builds the index for data version in a new file and then replaces the index file with it.'''
+        tmp_path = '%s.%s.tmp' % (self.path, uuid.uuid4().hex)
+        db = sqlite3.connect(tmp_path)
+        try:
+            column_defs = ['%s%s' % (name, '' if weight else ' UNINDEXED') for (name, weight) in self.columns]
+            db.execute('CREATE TABLE meta (version TEXT)')
+            db.execute('CREATE VIRTUAL TABLE methods USING fts5(%s)' % ', '.join(column_defs))
+            db.executemany('INSERT INTO methods VALUES (%s)' % ', '.join(['?'] * len(self.columns)), self.get_documents())
+            db.execute('INSERT INTO meta VALUES (?)', [version])
+            db.commit()
+        except Exception:
+            db.close()
+            os.remove(tmp_path)
+            raise
+        db.close()
+
+        os.replace(tmp_path, self.path)
+
+    def _index_version(self):
+        if not os.path.exists(self.path):
+            return None
+        db = sqlite3.connect(self.path)
+        try:
+            row = db.execute('SELECT version FROM meta').fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        finally:
+            db.close()
+
+        return row[0] if row else None
+
+    def _refresh(self):
+        version = get_data_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    if self._index_version() != version:
+                        self.build(version)
+                    self._version = version
+
+    def _execute(self, query, params):
+        self._refresh()
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute(query, params).fetchall()
+        finally:
+            db.close()
+
+    @staticmethod
+    def match_query(keyword):
+        ''' Returns the FTS5 query matching the words which start with each of the terms in keyword.'''
+        return ' '.join(['"%s"*' % term for term in re.findall(r'\w+', keyword.lower())])
+
+    def search(self, keyword):
+        ''' Returns a list of (method_id, score) tuples for the methods matching keyword in descending score order.
+        Scores are scaled so that the best match has a score of 100.
+        '''
+        query = self.match_query(keyword)
+        if not query:
+            return []
+
+        weights = ', '.join([str(weight or 0.0) for (name, weight) in self.columns])
+        rows = self._execute('SELECT method_id, -bm25(methods, %s) AS score FROM methods WHERE methods MATCH ? '
+                             'ORDER BY score DESC, method_id' % weights, [query])
+        if not rows:
+            return []
+
+        best = rows[0][1] or 1.0
+        return [(method_id, max(1, int(round(100 * score / best)))) for (method_id, score) in rows]
+
+    def get_methods(self, method_ids):
+        ''' Returns a dictionary of method id to the method's keyword result columns for method_ids.
+        Column names are in upper case.
+        '''
+        query = 'SELECT %s FROM methods WHERE method_id IN (%s)' % (', '.join(self.result_columns),
+                                                                   ', '.join(['?'] * len(method_ids)))
+        columns = [name.upper() for name in self.result_columns]
+        return dict([(row[0], dict(zip(columns, row))) for row in self._execute(query, list(method_ids))])
+
+
+_backends = {}
+
+
+def get_backend():
+    ''' Returns the keyword search backend named in settings.KEYWORD_SEARCH_BACKEND.'''
+    path = getattr(settings, 'KEYWORD_SEARCH_BACKEND', 'methods.search.OracleTextBackend')
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def search_keyword(keyword):
+    ''' Returns a list of (method_id, score) tuples for the methods matching keyword in descending score order.'''
+    return get_backend().search(keyword)
+
+
+def get_keyword_matches(keyword, wait=None):
+    ''' Returns the list of (method_id, score) tuples for the methods matching the normalized keyword,
+    retrieving it from the cache when possible. wait limits the number of seconds spent waiting for a
+    concurrent search for the same keyword (see single_flight).
+    '''
+    keyword = normalize_keyword(keyword)
+    cache_key = 'keyword_search:%s:%s' % (get_data_version(), hashlib.md5(keyword.encode('utf-8')).hexdigest())
+    # Concurrent searches for the same keyword share a single search.
+    return single_flight(cache_key, lambda: search_keyword(keyword), getattr(settings, 'KEYWORD_SEARCH_CACHE_TIMEOUT', 60 * 60),
+                         wait=wait)
+
+
+def get_methods(method_ids):
+    ''' Returns a dictionary of method id to the method's keyword result columns for method_ids.
+    Column names are in upper case.
+    '''
+    if not method_ids:
+        return {}
+    return get_backend().get_methods(method_ids)
+
+
+class KeywordSearchResults(object):
+    '''
+    A lazy sequence of the methods matching keyword, in descending score order, which can be
+    used with a Paginator. Each item is a dictionary with the upper case column names as keys.
+    The matching method ids are retrieved with get_keyword_matches, waiting at most wait seconds
+    for a concurrent search, and slicing retrieves the columns of only the methods within the slice.
+    '''
+
+    def __init__(self, keyword, wait=None):
+        self.keyword = keyword
+        self.wait = wait
+        self._matches = None
+
+    @property
+    def matches(self):
+        if self._matches is None:
+            self._matches = get_keyword_matches(self.keyword, wait=self.wait)
+        return self._matches
+
+    def count(self):
+        ''' Returns the number of methods matching the keyword.'''
+        return len(self.matches)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            matches = self.matches[key]
+        else:
+            matches = [self.matches[key]]
+
+        methods = get_methods([method_id for (method_id, score) in matches])
+        results = []
+        for (method_id, score) in matches:
+            if method_id in methods:
+                row = dict(methods[method_id])
+                row['METHOD_SUMMARY_SCORE'] = score
+                results.append(row)
+
+        if isinstance(key, slice):
+            return results
+        elif results:
+            return results[0]
+        else:
+            raise IndexError('KeywordSearchResults index out of range')
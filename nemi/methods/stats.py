@@ -0,0 +1,43 @@
+''' This module contains the catalog statistics, the number of methods (in total and by category,
+subcategory, media, and source) and protocols in NEMI. The statistics are computed once per data version
+and then served from the cache.
+'''
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.utils.cache import get_data_version
+from protocols.stats import get_protocol_count
+
+from .facets import method_index
+
+
+# Statistic name and method index field for each of the method counts by field.
+METHOD_COUNT_FIELDS = (('methods_by_category', 'method_category'),
+                       ('methods_by_subcategory', 'method_subcategory'),
+                       ('methods_by_media', 'media_name'),
+                       ('methods_by_source', 'method_source'))
+
+
+def compute_catalog_stats():
+    ''' Returns a dictionary containing the catalog statistics computed from the method index and the database.'''
+    index = method_index.snapshot()
+    all_methods = index.all()
+
+    stats = {'method_count': len(all_methods),
+             'protocol_count': get_protocol_count()}
+    for (name, field) in METHOD_COUNT_FIELDS:
+        stats[name] = dict([(str(value), count) for (value, count) in index.counts(field, all_methods).items() if count])
+
+    return stats
+
+
+def get_catalog_stats():
+    ''' Returns the catalog statistics for the current data version, computing them if they are not in the cache.'''
+    key = 'catalog_stats:%s' % get_data_version()
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_catalog_stats()
+        cache.set(key, stats, getattr(settings, 'DATA_VERSION_TIMEOUT', 60 * 60))
+
+    return stats
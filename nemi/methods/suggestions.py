@@ -0,0 +1,131 @@
+''' This module contains process local trigram indexes of the method identifiers, method names and
+analyte names, which are used to suggest close matches ("did you mean") when a search finds nothing.
+'''
+
+from collections import Counter
+import re
+import threading
+
+from common.utils.cache import get_data_version
+
+from .models import AnalyteCodeRel, MethodVW
+
+
+class TrigramIndex(object):
+    '''
+    Indexes terms by their trigrams so that the terms most similar to a query can be found without
+    comparing the query to every term. Terms are compared ignoring case, white space and punctuation,
+    so that "EPA 5242" is the same as "EPA 524.2". Similarity is the number of trigrams the terms share
+    divided by the number of distinct trigrams in either. Each term has a value which is returned by similar.
+    The index is loaded by calling load_entries on first use and reloaded whenever the data version changes.
+    '''
+
+    def __init__(self, load_entries):
+        '''
+        load_entries is a callable returning an iterable of (term, value) pairs.
+        '''
+        self.load_entries = load_entries
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._entries = []  # List of (trigram count, value)
+        self._postings = {}  # Trigram to list of indexes into _entries
+
+    @staticmethod
+    def trigrams(term):
+        ''' Returns the set of trigrams of term after folding.'''
+        folded = re.sub(r'[^a-z0-9]+', '', term.lower())
+        if not folded:
+            return set()
+
+        padded = '  ' + folded + ' '
+        return set([padded[i:i + 3] for i in range(len(padded) - 2)])
+
+    def load(self):
+        ''' Returns a tuple containing the list of (trigram count, value) entries and the trigram
+        postings dictionary.
+        '''
+        entries = []
+        postings = {}
+        for (term, value) in self.load_entries():
+            grams = self.trigrams(term or '')
+            if grams:
+                for gram in grams:
+                    postings.setdefault(gram, []).append(len(entries))
+                entries.append((len(grams), value))
+
+        return (entries, postings)
+
+    def _refresh(self):
+        version = get_data_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._entries, self._postings = self.load()
+                    self._version = version
+
+    def clear(self):
+        ''' Forces the index to be reloaded the next time it is used.'''
+        with self._lock:
+            self._version = None
+
+    def similar(self, query, limit=10, threshold=0.3):
+        ''' Returns a list of at most limit (value, similarity) tuples for the values of the terms whose similarity
+        to query is at least threshold, most similar first. Values with equal similarity are ordered by value.
+        '''
+        query_grams = self.trigrams(query)
+        if not query_grams:
+            return []
+
+        self._refresh()
+
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._postings.get(gram, ()))
+
+        best = {}
+        for (i, count) in shared.items():
+            (gram_count, value) = self._entries[i]
+            similarity = count / float(len(query_grams) + gram_count - count)
+            if similarity >= threshold and similarity > best.get(value, 0):
+                best[value] = similarity
+
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def _method_number_entries():
+    for (identifier, source) in MethodVW.objects.values_list('source_method_identifier', 'method_source'):
+        yield (identifier, identifier)
+        # Users often include the source in the method number.
+        yield ('%s %s' % (source, identifier), identifier)
+
+
+def _method_name_entries():
+    return ((name, name) for name in MethodVW.objects.values_list('method_descriptive_name', flat=True))
+
+
+def _analyte_name_entries():
+    return ((name, name) for name in AnalyteCodeRel.objects.values_list('analyte_name', flat=True))
+
+
+method_number_suggestions = TrigramIndex(_method_number_entries)  # Values are the method identifiers
+method_name_suggestions = TrigramIndex(_method_name_entries)
+analyte_name_suggestions = TrigramIndex(_analyte_name_entries)
+
+# Suggestion type and index
+SUGGESTION_INDEXES = (('method_number', method_number_suggestions),
+                      ('method_name', method_name_suggestions),
+                      ('analyte_name', analyte_name_suggestions))
+
+
+def get_suggestions(query, types=None, limit=10):
+    ''' Returns a list of at most limit dictionaries with value, type, and score keys for the terms most similar
+    to query, most similar first. If types is specified, only suggestions of those types are returned.
+    '''
+    suggestions = []
+    for (suggestion_type, index) in SUGGESTION_INDEXES:
+        if types is None or suggestion_type in types:
+            suggestions.extend([{'value': value, 'type': suggestion_type, 'score': round(similarity, 3)}
+                                for (value, similarity) in index.similar(query, limit)])
+
+    return sorted(suggestions, key=lambda s: -s['score'])[:limit]
@@ -1,12 +1,18 @@
 import unittest
 
-from . import test_views
+from . import test_facets, test_regulatory, test_search, test_stats, test_suggestions, test_typeahead, test_views
 
 
 def suite():
     suite1 = unittest.TestLoader().loadTestsFromModule(test_views)
+    suite2 = unittest.TestLoader().loadTestsFromModule(test_facets)
+    suite3 = unittest.TestLoader().loadTestsFromModule(test_typeahead)
+    suite4 = unittest.TestLoader().loadTestsFromModule(test_stats)
+    suite5 = unittest.TestLoader().loadTestsFromModule(test_search)
+    suite6 = unittest.TestLoader().loadTestsFromModule(test_suggestions)
+    suite7 = unittest.TestLoader().loadTestsFromModule(test_regulatory)
 
-    alltests = unittest.TestSuite([suite1])
+    alltests = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6, suite7])
 
     return alltests
 
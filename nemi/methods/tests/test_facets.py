@@ -0,0 +1,289 @@
+import json
+from unittest import mock
+
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from factory.django import DjangoModelFactory
+
+from common.models import InstrumentationRef, MediaNameDOM, Method, MethodTypeRef, PublicationSourceRel
+from common.models import SourceCitationRef, StatAnalysisRel, StatisticalAnalysisType, StatisticalItemType
+from common.models import StatisticalSourceType, StatMediaRel
+from common.utils.cache import bump_data_version, get_data_version
+
+from methods.facets import FacetIndex, RelatedFacetIndex, FACET_FIELDS, STATISTICAL_FACET_FIELDS, STATISTICAL_RELATED_FIELDS
+from methods.models import MethodVW, MethodAnalyteAllVW
+from methods.views import MethodResultsView, AnalyteResultsView, StatisticalResultsView
+
+from .test_views import MethodSummaryFactory
+
+
+class MethodAnalyteFactory(DjangoModelFactory):
+    class Meta:
+        model = MethodAnalyteAllVW
+
+    method_source_id = 1
+    source_citation_id = 1
+    method_subcategory_id = 1
+    method_category = 'CHEMICAL'
+    media_name = 'WATER'
+    method_source = 'EPA'
+    preferred = -1
+
+
+class FacetIndexTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, method_category='Chemical', method_subcategory='A1',
+                             media_name='WATER', method_source='EPA', instrumentation_id=1,
+                             method_type_desc='Type1', matrix='AQUEOUS')
+        MethodSummaryFactory(method_id=2, method_category='Chemical', method_subcategory='A2',
+                             media_name='WATER', method_source='USGS', instrumentation_id=2,
+                             method_type_desc='Type2', matrix='SOLID')
+        MethodSummaryFactory(method_id=3, method_category='Physical', method_subcategory='A2',
+                             media_name='AIR', method_source='EPA-OW', instrumentation_id=1,
+                             method_type_desc='Type1', matrix='')
+
+        bump_data_version()
+        self.index = FacetIndex(MethodVW, FACET_FIELDS)
+
+    def test_all(self):
+        self.assertEqual(self.index.all(), set([1, 2, 3]))
+
+    def test_no_filters(self):
+        self.assertEqual(self.index.filter([]), set([1, 2, 3]))
+
+    def test_exact(self):
+        self.assertEqual(self.index.filter([('media_name', 'exact', 'WATER')]), set([1, 2]))
+        self.assertEqual(self.index.filter([('instrumentation_id', 'exact', '1')]), set([1, 3]))
+        self.assertEqual(self.index.filter([('instrumentation_id', 'exact', 'abc')]), set())
+
+    def test_iexact(self):
+        self.assertEqual(self.index.filter([('method_category', 'iexact', 'chemical')]), set([1, 2]))
+
+    def test_in(self):
+        self.assertEqual(self.index.filter([('method_subcategory', 'in', ['A2', 'B1'])]), set([2, 3]))
+
+    def test_variants(self):
+        self.assertEqual(self.index.variants('method_category', ['CHEMICAL', 'physical', 'Biological']),
+                         set(['Chemical', 'Physical']))
+
+    def test_contains(self):
+        self.assertEqual(self.index.filter([('method_source', 'contains', 'EPA')]), set([1, 3]))
+
+    def test_intersection(self):
+        filters = [('method_category', 'iexact', 'Chemical'), ('method_type_desc', 'in', ['Type1'])]
+        self.assertEqual(self.index.filter(filters), set([1]))
+
+    def test_reload_on_data_version_change(self):
+        self.assertEqual(self.index.filter([('media_name', 'exact', 'AIR')]), set([3]))
+
+        MethodSummaryFactory(method_id=4, method_category='Physical', method_subcategory='A3', media_name='AIR',
+                             method_source='EPA', method_type_desc='Type1', matrix='')
+        self.assertEqual(self.index.filter([('media_name', 'exact', 'AIR')]), set([3]))
+
+        bump_data_version()
+        self.assertEqual(self.index.filter([('media_name', 'exact', 'AIR')]), set([3, 4]))
+
+    def test_snapshot_not_changed_by_reload(self):
+        snapshot = self.index.snapshot()
+
+        MethodSummaryFactory(method_id=4, method_category='Physical', method_subcategory='A3', media_name='AIR',
+                             method_source='EPA', method_type_desc='Type1', matrix='')
+        bump_data_version()
+        self.assertEqual(self.index.filter([('media_name', 'exact', 'AIR')]), set([3, 4]))
+
+        self.assertEqual(snapshot.filter([('media_name', 'exact', 'AIR')]), set([3]))
+        self.assertEqual(snapshot.facet_counts([], ['media_name'])['media_name'], {'AIR': 1, 'WATER': 2})
+
+    def test_facet_counts_checks_version_once(self):
+        with mock.patch('methods.facets.get_data_version', wraps=get_data_version) as mock_version:
+            self.index.facet_counts([('media_name', 'exact', 'WATER')])
+
+        self.assertEqual(mock_version.call_count, 1)
+
+
+class MethodResultsFacetIndexTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, method_category='Chemical', method_subcategory='A1',
+                             media_name='WATER', method_source='EPA', method_type_desc='Type1', matrix='AQUEOUS')
+        MethodSummaryFactory(method_id=2, method_category='Chemical', method_subcategory='A2',
+                             media_name='WATER', method_source='USGS', method_type_desc='Type2', matrix='SOLID')
+        MethodSummaryFactory(method_id=3, method_category='Physical', method_subcategory='A2',
+                             media_name='AIR', method_source='EPA', method_type_desc='Type1', matrix='')
+        bump_data_version()
+
+        self.factory = RequestFactory()
+
+    def _get_pks(self, params, use_facet_index):
+        view = MethodResultsView()
+        view.use_facet_index = use_facet_index
+        view.request = self.factory.get('/methods/results/', params)
+        return set(view.get_queryset().values_list('method_id', flat=True))
+
+    def test_index_matches_orm(self):
+        params_list = [{},
+                       {'category': 'chemical'},
+                       {'subcategory': ['A2']},
+                       {'media_name': 'WATER', 'source': 'EPA'},
+                       {'method_type': ['Type1', 'Type2'], 'matrix': 'SOLID'},
+                       {'category': 'Physical', 'media_name': 'WATER'}]
+
+        for params in params_list:
+            self.assertEqual(self._get_pks(params, True), self._get_pks(params, False), params)
+
+
+class MethodFacetCountViewTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, method_category='Chemical', method_subcategory='A1', source_method_identifier='100.1',
+                             media_name='WATER', method_source='EPA-OW', instrumentation_id=1, method_type_desc='Type1')
+        MethodSummaryFactory(method_id=2, method_category='Chemical', method_subcategory='A2', source_method_identifier='200.1',
+                             media_name='WATER', method_source='USGS', instrumentation_id=2, method_type_desc='Type2')
+        MethodSummaryFactory(method_id=3, method_category='Chemical', method_subcategory='A2', source_method_identifier='100.2',
+                             media_name='AIR', method_source='EPA-ORD', instrumentation_id=1, method_type_desc='Type1')
+        bump_data_version()
+
+    def _get(self, params):
+        response = self.client.get(reverse('methods-facet_counts'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_no_filters(self):
+        result = self._get({})
+
+        self.assertEqual(result['method_count'], 3)
+        self.assertEqual(result['facets']['media_name'], {'WATER': 2, 'AIR': 1})
+        self.assertEqual(result['facets']['source'], {'EPA': 2, 'USGS': 1})
+        self.assertEqual(result['facets']['instrumentation'], {'1': 2, '2': 1})
+
+    def test_filters(self):
+        result = self._get({'media_name': 'WATER', 'method_type': 'Type1'})
+
+        self.assertEqual(result['method_count'], 1)
+        # The media name counts ignore the media name choice.
+        self.assertEqual(result['facets']['media_name'], {'WATER': 1, 'AIR': 1})
+        self.assertEqual(result['facets']['method_type'], {'Type1': 1, 'Type2': 1})
+        self.assertEqual(result['facets']['subcategory'], {'A1': 1, 'A2': 0})
+
+    def test_method_number(self):
+        result = self._get({'method_number': '100'})
+
+        self.assertEqual(result['method_count'], 2)
+        self.assertEqual(result['facets']['media_name'], {'WATER': 1, 'AIR': 1})
+        self.assertEqual(result['facets']['source'], {'EPA': 2, 'USGS': 0})
+
+
+class AnalyteResultsFacetIndexTestCase(TestCase):
+
+    def setUp(self):
+        MethodAnalyteFactory(analyte_method_id=1, method_id=1, analyte_id=1, analyte_name='Nitrate', analyte_code='14797-55-8')
+        MethodAnalyteFactory(analyte_method_id=2, method_id=1, analyte_id=2, analyte_name='Lead', analyte_code='7439-92-1')
+        MethodAnalyteFactory(analyte_method_id=3, method_id=2, analyte_id=1, analyte_name='NITRATE', analyte_code='14797-55-8')
+        MethodAnalyteFactory(analyte_method_id=4, method_id=3, analyte_id=3, analyte_name='Lead (Pb)', analyte_code='PB')
+        MethodAnalyteFactory(analyte_method_id=5, method_id=3, analyte_id=4, analyte_name='Nitrate+Nitrite', analyte_code='N+N',
+                             media_name='AIR')
+        bump_data_version()
+
+        self.factory = RequestFactory()
+
+    def _get_rows(self, params, use_facet_index):
+        view = AnalyteResultsView()
+        view.use_facet_index = use_facet_index
+        view.request = self.factory.get('/methods/analyte_results/', params)
+        return sorted([(row['method_id'], row['analyte_name']) for row in view.get_queryset()])
+
+    def test_index_matches_orm(self):
+        params_list = [{'analyte_name': ['nitrate']},
+                       {'analyte_name': ['NITRATE', 'lead']},
+                       {'analyte_name': ['Lead (Pb)', 'nitrate+nitrite']},
+                       {'analyte_name': ['Nitrate+Nitrite'], 'media_name': 'WATER'},
+                       {'analyte_name': ['Nitr']},
+                       {'analyte_code': ['pb', '14797-55-8']},
+                       {'analyte_code': ['n+n']}]
+
+        for params in params_list:
+            self.assertEqual(self._get_rows(params, True), self._get_rows(params, False), params)
+
+    def test_names_not_case_folded_in_query(self):
+        view = AnalyteResultsView()
+        view.use_facet_index = True
+        view.request = self.factory.get('/methods/analyte_results/', {'analyte_name': ['nitrate']})
+        sql = str(view.get_queryset().query)
+
+        self.assertNotIn('LOWER', sql.upper())
+        self.assertIn('NITRATE', sql)
+
+    def test_many_analytes(self):
+        names = ['analyte %d' % i for i in range(500)] + ['lead']
+        self.assertEqual(self._get_rows({'analyte_name': names}, True), [(1, 'Lead')])
+
+
+class StatisticalResultsFacetIndexTestCase(TestCase):
+
+    def setUp(self):
+        item_type1 = StatisticalItemType.objects.create(stat_item_index=1, item='Item1')
+        item_type2 = StatisticalItemType.objects.create(stat_item_index=2, item='Item2')
+        citation1 = SourceCitationRef.objects.create(source_citation_id=1, item_type=item_type1)
+        citation2 = SourceCitationRef.objects.create(source_citation_id=2, item_type=item_type2)
+        source_type = StatisticalSourceType.objects.create(stat_source_index=1, source='Journal')
+        PublicationSourceRel.objects.create(source_citation_ref=citation2, source=source_type)
+
+        method_type = MethodTypeRef.objects.create(method_type_id=1, method_type_desc='Type1')
+        instrumentation = InstrumentationRef.objects.create(instrumentation_id=1, instrumentation='I')
+        methods = [Method.objects.create(method_id=method_id, source_method_identifier=str(method_id),
+                                         source_citation=citation, method_type=method_type,
+                                         instrumentation=instrumentation)
+                   for (method_id, citation) in [(1, citation1), (2, citation1), (3, citation2)]]
+
+        analysis_type1 = StatisticalAnalysisType.objects.create(stat_analysis_index=1, analysis_type='A1')
+        analysis_type2 = StatisticalAnalysisType.objects.create(stat_analysis_index=2, analysis_type='A2')
+        StatAnalysisRel.objects.create(method=methods[0], analysis_type=analysis_type1)
+        StatAnalysisRel.objects.create(method=methods[0], analysis_type=analysis_type2)
+        StatAnalysisRel.objects.create(method=methods[2], analysis_type=analysis_type2)
+        water = MediaNameDOM.objects.create(media_name='WATER', media_id=1)
+        StatMediaRel.objects.create(method=methods[1], media_name=water)
+
+        MethodSummaryFactory(method_id=1, source_citation_id=1, sam_complexity='Low', method_category='STATISTICAL')
+        MethodSummaryFactory(method_id=2, source_citation_id=1, sam_complexity='High', method_category='STATISTICAL')
+        MethodSummaryFactory(method_id=3, source_citation_id=2, sam_complexity='Low', method_category='STATISTICAL')
+        bump_data_version()
+
+        self.factory = RequestFactory()
+
+    def test_related_fields(self):
+        index = RelatedFacetIndex(MethodVW, STATISTICAL_FACET_FIELDS, STATISTICAL_RELATED_FIELDS)
+
+        self.assertEqual(index.filter([('item_type', 'exact', '1')]), set([1, 2]))
+        self.assertEqual(index.filter([('analysis_type', 'exact', '2')]), set([1, 3]))
+        self.assertEqual(index.filter([('analysis_type', 'exact', 'abc')]), set())
+        self.assertEqual(index.filter([('publication_source_type', 'exact', '1')]), set([3]))
+        self.assertEqual(index.filter([('media_emphasized', 'exact', 'WATER')]), set([2]))
+        self.assertEqual(index.filter([('special_topic', 'exact', '1')]), set())
+        self.assertEqual(index.filter([('sam_complexity', 'exact', 'Low'), ('analysis_type', 'exact', '2')]),
+                         set([1, 3]))
+
+    def _get_pks(self, params, use_facet_index):
+        view = StatisticalResultsView()
+        view.use_facet_index = use_facet_index
+        view.request = self.factory.get('/methods/statistical_results/', params)
+        return set(view.get_queryset().values_list('method_id', flat=True))
+
+    def test_index_matches_orm(self):
+        params_list = [{},
+                       {'item_type': '1'},
+                       {'complexity': 'Low'},
+                       {'analysis_type': '2', 'complexity': 'Low'},
+                       {'analysis_type': '1', 'item_type': '2'},
+                       {'publication_source_type': '1'},
+                       {'media_emphasized': 'WATER', 'category': 'STATISTICAL'},
+                       {'study_objective': '1'},
+                       {'special_topic': '1'}]
+
+        for params in params_list:
+            self.assertEqual(self._get_pks(params, True), self._get_pks(params, False), params)
+
+    def test_query_count(self):
+        self._get_pks({'analysis_type': '2'}, True)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._get_pks({'analysis_type': '2', 'complexity': 'Low', 'item_type': '1'}, True), set([1]))
@@ -0,0 +1,114 @@
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from factory.django import DjangoModelFactory
+
+from common.utils.cache import bump_data_version
+
+from methods.models import RegQueryVW
+from methods.regulatory import regulatory_results, REGULATORY_EXPORT_FIELDS
+from methods.views import ExportRegulatoryResultsView, RegulatoryResultsView
+
+
+class RegQueryFactory(DjangoModelFactory):
+    class Meta:
+        model = RegQueryVW
+
+    analyte_method_id = 1
+    method_source = 'EPA'
+    method_source_name = 'EPA'
+    method_subcategory_id = 1
+    method_category = 'CHEMICAL'
+    method_subcategory = 'INORGANIC'
+    source_citation = 'A'
+    revision_information = 'Rev 1'
+    revision_flag = 1
+    regulation_name = 'Regulation'
+    reg_location = 'Location'
+    analyte_revision_id = 1
+    dl_units = 'mg/L'
+    instrumentation_id = 1
+    analyte_id = 1
+    instrumentation = 'GC'
+    instrumentation_description = 'Gas chromatography'
+    analyte_code = '14797-55-8'
+    analyte_name = 'Nitrate'
+    preferred = -1
+    method_descriptive_name = 'name'
+    method_official_name = 'official name'
+    method_source_id = 1
+    source_citation_id = 1
+    brief_method_summary = 'summary'
+    media_name = 'WATER'
+
+
+class RegulatoryResultStoreTestCase(TestCase):
+
+    def setUp(self):
+        RegQueryFactory(revision_id=1, method_id=1, regulation='B', source_method_identifier='300.0')
+        RegQueryFactory(revision_id=2, method_id=2, regulation='A', source_method_identifier='353.2')
+        RegQueryFactory(revision_id=3, method_id=3, regulation='A', source_method_identifier='200.7',
+                        analyte_name='Nitrate-N', preferred=0)
+        RegQueryFactory(revision_id=4, method_id=4, regulation='A', source_method_identifier='100.1',
+                        method_subcategory='GENERAL')
+        RegQueryFactory(revision_id=5, method_id=5, regulation='A', source_method_identifier='524.2',
+                        analyte_name='Benzene', analyte_code='71-43-2')
+        bump_data_version()
+
+        self.factory = RequestFactory()
+
+    def _get_orm_rows(self, params):
+        view = RegulatoryResultsView()
+        view.request = self.factory.get('/methods/regulatory_results/', params)
+        return [(row.method_id, row.analyte_name) for row in view.get_queryset()]
+
+    def _get_store_rows(self, params):
+        view = RegulatoryResultsView()
+        view.request = self.factory.get('/methods/regulatory_results/', params)
+        return [(row.method_id, row.analyte_name) for row in view.get_object_list()]
+
+    def test_get(self):
+        self.assertEqual([row.method_id for row in regulatory_results.get(analyte_name=' NITRATE').rows], [2, 1])
+        self.assertEqual([row.method_id for row in regulatory_results.get(analyte_code='14797-55-8').rows], [2, 1])
+        self.assertEqual([row.method_id for row in regulatory_results.get().rows], [3, 2, 5, 1])
+        self.assertEqual(regulatory_results.get(analyte_name='Lead').rows, [])
+
+        export_rows = regulatory_results.get(analyte_name='benzene').export_rows
+        self.assertEqual(len(export_rows), 1)
+        self.assertEqual(export_rows[0][:2], (5, 'A'))
+        self.assertEqual(len(export_rows[0]), len(REGULATORY_EXPORT_FIELDS) + 1)
+
+    def test_store_matches_orm(self):
+        params_list = [{},
+                       {'analyte_name': 'nitrate'},
+                       {'analyte_name': 'Nitrate-N'},
+                       {'analyte_code': '14797-55-8'},
+                       {'analyte_code': '71-43-2'},
+                       {'analyte_name': 'Lead'}]
+
+        for params in params_list:
+            self.assertEqual(self._get_store_rows(params), self._get_orm_rows(params), params)
+
+    def test_reload_on_data_version_change(self):
+        regulatory_results.get()
+        RegQueryFactory(revision_id=6, method_id=6, regulation='C', source_method_identifier='1.1')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(regulatory_results.get(analyte_name='Nitrate').rows), 2)
+
+        bump_data_version()
+        self.assertEqual(len(regulatory_results.get(analyte_name='Nitrate').rows), 3)
+
+    def test_views(self):
+        response = self.client.get(reverse('methods-regulatory_results'), {'analyte_name': 'Nitrate'})
+        self.assertEqual([row.method_id for row in response.context['data']], [2, 1])
+
+        response = self.client.post(reverse('methods-export_regulatory_results') + '?analyte_name=Nitrate',
+                                    {'method_id': ['1', '5']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_values(self):
+        view = ExportRegulatoryResultsView()
+        view.request = self.factory.post('/methods/export_regulatory?analyte_name=Nitrate', {'method_id': ['1', '5']})
+        fields = ['method_id'] + list(view.export_fields)
+
+        self.assertEqual(view.get_export_values(['1', '5'], fields),
+                         list(view.get_queryset().filter(method_id__in=['1', '5']).values_list(*fields)))
@@ -0,0 +1,254 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.paginator import Paginator
+from django.test import override_settings, RequestFactory, SimpleTestCase, TestCase
+
+from common.utils.cache import bump_data_version
+
+from methods.models import MethodSummaryVW
+from methods.search import clean_keyword, get_keyword_matches, normalize_keyword, search_keyword, KeywordSearchResults
+from methods.search import MATCHES_QUERY, METHODS_QUERY, OracleTextBackend, SqliteFtsBackend
+from methods.views import KeywordResultsView
+
+
+class CleanKeywordTestCase(SimpleTestCase):
+
+    def test_with_no_special_characters(self):
+        self.assertEqual(clean_keyword('nitrate'), '%nitrate%')
+
+    def test_with_quote(self):
+        self.assertEqual(clean_keyword("ni'trate"), "%ni\\'trate%")
+
+    def test_with_double_quotes(self):
+        self.assertEqual(clean_keyword('ni"trate"chloride'), '%ni\\"trate\\"chloride%')
+
+    def test_with_percent(self):
+        self.assertEqual(clean_keyword('ni%trate%chloride'), '%ni\\%trate\\%chloride%')
+
+    def test_with_dash(self):
+        self.assertEqual(clean_keyword('ni-trate'), '%ni\\-trate%')
+
+    def test_with_plus_sign(self):
+        self.assertEqual(clean_keyword('ni+trate'), '%ni\\+trate%')
+
+    def test_with_comma_and_quote(self):
+        self.assertEqual(clean_keyword("ni,tr'ate"), "%ni\\,tr\\'ate%")
+
+
+class NormalizeKeywordTestCase(SimpleTestCase):
+
+    def test_normalize_keyword(self):
+        self.assertEqual(normalize_keyword('nitrate'), 'nitrate')
+        self.assertEqual(normalize_keyword(' Nitrate  Nitrite\t'), 'nitrate nitrite')
+
+
+def _mock_cursor(description, rows):
+    cursor = mock.Mock()
+    cursor.description = [(name,) for name in description]
+    cursor.fetchall.return_value = rows
+    return cursor
+
+
+class SearchKeywordTestCase(SimpleTestCase):
+
+    @mock.patch('methods.search.connection')
+    def test_search_keyword(self, mock_connection):
+        cursor = _mock_cursor(['METHOD_ID', 'METHOD_SUMMARY_SCORE'], [(2, 90), (1, 80)])
+        mock_connection.cursor.return_value = cursor
+
+        self.assertEqual(search_keyword("ni'trate"), [(2, 90), (1, 80)])
+        cursor.execute.assert_called_once_with(MATCHES_QUERY, ["%ni\\'trate%", "%ni\\'trate%"])
+        cursor.close.assert_called_once_with()
+
+    @mock.patch('methods.search.connection')
+    def test_get_methods(self, mock_connection):
+        cursor = _mock_cursor(['METHOD_ID', 'METHOD_NUMBER'], [(2, '353.2'), (1, '524.2')])
+        mock_connection.cursor.return_value = cursor
+
+        self.assertEqual(OracleTextBackend().get_methods([1, 2]),
+                         {1: {'METHOD_ID': 1, 'METHOD_NUMBER': '524.2'}, 2: {'METHOD_ID': 2, 'METHOD_NUMBER': '353.2'}})
+        cursor.execute.assert_called_once_with(METHODS_QUERY % '%s, %s', [1, 2])
+        self.assertIn('revision_rank = 1', METHODS_QUERY)
+
+
+class GetKeywordMatchesTestCase(SimpleTestCase):
+
+    def setUp(self):
+        bump_data_version()
+
+    @mock.patch('methods.search.search_keyword')
+    def test_cached_by_normalized_keyword(self, mock_search):
+        mock_search.return_value = [(2, 90), (1, 80)]
+
+        self.assertEqual(get_keyword_matches('Nitrate'), [(2, 90), (1, 80)])
+        self.assertEqual(get_keyword_matches('  nitrate '), [(2, 90), (1, 80)])
+        mock_search.assert_called_once_with('nitrate')
+
+        get_keyword_matches('nitrite')
+        self.assertEqual(mock_search.call_count, 2)
+
+    @mock.patch('methods.search.search_keyword')
+    def test_invalidated_by_data_version(self, mock_search):
+        mock_search.return_value = [(2, 90)]
+
+        get_keyword_matches('nitrate')
+        bump_data_version()
+        get_keyword_matches('nitrate')
+        self.assertEqual(mock_search.call_count, 2)
+
+
+class KeywordSearchResultsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('methods.search.get_keyword_matches')
+        self.mock_matches = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_matches.return_value = [(method_id, 100 - method_id) for method_id in range(1, 46)]
+
+        patcher = mock.patch('methods.search.connection')
+        self.mock_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_count(self):
+        results = KeywordSearchResults('nitrate')
+        self.assertEqual(results.count(), 45)
+        self.assertEqual(len(results), 45)
+        self.mock_matches.assert_called_once_with('nitrate', wait=None)
+        self.mock_connection.cursor.assert_not_called()
+
+    def test_slice(self):
+        cursor = _mock_cursor(['METHOD_ID', 'METHOD_NUMBER'], [(22, '22'), (21, '21')])
+        self.mock_connection.cursor.return_value = cursor
+
+        results = KeywordSearchResults('nitrate')
+        self.assertEqual(results[20:22], [{'METHOD_ID': 21, 'METHOD_NUMBER': '21', 'METHOD_SUMMARY_SCORE': 79},
+                                          {'METHOD_ID': 22, 'METHOD_NUMBER': '22', 'METHOD_SUMMARY_SCORE': 78}])
+        cursor.execute.assert_called_once_with(mock.ANY, [21, 22])
+
+    def test_slice_past_end(self):
+        results = KeywordSearchResults('nitrate')
+        self.assertEqual(results[60:80], [])
+        self.mock_connection.cursor.assert_not_called()
+
+    def test_index(self):
+        cursor = _mock_cursor(['METHOD_ID'], [(45,)])
+        self.mock_connection.cursor.return_value = cursor
+
+        results = KeywordSearchResults('nitrate')
+        self.assertEqual(results[-1], {'METHOD_ID': 45, 'METHOD_SUMMARY_SCORE': 55})
+        cursor.execute.assert_called_once_with(mock.ANY, [45])
+
+    def test_paginator(self):
+        cursor = _mock_cursor(['METHOD_ID'], [(41,), (42,), (43,), (44,), (45,)])
+        self.mock_connection.cursor.return_value = cursor
+
+        paginator = Paginator(KeywordSearchResults('nitrate'), 20)
+        self.assertEqual(paginator.num_pages, 3)
+        page = paginator.page(3)
+        self.assertEqual([r['METHOD_ID'] for r in page.object_list], [41, 42, 43, 44, 45])
+        cursor.execute.assert_called_once_with(mock.ANY, [41, 42, 43, 44, 45])
+
+
+class KeywordResultsViewTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @mock.patch('methods.views.KeywordSearchResults')
+    def test_results(self, mock_results):
+        mock_results.return_value.count.return_value = 2
+        mock_results.return_value.__len__ = mock.Mock(return_value=2)
+        mock_results.return_value.__getitem__ = mock.Mock(return_value=[{'METHOD_ID': 1}, {'METHOD_ID': 2}])
+
+        request = self.factory.get('/methods/keyword/', {'keyword_search_field': 'nitrate'})
+        response = KeywordResultsView.as_view()(request)
+
+        mock_results.assert_called_once_with('nitrate', wait=None)
+        self.assertEqual(response.context_data['total_found'], 2)
+        self.assertEqual(list(response.context_data['results'].object_list), [{'METHOD_ID': 1}, {'METHOD_ID': 2}])
+
+    @mock.patch('methods.views.KeywordSearchResults')
+    def test_blank_keyword(self, mock_results):
+        request = self.factory.get('/methods/keyword/', {'keyword_search_field': '  '})
+        response = KeywordResultsView.as_view()(request)
+
+        self.assertTrue(response.context_data['error'])
+        mock_results.assert_not_called()
+
+
+class SqliteFtsBackendTestCase(TestCase):
+
+    def setUp(self):
+        bump_data_version()
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.backend = SqliteFtsBackend(os.path.join(tmp_dir, 'index.sqlite3'))
+
+        pdf_text_settings = self.settings(PDF_TEXT_DIR=os.path.join(tmp_dir, 'pdf_text'))
+        pdf_text_settings.enable()
+        self.addCleanup(pdf_text_settings.disable)
+
+        defaults = {'revision_id': 1,
+                    'revision_information': 'Rev 1',
+                    'method_source_id': 1,
+                    'source_citation_id': 1,
+                    'method_subcategory_id': 1,
+                    'method_source': 'EPA',
+                    'method_category': 'CHEMICAL'}
+        MethodSummaryVW.objects.create(method_id=1, source_method_identifier='524.2',
+                                       method_official_name='Volatile organic compounds',
+                                       method_descriptive_name='VOCs by purge and trap GC/MS',
+                                       brief_method_summary='Nitrate is not measured', mimetype='application/pdf',
+                                       **defaults)
+        MethodSummaryVW.objects.create(method_id=2, source_method_identifier='353.2',
+                                       method_official_name='Nitrate-nitrite nitrogen',
+                                       method_descriptive_name='Nitrate by colorimetry',
+                                       brief_method_summary='Cadmium reduction', link_to_full_method='http://a.b',
+                                       **defaults)
+
+    def test_match_query(self):
+        self.assertEqual(SqliteFtsBackend.match_query("Nitrate-nitrite"), '"nitrate"* "nitrite"*')
+        self.assertEqual(SqliteFtsBackend.match_query('"*'), '')
+
+    def test_search(self):
+        self.assertEqual(self.backend.search('nitrate'), [(2, 100), (1, mock.ANY)])
+        self.assertEqual(self.backend.search('524'), [(1, 100)])
+        self.assertEqual(self.backend.search('cadm'), [(2, 100)])
+        self.assertEqual(self.backend.search('purge trap'), [(1, 100)])
+        self.assertEqual(self.backend.search('chloride'), [])
+        self.assertEqual(self.backend.search('--'), [])
+
+    def test_get_methods(self):
+        methods = self.backend.get_methods([2])
+        self.assertEqual(methods, {2: {'METHOD_ID': 2,
+                                       'METHOD_NUMBER': '353.2',
+                                       'LINK_TO_FULL_METHOD': 'http://a.b',
+                                       'MIMETYPE': '',
+                                       'METHOD_OFFICIAL_NAME': 'Nitrate-nitrite nitrogen',
+                                       'METHOD_DESCRIPTIVE_NAME': 'Nitrate by colorimetry',
+                                       'METHOD_SOURCE': 'EPA',
+                                       'METHOD_CATEGORY': 'CHEMICAL'}})
+
+    def test_rebuilt_when_data_version_changes(self):
+        self.assertEqual(self.backend.search('chloride'), [])
+
+        MethodSummaryVW.objects.filter(method_id=1).update(method_descriptive_name='Chloride')
+        self.assertEqual(self.backend.search('chloride'), [])
+
+        bump_data_version()
+        self.assertEqual(self.backend.search('chloride'), [(1, 100)])
+
+    def test_pdf_texts(self):
+        with mock.patch.object(self.backend, 'get_pdf_texts', return_value={1: 'Sulfate by ion chromatography'}):
+            self.assertEqual(self.backend.search('sulfate'), [(1, 100)])
+
+    @override_settings(KEYWORD_SEARCH_BACKEND='methods.search.SqliteFtsBackend')
+    def test_keyword_results(self):
+        with mock.patch('methods.search._backends', {'methods.search.SqliteFtsBackend': self.backend}):
+            results = KeywordSearchResults('Nitrate')
+            self.assertEqual(results.count(), 2)
+            self.assertEqual([r['METHOD_NUMBER'] for r in results[0:20]], ['353.2', '524.2'])
@@ -0,0 +1,67 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from common.models import SourceCitationRef, StatisticalItemType
+from common.utils.cache import bump_data_version
+
+from methods.stats import get_catalog_stats
+
+from .test_views import MethodSummaryFactory
+
+
+class CatalogStatsTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, method_category='CHEMICAL', method_subcategory='Organic',
+                             media_name='WATER', method_source='EPA')
+        MethodSummaryFactory(method_id=2, method_category='CHEMICAL', method_subcategory='Inorganic',
+                             media_name='AIR', method_source='USGS')
+        MethodSummaryFactory(method_id=3, method_category='STATISTICAL', method_subcategory='Sampling',
+                             media_name='WATER', method_source='EPA')
+
+        item_type = StatisticalItemType.objects.create(stat_item_index=1, item='Item')
+        SourceCitationRef.objects.create(source_citation_id=1, item_type=item_type, citation_type='PROTOCOL')
+        SourceCitationRef.objects.create(source_citation_id=2, item_type=item_type, citation_type='PROTOCOL')
+        SourceCitationRef.objects.create(source_citation_id=3, item_type=item_type, citation_type='METHOD')
+
+        bump_data_version()
+
+    def test_get_catalog_stats(self):
+        stats = get_catalog_stats()
+
+        self.assertEqual(stats['method_count'], 3)
+        self.assertEqual(stats['protocol_count'], 2)
+        self.assertEqual(stats['methods_by_category'], {'CHEMICAL': 2, 'STATISTICAL': 1})
+        self.assertEqual(stats['methods_by_subcategory'], {'Organic': 1, 'Inorganic': 1, 'Sampling': 1})
+        self.assertEqual(stats['methods_by_media'], {'WATER': 2, 'AIR': 1})
+        self.assertEqual(stats['methods_by_source'], {'EPA': 2, 'USGS': 1})
+
+    def test_stats_are_cached_per_data_version(self):
+        get_catalog_stats()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_stats()['method_count'], 3)
+
+        MethodSummaryFactory(method_id=4, method_category='CHEMICAL', method_subcategory='Organic')
+        self.assertEqual(get_catalog_stats()['method_count'], 3)
+
+        bump_data_version()
+        self.assertEqual(get_catalog_stats()['method_count'], 4)
+
+    def test_views(self):
+        response = self.client.get(reverse('methods-catalog_stats'))
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['method_count'], 3)
+
+        response = self.client.get(reverse('methods-method_count'))
+        self.assertJSONEqual(response.content.decode('utf-8'), {'method_count': '3'})
+
+        response = self.client.get(reverse('protocols-protocol_count'))
+        self.assertJSONEqual(response.content.decode('utf-8'), {'protocol_count': '2'})
+
+    @mock.patch('methods.stats.compute_catalog_stats')
+    def test_protocol_count_does_not_use_method_index(self, mock_compute):
+        response = self.client.get(reverse('protocols-protocol_count'))
+        self.assertJSONEqual(response.content.decode('utf-8'), {'protocol_count': '2'})
+        mock_compute.assert_not_called()
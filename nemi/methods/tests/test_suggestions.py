@@ -0,0 +1,99 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from common.utils.cache import bump_data_version
+
+from methods.suggestions import get_suggestions, TrigramIndex
+from reference.models import AnalyteRef, AnalyteCodeRel as ReferenceAnalyteCodeRel
+
+from .test_views import MethodSummaryFactory
+
+
+class TrigramIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.entries = [('524.2', '524.2'), ('EPA 524.2', '524.2'), ('524.3', '524.3'), ('200.7', '200.7'),
+                        ('Nitrate by colorimetry', 'Nitrate by colorimetry')]
+        self.index = TrigramIndex(lambda: self.entries)
+        bump_data_version()
+
+    def test_trigrams(self):
+        self.assertEqual(TrigramIndex.trigrams('A-1'), set(['  a', ' a1', 'a1 ']))
+        self.assertEqual(TrigramIndex.trigrams('EPA 524.2'), TrigramIndex.trigrams('epa5242'))
+        self.assertEqual(TrigramIndex.trigrams('.-'), set())
+
+    def test_similar(self):
+        self.assertEqual(self.index.similar('EPA 5242'), [('524.2', 1.0)])
+        self.assertEqual([value for (value, similarity) in self.index.similar('524')], ['524.2', '524.3'])
+        self.assertEqual(self.index.similar('nitrate colorimetry')[0][0], 'Nitrate by colorimetry')
+        self.assertEqual(self.index.similar('xyz'), [])
+        self.assertEqual(self.index.similar(''), [])
+
+    def test_limit_and_threshold(self):
+        self.assertEqual(len(self.index.similar('524', limit=1)), 1)
+        self.assertEqual(self.index.similar('524', threshold=0.9), [])
+
+    def test_refresh(self):
+        self.assertEqual(self.index.similar('300.0'), [])
+
+        self.entries.append(('300.0', '300.0'))
+        self.assertEqual(self.index.similar('300.0'), [])
+
+        bump_data_version()
+        self.assertEqual(self.index.similar('300.0'), [('300.0', 1.0)])
+
+
+class SuggestionsTestCase(TestCase):
+
+    def setUp(self):
+        analyte = AnalyteRef.objects.create(analyte_id=1, analyte_code='14797-55-8')
+        ReferenceAnalyteCodeRel.objects.create(analyte=analyte, analyte_name='Nitrate', analyte_code='14797-55-8',
+                                               preferred=-1)
+
+        MethodSummaryFactory(method_id=1, source_method_identifier='524.2', method_source='EPA',
+                             method_descriptive_name='VOCs by GC/MS')
+        MethodSummaryFactory(method_id=2, source_method_identifier='353.2', method_source='EPA',
+                             method_descriptive_name='Nitrate by colorimetry')
+        bump_data_version()
+
+    def test_get_suggestions(self):
+        self.assertEqual(get_suggestions('EPA 5242'), [{'value': '524.2', 'type': 'method_number', 'score': 1.0}])
+        self.assertEqual(get_suggestions('nitrat', ['analyte_name']),
+                         [{'value': 'Nitrate', 'type': 'analyte_name', 'score': mock.ANY}])
+        self.assertEqual([s['type'] for s in get_suggestions('nitrate')], ['analyte_name', 'method_name'])
+
+    def test_suggestion_view(self):
+        response = self.client.get(reverse('methods-suggestions'), {'q': 'EPA 5242'})
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'suggestions': [{'value': '524.2', 'type': 'method_number', 'score': 1.0}]})
+
+        response = self.client.get(reverse('methods-suggestions'), {'q': 'nitrate', 'type': 'method_name'})
+        self.assertEqual([s['value'] for s in json.loads(response.content.decode('utf-8'))['suggestions']],
+                         ['Nitrate by colorimetry'])
+
+        response = self.client.get(reverse('methods-suggestions'), {'q': 'nitrate', 'type': 'bad'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('methods-suggestions'), {'q': 'nitrate', 'limit': 'a'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_method_number_results(self):
+        response = self.client.get(reverse('methods-results'), {'method_number': '5242', 'category': 'CHEMICAL'})
+        self.assertEqual([s['value'] for s in response.context['suggestions']], ['524.2'])
+        self.assertEqual(response.context['suggestions'][0]['url'], '?method_number=524.2&category=CHEMICAL')
+
+        response = self.client.get(reverse('methods-results'), {'method_number': '524.2'})
+        self.assertNotIn('suggestions', response.context)
+
+    @mock.patch('methods.views.KeywordSearchResults')
+    def test_empty_keyword_results(self, mock_results):
+        mock_results.return_value.count.return_value = 0
+        mock_results.return_value.__len__ = mock.Mock(return_value=0)
+        mock_results.return_value.__getitem__ = mock.Mock(return_value=[])
+
+        response = self.client.get(reverse('methods-keyword'), {'keyword_search_field': 'colorimetery', 'page': '2'})
+        self.assertEqual(response.context['suggestions'][0]['value'], 'Nitrate by colorimetry')
+        self.assertEqual(response.context['suggestions'][0]['url'], '?keyword_search_field=Nitrate+by+colorimetry')
+        self.assertContains(response, 'Did you mean')
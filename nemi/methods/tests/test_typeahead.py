@@ -0,0 +1,90 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from common.utils.cache import bump_data_version
+
+from methods.models import AnalyteCodeVW
+from methods.typeahead import NgramIndex
+from reference.models import AnalyteRef, AnalyteCodeRel as ReferenceAnalyteCodeRel
+
+from .test_views import MethodSummaryFactory
+
+
+class NgramIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.entries = [('Nitrate', 1), ('Nitrite', 2), ('Nitrate+Nitrite', 3), ('Ammonia as N', 4),
+                        ('Total nitrogen', 5), ('Lead', 6), ('Lead', 7), ('NITRATE', 8)]
+        self.index = NgramIndex(lambda: self.entries)
+        bump_data_version()
+
+    def test_empty_query(self):
+        self.assertEqual(self.index.search(''), [])
+
+    def test_prefix_before_infix(self):
+        self.assertEqual(self.index.search('nitr'), [1, 8, 3, 2, 5])
+
+    def test_short_query(self):
+        self.assertEqual(self.index.search('ni'), [1, 8, 3, 2, 4, 5])
+        self.assertEqual(self.index.search('l'), [6, 7, 5])
+
+    def test_infix(self):
+        self.assertEqual(self.index.search('TRIT'), [3, 2])
+        self.assertEqual(self.index.search('as n'), [4])
+        self.assertEqual(self.index.search('xyz'), [])
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('nitr', limit=2), [1, 8])
+        self.assertEqual(self.index.search('lead', limit=1), [6])
+
+    def test_refresh(self):
+        self.assertEqual(self.index.search('copper'), [])
+
+        self.entries.append(('Copper', 9))
+        self.assertEqual(self.index.search('copper'), [])
+
+        bump_data_version()
+        self.assertEqual(self.index.search('copper'), [9])
+
+
+class TypeaheadViewsTestCase(TestCase):
+
+    def setUp(self):
+        # The analyte_code_rel table is created from the reference app's model when testing.
+        for (analyte_id, name, code) in [(1, 'Nitrate', '14797-55-8'),
+                                         (2, 'Sodium nitrate', '7631-99-4'),
+                                         (3, 'Lead "total"', '7439-92-1')]:
+            analyte = AnalyteRef.objects.create(analyte_id=analyte_id, analyte_code=code)
+            ReferenceAnalyteCodeRel.objects.create(analyte=analyte, analyte_name=name, analyte_code=code, preferred=-1)
+        AnalyteCodeVW.objects.create(analyte_analyte_id=1, analyte_analyte_code='14797-55-8')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=2, analyte_analyte_code='7631-99-4')
+
+        MethodSummaryFactory(method_id=1, source_method_identifier='200.7')
+        MethodSummaryFactory(method_id=2, source_method_identifier='1200.7')
+        MethodSummaryFactory(method_id=3, source_method_identifier='300.0')
+        bump_data_version()
+
+    def _get(self, url_name, params):
+        response = self.client.get(reverse(url_name), params)
+        return json.loads(response.content.decode('utf-8'))['values_list']
+
+    def test_analyte_names(self):
+        self.assertEqual(self._get('methods-analyte_select', {'kind': 'name', 'selection': 'NITRATE'}),
+                         [['Nitrate', '14797-55-8'], ['Sodium nitrate', '7631-99-4']])
+        self.assertEqual(self._get('methods-analyte_select', {'kind': 'name', 'selection': 'lead'}),
+                         [['Lead "total"', '7439-92-1']])
+
+    def test_analyte_codes(self):
+        self.assertEqual(self._get('methods-analyte_select', {'kind': 'code', 'selection': '-99-'}), ['7631-99-4'])
+
+    def test_method_numbers(self):
+        self.assertEqual(self._get('methods-method_number_select', {'selection': '200'}), ['200.7', '1200.7'])
+        self.assertEqual(self._get('methods-method_number_select', {'selection': ''}), [])
+
+    def test_method_number_results(self):
+        response = self.client.get(reverse('methods-results'), {'method_number': '200', 'format': 'json'})
+        result = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(sorted([row['method_id'] for row in result['results']]), [1, 2])
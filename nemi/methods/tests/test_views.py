@@ -3,13 +3,29 @@ Created on Mar 13, 2012
 
 @author: mbucknel
 '''
-
-from django.test import SimpleTestCase, TestCase
+import datetime
+import hashlib
+from io import StringIO
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.http import FileResponse, Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
 from factory.django import DjangoModelFactory
 from rest_framework.test import APIRequestFactory
 
-from methods.models import MethodVW
-from methods.views import _clean_name, _clean_keyword, MethodRestViewSet
+from common.utils.cache import bump_data_version, bump_method_versions, single_flight
+from common.utils.pdf_cache import PdfFileCache
+
+from methods.models import MethodVW, MethodAnalyteAllVW, AnalyteCodeVW
+from methods.views import _analyte_synonyms, _clean_name, AnalyteResultsView, ExportMethodResultsView, MethodRestViewSet, \
+    MethodResultsView, MethodSummaryView, RegulatoryResultsView, StatisticalResultsView
+from methods.views import MethodPdfView, RevisionPdfView, RevisionPdfOnlineView, RevisionPdfStagingView, SearchBootstrapView
 
 
 class CleanNameTestCase(SimpleTestCase):
@@ -43,53 +59,6 @@ class CleanNameTestCase(SimpleTestCase):
         self.assertEqual('a343_ABC', _clean_name(name))
 
 
-class CleanKeywordTestCase(SimpleTestCase):
-
-    def test_with_no_special_characters(self):
-        keyword = 'nitrate'
-        self.assertEqual(_clean_keyword(keyword), '%nitrate%')
-
-    def test_with_quote(self):
-        keyword = "ni'trate"
-        self.assertEqual(_clean_keyword(keyword), "%ni''trate%")
-
-    def test_with_two_quotes(self):
-        keyword = "ni'trate'chloride"
-        self.assertEqual(_clean_keyword(keyword), "%ni''trate''chloride%")
-
-    def test_with_double_quotes(self):
-        keyword = 'ni"trate'
-        self.assertEqual(_clean_keyword(keyword), '%ni""trate%')
-
-    def test_with_two_double_quotes(self):
-        keyword = 'ni"trate"chloride'
-        self.assertEqual(_clean_keyword(keyword), '%ni""trate""chloride%')
-
-    def test_with_percent(self):
-        keyword = 'ni%trate'
-        self.assertEqual(_clean_keyword(keyword), '%ni\%trate%')
-
-    def test_with_two_percents(self):
-        keyword = 'ni%trate%chloride'
-        self.assertEqual(_clean_keyword(keyword), '%ni\%trate\%chloride%')
-
-    def test_with_percent_and_quote_chars(self):
-        keyword = 'ni"tr%ate'
-        self.assertEqual(_clean_keyword(keyword), '%ni""tr\%ate%')
-
-    def test_with_dash(self):
-        keyword = 'ni-trate'
-        self.assertEqual(_clean_keyword(keyword), '%ni\-trate%')
-
-    def test_with_plus_sign(self):
-        keyword = 'ni+trate'
-        self.assertEqual(_clean_keyword(keyword), '%ni\+trate%')
-
-    def test_with_comma_and_quote(self):
-        keyword = "ni,tr'ate"
-        self.assertEqual(_clean_keyword(keyword), "%ni\,tr''ate%")
-
-
 class MethodSummaryFactory(DjangoModelFactory):
     class Meta:
         model = MethodVW
@@ -188,3 +157,507 @@ class MethodSummaryRestViewSetTestCase(TestCase):
 
         self.assertEqual(result.count(), 0)
 
+
+
+class MethodResultsJsonTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, method_source='USGS', method_category='A', method_subcategory='A1')
+        MethodSummaryFactory(method_id=2, method_source='EPA', method_category='A', method_subcategory='A1')
+        MethodSummaryFactory(method_id=3, method_source='USGS', method_category='A', method_subcategory='A1')
+        MethodSummaryFactory(method_id=4, method_source='ASTM', method_category='A', method_subcategory='A2')
+        MethodSummaryFactory(method_id=5, method_source='EPA', method_category='A', method_subcategory='A2',
+                             date_loaded=datetime.date(2015, 1, 1))
+        MethodSummaryFactory(method_id=6, method_source='USGS', method_category='B', method_subcategory='B1')
+        bump_data_version()
+
+    def _get(self, params, view_class=MethodResultsView):
+        view = view_class.as_view()
+        return view(RequestFactory().get(reverse('methods-results'), dict(params, format='json')))
+
+    def _get_all_pages(self, params, view_class=MethodResultsView):
+        method_ids = []
+        response = json.loads(self._get(params, view_class).content.decode('utf-8'))
+        method_ids.extend([row['method_id'] for row in response['results']])
+        while response['next']:
+            response = json.loads(self._get(dict(params, after=response['next']), view_class).content.decode('utf-8'))
+            method_ids.extend([row['method_id'] for row in response['results']])
+        return method_ids
+
+    def test_offset(self):
+        response = self._get({'sort': 'method_source', 'limit': 2, 'offset': 2})
+        result = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(result['count'], 6)
+        self.assertEqual([row['method_id'] for row in result['results']], [5, 1])
+        self.assertEqual(set(result['results'][0].keys()),
+                         set(MethodResultsView.field_names + ['method_id']))
+
+    def test_keyset_pagination(self):
+        self.assertEqual(self._get_all_pages({'sort': 'method_source', 'limit': 2}), [4, 2, 5, 1, 3, 6])
+        self.assertEqual(self._get_all_pages({'sort': '-method_source', 'limit': 4}), [1, 3, 6, 2, 5, 4])
+        self.assertEqual(self._get_all_pages({'sort': 'method_source', 'limit': 2, 'category': 'A'}), [4, 2, 5, 1, 3])
+
+    def test_keyset_pagination_with_nulls(self):
+        class TestView(MethodResultsView):
+            json_fields = ['date_loaded']
+
+        self.assertEqual(self._get_all_pages({'sort': 'date_loaded', 'limit': 2}, TestView), [5, 1, 2, 3, 4, 6])
+        self.assertEqual(self._get_all_pages({'sort': '-date_loaded', 'limit': 1, 'category': 'A'}, TestView), [5, 1, 2, 3, 4])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self._get({'sort': 'method_pdf'}).status_code, 400)
+        self.assertEqual(self._get({'limit': 'a'}).status_code, 400)
+        self.assertEqual(self._get({'after': 'abc'}).status_code, 400)
+
+    def test_shared_results_are_data(self):
+        shared = []
+
+        def shared_single_flight(*args, **kwargs):
+            shared.append(single_flight(*args, **kwargs))
+            return shared[-1]
+
+        with mock.patch('common.views.single_flight', side_effect=shared_single_flight):
+            response = self._get({'sort': 'method_source', 'limit': 2})
+            self.assertEqual(json.loads(shared[0]), json.loads(response.content.decode('utf-8')))
+
+            request = RequestFactory().post(reverse('methods-export_results'), {'method_id': ['1', '2']})
+            response = ExportMethodResultsView.as_view()(request, export='tsv')
+            self.assertEqual(response.status_code, 200)
+            (headings, rows) = shared[1]
+            self.assertEqual(headings[0], 'Method Id')
+            self.assertEqual(sorted([row[0] for row in rows]), [1, 2])
+
+            response = ExportMethodResultsView.as_view()(request, export='tsv')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(shared[2], shared[1])
+
+
+class AnalyteResultsJsonTestCase(TestCase):
+
+    def setUp(self):
+        # The same analyte in two media of method 1, which only differ in their analyte_method_id.
+        for (analyte_method_id, method_id, media_name) in ((1, 1, 'WATER'), (2, 1, 'SOIL'), (3, 2, 'WATER')):
+            MethodAnalyteAllVW.objects.create(analyte_method_id=analyte_method_id, method_id=method_id,
+                                              method_source_id=1, source_citation_id=1, method_subcategory_id=1,
+                                              method_category='CHEMICAL', media_name=media_name, method_source='EPA',
+                                              analyte_id=1, analyte_name='Nitrate', preferred=-1)
+        bump_data_version()
+
+    def _get(self, params):
+        view = AnalyteResultsView.as_view()
+        response = view(RequestFactory().get(reverse('methods-analyte_results'), dict(params, format='json')))
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_keyset_pagination(self):
+        response = self._get({'limit': 1})
+        self.assertEqual(response['count'], 3)
+        rows = response['results']
+        while response['next']:
+            response = self._get({'limit': 1, 'after': response['next']})
+            rows.extend(response['results'])
+
+        self.assertEqual([(row['method_id'], row['media_name']) for row in rows],
+                         [(1, 'WATER'), (1, 'SOIL'), (2, 'WATER')])
+
+
+class StatisticalResultsJsonTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, author='Smith', method_official_name='Trends', publication_year=2001)
+        MethodSummaryFactory(method_id=2, author='Jones', method_official_name='Power', publication_year=1999)
+        MethodSummaryFactory(method_id=3, author='Smith', method_official_name='Sampling', publication_year=2005)
+        bump_data_version()
+
+    def _get(self, params):
+        view = StatisticalResultsView.as_view()
+        response = view(RequestFactory().get(reverse('methods-statistical_results'), dict(params, format='json')))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_fields(self):
+        response = self._get({'sort': 'author'})
+
+        self.assertEqual(response['count'], 3)
+        self.assertEqual(response['results'][0],
+                         {'method_id': 2, 'author': 'Jones', 'method_official_name': 'Power', 'publication_year': 1999,
+                          'method_source': 'USGS', 'link_to_full_method': ''})
+
+    def test_keyset_pagination(self):
+        response = self._get({'sort': 'author', 'limit': 1})
+        rows = response['results']
+        while response['next']:
+            response = self._get({'sort': 'author', 'limit': 1, 'after': response['next']})
+            rows.extend(response['results'])
+
+        self.assertEqual([row['method_id'] for row in rows], [2, 1, 3])
+
+
+class RegulatoryResultsJsonTestCase(SimpleTestCase):
+
+    def test_json_not_supported(self):
+        view = RegulatoryResultsView.as_view()
+        response = view(RequestFactory().get(reverse('methods-regulatory_results'),
+                                             {'analyte_name': 'Nitrate', 'format': 'json'}))
+
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalyteSynonymsTestCase(TestCase):
+
+    def setUp(self):
+        AnalyteCodeVW.objects.create(analyte_analyte_id=1, analyte_analyte_code='14797-55-8', ac_analyte_name='Nitrate')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=2, analyte_analyte_code='14797-55-8', ac_analyte_name='Nitrate ion')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=3, analyte_analyte_code='NO3', ac_analyte_name='NITRATE')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=4, analyte_analyte_code='NO3', ac_analyte_name='Nitrate as N')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=5, analyte_analyte_code='7439-92-1', ac_analyte_name='Lead')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=6, analyte_analyte_code='7439-92-1', ac_analyte_name='Plumbum')
+
+        for i in range(20):
+            AnalyteCodeVW.objects.create(analyte_analyte_id=100 + i, analyte_analyte_code='CODE%d' % i,
+                                         ac_analyte_name='Analyte %d' % i)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(_analyte_synonyms([]), [])
+
+    def test_synonyms(self):
+        analytes = [{'analyte_name': 'nitrate', 'analyte_code': '14797-55-8'},
+                    {'analyte_name': 'Plumbum', 'analyte_code': 'PB'},
+                    {'analyte_name': 'Unknown', 'analyte_code': 'XXX'}]
+
+        with self.assertNumQueries(1):
+            result = _analyte_synonyms(analytes)
+
+        self.assertEqual(result, [['NITRATE', 'Nitrate', 'Nitrate as N', 'Nitrate ion'],
+                                  ['Lead', 'Plumbum'],
+                                  []])
+
+    def test_query_count_is_constant(self):
+        analytes = [{'analyte_name': 'Analyte %d' % i, 'analyte_code': 'code%d' % i} for i in range(20)]
+
+        with self.assertNumQueries(1):
+            result = _analyte_synonyms(analytes)
+
+        self.assertEqual(result, [['Analyte %d' % i] for i in range(20)])
+
+
+class MethodSummaryViewCacheTestCase(SimpleTestCase):
+
+    def _get_object(self, method_id):
+        view = MethodSummaryView()
+        view.kwargs = {'method_id': method_id}
+        return view.get_object()
+
+    def test_summary_is_cached_until_method_changes(self):
+        with mock.patch.object(MethodSummaryView, 'get_summary', side_effect=[{'summary': 1}, {'summary': 2}, {'summary': 3}]) as mock_get_summary:
+            self.assertEqual(self._get_object(1), {'summary': 1})
+            self.assertEqual(self._get_object(1), {'summary': 1})
+            self.assertEqual(mock_get_summary.call_count, 1)
+
+            self.assertEqual(self._get_object(2), {'summary': 2})
+
+            bump_method_versions([1])
+            self.assertEqual(self._get_object(1), {'summary': 3})
+            self.assertEqual(self._get_object(2), {'summary': 2})
+            self.assertEqual(mock_get_summary.call_count, 3)
+
+
+class SearchBootstrapViewTestCase(TestCase):
+
+    def setUp(self):
+        MethodSummaryFactory(method_id=1, method_category='CHEMICAL', method_subcategory='Organic', method_type_desc='Type1',
+                             media_name='WATER', method_source='EPA-OW', instrumentation_id=1, instrumentation_description='GC')
+        MethodSummaryFactory(method_id=2, method_category='Chemical', method_subcategory='Inorganic', method_type_desc='Type2',
+                             media_name='AIR', method_source='USGS', instrumentation_id=2, instrumentation_description='ICP')
+        MethodSummaryFactory(method_id=3, method_category='STATISTICAL', method_subcategory='Sampling', method_type_desc='Type3',
+                             media_name='WATER', method_source='EPA-OW', instrumentation_id=1, instrumentation_description='GC')
+        bump_data_version()
+
+    def test_response(self):
+        response = self.client.get(reverse('methods-search_bootstrap'))
+        result = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertEqual(set(result['choices'].keys()), set([name for (name, view_class) in SearchBootstrapView.choice_views]))
+        self.assertEqual(result['choices']['media_name'], [{'value': 'AIR', 'display_value': 'Air'},
+                                                           {'value': 'WATER', 'display_value': 'Water'}])
+        self.assertEqual(result['choices']['instrumentation'], [{'value': '1', 'display_value': 'GC'},
+                                                                {'value': '2', 'display_value': 'ICP'}])
+        self.assertEqual(result['subcategories_by_category'], {'chemical': ['Inorganic', 'Organic'],
+                                                               'statistical': ['Sampling']})
+        self.assertEqual(result['method_types_by_category'], {'chemical': ['Type1', 'Type2'],
+                                                              'statistical': ['Type3']})
+
+    def test_null_values(self):
+        rows = [('CHEMICAL', 'Organic'), (None, 'Organic'), ('CHEMICAL', None), ('STATISTICAL', '')]
+        with mock.patch('methods.views.MethodVW.objects') as mock_objects:
+            mock_objects.values_list.return_value.distinct.return_value = rows
+            self.assertEqual(SearchBootstrapView().get_category_map('method_subcategory'), {'chemical': ['Organic']})
+
+    def test_version(self):
+        version = json.loads(self.client.get(reverse('methods-search_bootstrap')).content.decode('utf-8'))['version']
+        self.assertEqual(json.loads(self.client.get(reverse('methods-search_bootstrap')).content.decode('utf-8'))['version'], version)
+
+        MethodSummaryFactory(method_id=4, method_category='Physical', method_subcategory='Physical', method_type_desc='Type1')
+        bump_data_version()
+        self.assertNotEqual(json.loads(self.client.get(reverse('methods-search_bootstrap')).content.decode('utf-8'))['version'], version)
+
+
+@override_settings(PDF_CACHE_DIR=None)
+class DatabasePdfViewTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @mock.patch('methods.views.connection')
+    def test_method_pdf(self, mock_connection):
+        cursor = mock_connection.cursor.return_value
+        cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('SOURCE_METHOD_IDENTIFIER',), ('REVISION_ID',), ('PDF_CHECKSUM',),
+                              ('CHECKSUM_VALID',)]
+        cursor.fetchall.return_value = [('application/pdf', b'%PDF-1.4 data', 'EPA 524.2', 1, None, 0)]
+
+        response = MethodPdfView.as_view()(self.factory.get('/methods/method_pdf/1/'), method_id='1')
+
+        self.assertEqual(cursor.execute.call_args[0],
+                         ('SELECT t.mimetype, t.method_pdf, t.source_method_identifier, t.revision_id, c.pdf_checksum, '
+                          'CASE WHEN b.checksum IS NULL THEN 0 WHEN t.method_pdf IS NULL THEN 1 '
+                          'WHEN dbms_lob.getlength(t.method_pdf) = b.pdf_size AND dbms_lob.compare(t.method_pdf, b.pdf, '
+                          '2000, greatest(b.pdf_size - 1999, 1), greatest(b.pdf_size - 1999, 1)) = 0 THEN 1 '
+                          'ELSE 0 END checksum_valid '
+                          'from nemi_data.method_summary_vw t, nemi_data.revision_join c, nemi_data.pdf_blob b '
+                          'where t.revision_id = c.revision_id (+) and b.checksum (+) = c.pdf_checksum '
+                          'and t.method_id=%s', ['1']))
+        self.assertEqual(response['Content-Disposition'], 'attachment;filename=EPA_524_2.pdf')
+        self.assertEqual(response['Content-Length'], '13')
+        # A pdf without a stored checksum has a weak ETag.
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+
+        cursor.close.assert_not_called()
+        response.close()
+        cursor.close.assert_called_once_with()
+
+    @mock.patch('methods.views.connection')
+    def test_missing_revision_pdf(self, mock_connection):
+        cursor = mock_connection.cursor.return_value
+        cursor.description = [('MIMETYPE',), ('METHOD_PDF',)]
+        cursor.fetchall.return_value = []
+
+        with self.assertRaises(Http404):
+            RevisionPdfStagingView.as_view()(self.factory.get('/methods/revision_pdf_staging/1/'), revision_id='1')
+
+        self.assertEqual(cursor.execute.call_args[0],
+                         ('SELECT t.mimetype, t.method_pdf, t.pdf_insert_date, t.last_update_date, t.pdf_checksum, '
+                          'CASE WHEN b.checksum IS NULL THEN 0 WHEN t.method_pdf IS NULL THEN 1 '
+                          'WHEN dbms_lob.getlength(t.method_pdf) = b.pdf_size AND dbms_lob.compare(t.method_pdf, b.pdf, '
+                          '2000, greatest(b.pdf_size - 1999, 1), greatest(b.pdf_size - 1999, 1)) = 0 THEN 1 '
+                          'ELSE 0 END checksum_valid '
+                          'from nemi_data.revision_join_stg t, nemi_data.pdf_blob b '
+                          'where b.checksum (+) = t.pdf_checksum and t.revision_id=%s', ['1']))
+        cursor.close.assert_called_once_with()
+
+    @mock.patch('methods.views.connection')
+    def test_shared_revision_pdf(self, mock_connection):
+        checksum = hashlib.sha256(b'%PDF-1.4 data').hexdigest()
+        cursor = mock_connection.cursor.return_value
+        cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('PDF_INSERT_DATE',), ('LAST_UPDATE_DATE',), ('PDF_CHECKSUM',),
+                              ('CHECKSUM_VALID',)]
+        cursor.fetchall.return_value = [('application/pdf', None, None, datetime.date(2020, 1, 2), checksum, 1)]
+        cursor.fetchone.return_value = (b'%PDF-1.4 data',)
+
+        response = RevisionPdfOnlineView.as_view()(self.factory.get('/methods/revision_pdf_online/1/'), revision_id='1')
+
+        self.assertEqual(cursor.execute.call_args[0], ('SELECT pdf from nemi_data.pdf_blob where checksum=%s', [checksum]))
+        # The shared pdf's checksum is known before it is sent.
+        self.assertEqual(response['ETag'], '"%s"' % checksum)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+        cursor.close.assert_called_once_with()
+
+    @mock.patch('methods.views.connection')
+    def test_stale_checksum(self, mock_connection):
+        cursor = mock_connection.cursor.return_value
+        cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('PDF_INSERT_DATE',), ('LAST_UPDATE_DATE',), ('PDF_CHECKSUM',),
+                              ('CHECKSUM_VALID',)]
+        cursor.fetchall.return_value = [('application/pdf', b'%PDF-1.4 new data', None, None,
+                                         hashlib.sha256(b'%PDF-1.4 data').hexdigest(), 0)]
+
+        response = RevisionPdfOnlineView.as_view()(self.factory.get('/methods/revision_pdf_online/1/'), revision_id='1')
+
+        # The copy replaced without changing the checksum is sent, not the shared pdf.
+        self.assertEqual(cursor.execute.call_count, 1)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 new data')
+        response.close()
+
+    @mock.patch('methods.views.connection')
+    def test_missing_shared_pdf(self, mock_connection):
+        cursor = mock_connection.cursor.return_value
+        cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('PDF_INSERT_DATE',), ('LAST_UPDATE_DATE',), ('PDF_CHECKSUM',),
+                              ('CHECKSUM_VALID',)]
+        cursor.fetchall.return_value = [('application/pdf', b'%PDF-1.4 data', None, None,
+                                         hashlib.sha256(b'%PDF-1.4 data').hexdigest(), 1)]
+        cursor.fetchone.return_value = None
+
+        response = RevisionPdfOnlineView.as_view()(self.factory.get('/methods/revision_pdf_online/1/'), revision_id='1')
+
+        # The shared pdf was removed after the row was read, so the row's own copy is sent.
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+
+    @mock.patch('methods.views.connection')
+    def test_conditional_revision_pdf(self, mock_connection):
+        checksum = hashlib.sha256(b'%PDF-1.4 data').hexdigest()
+        cursor = mock_connection.cursor.return_value
+        cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('PDF_INSERT_DATE',), ('LAST_UPDATE_DATE',), ('PDF_CHECKSUM',),
+                              ('CHECKSUM_VALID',)]
+        cursor.fetchall.return_value = [('application/pdf', None, datetime.date(2020, 1, 2),
+                                         datetime.datetime(2020, 3, 4, 5, 6, 7), checksum, 1)]
+        cursor.fetchone.return_value = (b'%PDF-1.4 data',)
+
+        response = RevisionPdfView.as_view()(self.factory.get('/methods/revision_pdf/1/'), revision_id='1')
+        etag = '"%s"' % checksum
+        self.assertEqual(response['Last-Modified'], 'Wed, 04 Mar 2020 05:06:07 GMT')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+
+        response = RevisionPdfView.as_view()(self.factory.get('/methods/revision_pdf/1/', HTTP_IF_NONE_MATCH=etag),
+                                             revision_id='1')
+        self.assertEqual(response.status_code, 304)
+
+        # A pdf replaced on the same day has a new checksum.
+        cursor.fetchall.return_value = [('application/pdf', None, datetime.date(2020, 1, 2),
+                                         datetime.datetime(2020, 3, 4, 5, 6, 7), hashlib.sha256(b'new').hexdigest(), 1)]
+        cursor.fetchone.return_value = (b'%PDF-1.4 new data',)
+        response = RevisionPdfView.as_view()(self.factory.get('/methods/revision_pdf/1/', HTTP_IF_NONE_MATCH=etag),
+                                             revision_id='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 new data')
+        response.close()
+
+        # Without a checksum the dates are not trusted on their own, but with the size they give a weak ETag.
+        cursor.fetchall.return_value = [('application/pdf', b'%PDF-1.4 data', datetime.date(2020, 1, 2),
+                                         datetime.date(2020, 3, 4), None, 0)]
+        response = RevisionPdfView.as_view()(
+            self.factory.get('/methods/revision_pdf/1/', HTTP_IF_MODIFIED_SINCE='Wed, 04 Mar 2020 05:06:07 GMT'),
+            revision_id='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+        weak_etag = response['ETag']
+        self.assertTrue(weak_etag.startswith('W/"'))
+        response.close()
+
+        response = RevisionPdfView.as_view()(self.factory.get('/methods/revision_pdf/1/', HTTP_IF_NONE_MATCH=weak_etag),
+                                             revision_id='1')
+        self.assertEqual(response.status_code, 304)
+
+        # A weak ETag does not allow a download to be resumed.
+        response = RevisionPdfView.as_view()(
+            self.factory.get('/methods/revision_pdf/1/', HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=weak_etag),
+            revision_id='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+
+        # A copy replaced on the same day with one of a different size has a new ETag.
+        cursor.fetchall.return_value = [('application/pdf', b'%PDF-1.4 new data', datetime.date(2020, 1, 2),
+                                         datetime.date(2020, 3, 4), None, 0)]
+        response = RevisionPdfView.as_view()(self.factory.get('/methods/revision_pdf/1/', HTTP_IF_NONE_MATCH=weak_etag),
+                                             revision_id='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], weak_etag)
+        response.close()
+
+
+class CachedPdfViewTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        patcher = mock.patch('methods.views.connection')
+        self.cursor = patcher.start().cursor.return_value
+        self.addCleanup(patcher.stop)
+        self.cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('SOURCE_METHOD_IDENTIFIER',), ('REVISION_ID',), ('PDF_CHECKSUM',),
+                              ('CHECKSUM_VALID',)]
+
+    def _get(self, pdf, **headers):
+        self.cursor.fetchall.return_value = [('application/pdf', None, '524.2', 1, hashlib.sha256(pdf).hexdigest(), 1)]
+        self.cursor.fetchone.return_value = (pdf,)
+        with self.settings(PDF_CACHE_DIR=self.directory):
+            return MethodPdfView.as_view()(self.factory.get('/methods/method_pdf/1/', **headers), method_id='1')
+
+    def test_cached(self):
+        response = self._get(b'%PDF-1.4 data')
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Length'], '13')
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha256(b'%PDF-1.4 data').hexdigest())
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+        self.cursor.close.assert_called_once_with()
+
+        # The pdf is not read from the database once it is cached.
+        response = self._get(b'%PDF-1.4 data')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+        self.assertEqual(self.cursor.fetchone.call_count, 1)
+
+        response = self._get(b'%PDF-1.4 data', HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF')
+        response.close()
+
+    def test_not_cached_without_checksum(self):
+        self.cursor.fetchall.return_value = [('application/pdf', b'%PDF-1.4 data', '524.2', 1, None, 0)]
+        with self.settings(PDF_CACHE_DIR=self.directory):
+            response = MethodPdfView.as_view()(self.factory.get('/methods/method_pdf/1/'), method_id='1')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+        response.close()
+
+        self.assertEqual([name for (directory, dirnames, filenames) in os.walk(self.directory) for name in filenames], [])
+
+    def test_cached_shared_pdf(self):
+        checksum = hashlib.sha256(b'%PDF-1.4 data').hexdigest()
+        self.cursor.description = [('MIMETYPE',), ('METHOD_PDF',), ('PDF_INSERT_DATE',), ('LAST_UPDATE_DATE',),
+                                   ('PDF_CHECKSUM',), ('CHECKSUM_VALID',)]
+        self.cursor.fetchall.return_value = [('application/pdf', None, None, None, checksum, 1)]
+        self.cursor.fetchone.return_value = (b'%PDF-1.4 data',)
+
+        for revision_id in ('1', '2'):
+            with self.settings(PDF_CACHE_DIR=self.directory):
+                response = RevisionPdfStagingView.as_view()(self.factory.get('/methods/revision_pdf_staging/'),
+                                                            revision_id=revision_id)
+            self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 data')
+            response.close()
+
+        # Revisions sharing a cached pdf do not read it from the database.
+        self.assertEqual(self.cursor.fetchone.call_count, 1)
+
+    def test_changed(self):
+        self._get(b'%PDF-1.4 data').close()
+
+        response = self._get(b'%PDF-1.4 new data')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 new data')
+        response.close()
+
+    def test_warm_pdf_cache(self):
+        self.cursor.fetchall.side_effect = [[(1,), (2,)],
+                                            [('application/pdf', None, '524.2', 1, hashlib.sha256(b'%PDF-1').hexdigest(), 1)],
+                                            [('application/pdf', None, '525.2', 2, hashlib.sha256(b'%PDF-2').hexdigest(), 1)]]
+        self.cursor.fetchone.side_effect = [(b'%PDF-1',), (b'%PDF-2',)]
+        with self.settings(PDF_CACHE_DIR=self.directory):
+            with mock.patch('methods.management.commands.warm_pdf_cache.connection') as mock_connection:
+                mock_connection.cursor.return_value = self.cursor
+                call_command('warm_pdf_cache', '--methods-only', stdout=StringIO())
+
+        self.assertEqual(self.cursor.execute.call_args_list[0][0][0],
+                         'SELECT t.method_id from nemi_data.method_summary_vw t, nemi_data.revision_join c '
+                         'where t.revision_id = c.revision_id and c.pdf_checksum is not null')
+        cache = PdfFileCache(self.directory)
+        for pdf in (b'%PDF-1', b'%PDF-2'):
+            cache.open(hashlib.sha256(pdf).hexdigest()).close()
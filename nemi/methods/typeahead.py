@@ -0,0 +1,135 @@
+''' This module contains process local n-gram indexes used to answer the typeahead (autocomplete)
+requests for analyte names, analyte codes and method identifiers without querying the database.
+'''
+
+from bisect import bisect_left
+from collections import defaultdict
+import threading
+
+from common.utils.cache import get_data_version
+
+from .models import AnalyteCodeRel, AnalyteCodeVW, MethodVW
+
+
+class NgramIndex(object):
+    '''
+    Indexes terms by their case folded n-grams so that the terms containing a string can be found
+    without scanning all of the terms. Each term has a list of values which are returned by search.
+    The index is loaded by calling load_entries on first use and reloaded whenever the data version changes.
+    '''
+
+    def __init__(self, load_entries, n=3):
+        '''
+        load_entries is a callable returning an iterable of (term, value) pairs.
+        '''
+        self.load_entries = load_entries
+        self.n = n
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._terms = []  # Sorted list of case folded terms
+        self._values = {}  # Case folded term to list of values
+        self._postings = {}  # n-gram to set of indexes into _terms
+
+    def _ngrams(self, term):
+        return set([term[i:i + self.n] for i in range(len(term) - self.n + 1)])
+
+    def load(self):
+        ''' Returns a tuple containing the sorted list of terms, the term to values dictionary and the
+        n-gram postings dictionary.
+        '''
+        values = defaultdict(list)
+        for (term, value) in self.load_entries():
+            if term:
+                term_values = values[term.lower()]
+                if value not in term_values:
+                    term_values.append(value)
+
+        terms = sorted(values.keys())
+        postings = defaultdict(set)
+        for (i, term) in enumerate(terms):
+            for gram in self._ngrams(term):
+                postings[gram].add(i)
+
+        return (terms, dict(values), dict(postings))
+
+    def _refresh(self):
+        version = get_data_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._terms, self._values, self._postings = self.load()
+                    self._version = version
+
+    def clear(self):
+        ''' Forces the index to be reloaded the next time it is used.'''
+        with self._lock:
+            self._version = None
+
+    def _matching_terms(self, query):
+        if len(query) < self.n:
+            return [term for term in self._terms if query in term]
+
+        grams = sorted(self._ngrams(query), key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = set(self._postings.get(grams[0], ()))
+        for gram in grams[1:]:
+            candidates &= self._postings.get(gram, set())
+            if not candidates:
+                break
+
+        return [self._terms[i] for i in candidates if query in self._terms[i]]
+
+    def search(self, query, limit=None):
+        ''' Returns the values of the terms containing query, ignoring case. Values of terms which start
+        with query are returned first, then the values of the other matching terms. Within each group
+        the values are ordered by term. If limit is specified, at most limit values are returned.
+        '''
+        query = query.lower()
+        if not query:
+            return []
+
+        self._refresh()
+
+        # The terms starting with query are contiguous in the sorted term list.
+        prefix_terms = []
+        i = bisect_left(self._terms, query)
+        while i < len(self._terms) and self._terms[i].startswith(query):
+            prefix_terms.append(self._terms[i])
+            if limit is not None and len(prefix_terms) >= limit:
+                break
+            i += 1
+
+        if limit is None or len(prefix_terms) < limit:
+            infix_terms = sorted([term for term in self._matching_terms(query) if not term.startswith(query)])
+        else:
+            infix_terms = []
+
+        result = []
+        for term in prefix_terms + infix_terms:
+            result.extend(self._values[term])
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+
+        return result
+
+
+def _analyte_name_entries():
+    return ((name, [name, code]) for (name, code) in AnalyteCodeRel.objects.values_list('analyte_name', 'analyte_code'))
+
+
+def _analyte_code_entries():
+    return ((code, code) for code in AnalyteCodeVW.objects.values_list('analyte_analyte_code', flat=True).distinct())
+
+
+def _method_identifier_entries():
+    return MethodVW.objects.values_list('source_method_identifier', 'method_id')
+
+
+def _method_number_entries():
+    return ((identifier, identifier) for identifier in MethodVW.objects.values_list('source_method_identifier', flat=True))
+
+
+analyte_name_index = NgramIndex(_analyte_name_entries)
+analyte_code_index = NgramIndex(_analyte_code_entries)
+method_identifier_index = NgramIndex(_method_identifier_entries)  # Values are method ids
+method_number_index = NgramIndex(_method_number_entries)  # Values are the method identifiers
@@ -70,9 +70,21 @@ urlpatterns = [
     url(r'^analyte_select/$',
         views.AnalyteSelectView.as_view(),
         name='methods-analyte_select'),
+    url(r'^method_number_select/$',
+        views.MethodNumberSelectView.as_view(),
+        name='methods-method_number_select'),
     url(r'^method_count/$',
         views.MethodCountView.as_view(),
         name='methods-method_count'),
+    url(r'^catalog_stats/$',
+        views.CatalogStatsView.as_view(),
+        name='methods-catalog_stats'),
+    url(r'^suggestions/$',
+        views.SuggestionView.as_view(),
+        name='methods-suggestions'),
+    url(r'^facet_counts/$',
+        views.MethodFacetCountView.as_view(),
+        name='methods-facet_counts'),
     url(r'^media_name/$',
         views.MediaNameView.as_view(),
         name='methods-media_name'),
@@ -110,6 +122,10 @@ urlpatterns = [
         views.StatSpecialTopicsView.as_view(),
         name='methods-stat_special_topics'),
 
+    url(r'^search_bootstrap/$',
+        views.SearchBootstrapView.as_view(),
+        name='methods-search_bootstrap'),
+
     url(r'^wqp/(?P<op>[A-Za-z0-9-_/]*)/$',
         views.WQPWebProxyView.as_view(),
         name='wqp_proxy'),
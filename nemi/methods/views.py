@@ -2,16 +2,24 @@
 NEMI methods pages.
 '''
 
+from collections import defaultdict
+import datetime
 from functools import cmp_to_key
+import hashlib
+import json
 import re
 
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connection
-from django.db.models import Q
-from django.http import HttpResponse, Http404
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.urls import reverse_lazy
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.views.generic import View, ListView, DetailView
 from django.views.generic.list import MultipleObjectMixin
 from django.views.generic.edit import TemplateResponseMixin
@@ -22,13 +30,23 @@ from rest_framework.viewsets import ReadOnlyModelViewSet
 from common.models import InstrumentationRef, StatisticalDesignObjective, StatisticalItemType, AnalyteSummaryVW
 from common.models import StatisticalAnalysisType, StatisticalSourceType, MediaNameDOM, StatisticalTopics
 from common.models import StatAnalysisRel, SourceCitationRef, StatDesignRel, StatMediaRel, StatTopicRel, Method
+from common.utils.blobs import BlobStream, blob_length
+from common.utils.cache import get_method_version
+from common.utils.pdf_cache import PdfFileCache
+from common.utils.query_budget import get_remaining_time
 from common.utils.view_utils import dictfetchall, xls_response, tsv_response
-from common.views import PdfView, ChoiceJsonView, SimpleWebProxyView
+from common.views import PdfView, ChoiceJsonView, SimpleWebProxyView, SingleFlightMixin
 
 from domhelp.views import FieldHelpMixin
 
+from .facets import method_index, method_analyte_index, statistical_method_index
 from .models import MethodVW, MethodSummaryVW, AnalyteCodeRel, MethodAnalyteAllVW, AnalyteCodeVW, RevisionSummaryVw, RegQueryVW
+from .regulatory import regulatory_results, EXCLUDED_SUBCATEGORIES, REGULATORY_EXPORT_FIELDS, REGULATORY_ORDERING
+from .search import KeywordSearchResults
 from .serializers import MethodVWSerializer
+from .stats import get_catalog_stats
+from .suggestions import get_suggestions, SUGGESTION_INDEXES
+from .typeahead import analyte_code_index, analyte_name_index, method_identifier_index, method_number_index
 
 
 def _analyte_value_qs(method_id):
@@ -51,6 +69,38 @@ def _analyte_value_qs(method_id):
                                'prec_acc_conc_used').distinct()
 
 
+def _analyte_synonyms(analytes):
+    ''' Returns a list containing the synonyms of each analyte in analytes, a list of dictionaries
+    containing analyte_name and analyte_code. The synonyms of an analyte are the names of all
+    analyte codes which have the analyte's name or code (ignoring case), ordered by name.
+    The synonyms for all of the analytes are retrieved with a single query.
+    '''
+    if not analytes:
+        return []
+
+    names = set([a['analyte_name'].lower() for a in analytes])
+    codes = set([a['analyte_code'].lower() for a in analytes])
+
+    matching_codes = AnalyteCodeVW.objects.annotate(
+        name_lower=Lower('ac_analyte_name'), code_lower=Lower('analyte_analyte_code')).filter(
+        Q(name_lower__in=names) | Q(code_lower__in=codes)).values('analyte_analyte_code')
+    synonym_rows = list(AnalyteCodeVW.objects.filter(analyte_analyte_code__in=matching_codes).order_by(
+        'ac_analyte_name').values_list('analyte_analyte_code', 'ac_analyte_name'))
+
+    codes_by_name = defaultdict(set)
+    codes_by_code = defaultdict(set)
+    for (code, name) in synonym_rows:
+        codes_by_name[(name or '').lower()].add(code)
+        codes_by_code[code.lower()].add(code)
+
+    result = []
+    for a in analytes:
+        analyte_codes = codes_by_name.get(a['analyte_name'].lower(), set()) | codes_by_code.get(a['analyte_code'].lower(), set())
+        result.append([name for (code, name) in synonym_rows if code in analyte_codes])
+
+    return result
+
+
 def _clean_name(name):
     ''' Returns name with characters removed or substituted to produce a name suitable
     to be saved as a file with an extension.
@@ -64,30 +114,34 @@ def _clean_name(name):
     return result
 
 
-def _clean_keyword(k):
-    ''' Returns keyword with quotes properly escaped and the keyword surrounded by brackets. T
+def _suggestions_with_urls(suggestions, query, param):
+    ''' Returns suggestions with the url key added to each. The url is the query string of the
+    QueryDict query with param set to the suggested value and page removed.
     '''
-    double_pattern = re.compile(r'(?P<double>[\'\"])')
-    special_char_pattern = re.compile(r'(?P<special>[^a-zA-Z0-9\'\"])')
-    result = re.sub(special_char_pattern, r'\\\g<special>', k)
-    result = re.sub(double_pattern, r'\g<double>\g<double>', result)
+    result = []
+    for suggestion in suggestions:
+        suggestion_query = query.copy()
+        suggestion_query[param] = suggestion['value']
+        suggestion_query.pop('page', None)
+        result.append(dict(suggestion, url='?' + suggestion_query.urlencode()))
 
-    return '%' + result + '%'
+    return result
 
 
 class AnalyteSelectView(View):
     ''' Extends the standard view to implement a view which returns json data containing
-    a list of the matching analyte values in values_list key.
+    a list of the matching analyte values in values_list key. Analyte codes and names matching
+    the selection are retrieved from the typeahead indexes, with those starting with the
+    selection first, and at most max_results are returned.
     '''
 
+    max_results = 100
+
     def get(self, request, *args, **kwargs):
         if request.GET:
             if request.GET['kind'] == 'code':
                 if request.GET.get('selection', ''):
-                    qs = AnalyteCodeVW.objects.filter(
-                        analyte_analyte_code__icontains=request.GET['selection']).order_by('analyte_analyte_code').values_list('analyte_analyte_code',
-                                                                                                                               flat=True).distinct()
-                    qs_str = '[' + ', '.join('"%s"' % v for v in qs) + ']'
+                    values_list = analyte_code_index.search(request.GET['selection'], self.max_results)
                 else:
                     return HttpResponse('{"values_list" : ""}', content_type="application/json")
 
@@ -98,28 +152,75 @@ class AnalyteSelectView(View):
                     qs = MethodAnalyteAllVW.objects.all().filter(method_category__iexact=category)
                     if subcategory != '':
                         qs = qs.filter(method_subcategory__iexact=subcategory)
+                    values_list = [list(v) for v in qs.values_list('analyte_name', 'analyte_code').distinct().order_by('analyte_name')]
 
                 elif 'selection' in request.GET:
-                    qs = AnalyteCodeRel.objects.filter(analyte_name__icontains=request.GET['selection'])
+                    values_list = analyte_name_index.search(request.GET['selection'], self.max_results)
 
                 else:
                     return HttpResponse('{"values_list" : ""}', content_type="application/json")
 
-                qs = qs.values_list('analyte_name', 'analyte_code').distinct().order_by('analyte_name')
-                qs_str = '[' + ', '.join('["%s","%s"]' % (n, c) for (n, c) in qs) + ']'
-
-            return HttpResponse('{"values_list" : ' + qs_str + '}', content_type="application/json")
+            return HttpResponse(json.dumps({'values_list': values_list}), content_type="application/json")
 
         return HttpResponse('{"values_list" : ""}', content_type="application/json")
 
 
+class MethodNumberSelectView(View):
+    ''' Extends the standard view to return json data containing a list of the method numbers (source
+    method identifiers) matching the selection parameter in the values_list key. Method numbers starting
+    with the selection are first and at most max_results are returned.
+    '''
+
+    max_results = 100
+
+    def get(self, request, *args, **kwargs):
+        selection = request.GET.get('selection', '')
+        values_list = method_number_index.search(selection, self.max_results) if selection else []
+
+        return HttpResponse(json.dumps({'values_list': values_list}), content_type="application/json")
+
+
 class MethodCountView(View):
     '''
     Extends the standard View to retrieve and return as a json object the total number of methods in the datastore.
     '''
 
     def get(self, request, *args, **kwargs):
-        return HttpResponse('{"method_count" : "' + str(MethodVW.objects.count()) + '"}', content_type="application/json")
+        return HttpResponse('{"method_count" : "' + str(get_catalog_stats()['method_count']) + '"}', content_type="application/json")
+
+
+class CatalogStatsView(View):
+    '''
+    Extends the standard View to return the catalog statistics as a json object.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(json.dumps(get_catalog_stats()), content_type="application/json")
+
+
+class SuggestionView(View):
+    '''
+    Extends the standard View to return as a json object the method identifiers, method names,
+    and analyte names most similar to the q parameter, as a list in the suggestions key. The type
+    parameter, which may be repeated, limits the suggestions to method_number, method_name, or analyte_name.
+    The results pages show suggestions themselves, so this view is only provided for API clients.
+    '''
+
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        types = request.GET.getlist('type') or None
+        valid_types = [suggestion_type for (suggestion_type, index) in SUGGESTION_INDEXES]
+        if types is not None and not set(types).issubset(valid_types):
+            return HttpResponseBadRequest('Invalid type. Valid types are %s' % ', '.join(valid_types))
+        try:
+            limit = min(int(request.GET.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid limit')
+
+        suggestions = get_suggestions(request.GET.get('q', ''), types, limit) if limit > 0 else []
+        return HttpResponse(json.dumps({'suggestions': suggestions}), content_type="application/json")
 
 
 class MediaNameView(ChoiceJsonView):
@@ -264,6 +365,53 @@ class StatSpecialTopicsView(ChoiceJsonView):
         return [(str(m.stat_topic_index), m.stat_special_topic) for m in StatisticalTopics.objects.all()]
 
 
+class SearchBootstrapView(ChoiceJsonView):
+    '''
+    Extends the ChoiceJsonView to return all of the choice lists used by the search forms as a single json object.
+    The object contains a choices object with a list of choices for each of the choice views in choice_views,
+    the maps of lower case category to subcategories and to method types, and a version which changes whenever
+    any of the other contents change.
+    '''
+
+    choice_views = (('media_name', MediaNameView),
+                    ('method_source', SourceView),
+                    ('instrumentation', InstrumentationView),
+                    ('method_types', MethodTypeView),
+                    ('subcategories', SubcategoryView),
+                    ('gear_types', GearTypeView),
+                    ('stat_objectives', StatObjectiveView),
+                    ('stat_item_types', StatItemTypeView),
+                    ('stat_analysis_types', StatAnalysisTypeView),
+                    ('stat_source_type', StatSourceTypeView),
+                    ('stat_media_emphasized', StatMediaNameView),
+                    ('stat_special_topics', StatSpecialTopicsView))
+
+    def get_category_map(self, field_name):
+        ''' Returns a dictionary with the lower case method categories as keys and the sorted list of distinct
+        values of field_name within each category as values. Blank categories and values, which Oracle
+        returns as None, are left out.
+        '''
+        result = defaultdict(set)
+        for (category, value) in MethodVW.objects.values_list('method_category', field_name).distinct():
+            if category and value:
+                result[category.lower()].add(value)
+
+        return dict([(category, sorted(values)) for (category, values) in result.items()])
+
+    def get_content(self, request, *args, **kwargs):
+        choices = {}
+        for (name, view_class) in self.choice_views:
+            choices[name] = [{'value': value, 'display_value': display_value}
+                             for (value, display_value) in view_class().get_choices(request)]
+
+        result = {'choices': choices,
+                  'subcategories_by_category': self.get_category_map('method_subcategory'),
+                  'method_types_by_category': self.get_category_map('method_type_desc')}
+        result['version'] = hashlib.md5(json.dumps(result, sort_keys=True).encode('utf-8')).hexdigest()
+
+        return json.dumps(result)
+
+
 class ResultsMixin(MultipleObjectMixin):
     '''
     Extends the MultipleObjectMixin to implement the standard filters for method result searches.
@@ -273,49 +421,166 @@ class ResultsMixin(MultipleObjectMixin):
 
     context_object_name = 'data'
 
-    def get_queryset(self):
-        data = self.queryset
+    facet_index = None  # FacetIndex for the queryset's model. Used when use_facet_index is True.
+    use_facet_index = False  # If True, the filters are resolved using facet_index rather than the database.
+
+    def get_facet_filters(self):
+        ''' Returns a list of (field, lookup, value) tuples representing the filters in the request.'''
+        filters = []
 
         if 'category' in self.request.GET and self.request.GET.get('category'):
-            data = data.filter(method_category__iexact=self.request.GET.get('category'))
+            filters.append(('method_category', 'iexact', self.request.GET.get('category')))
         if 'subcategory' in self.request.GET and self.request.GET.get('subcategory'):
-            data = data.filter(method_subcategory__in=self.request.GET.getlist('subcategory'))
+            filters.append(('method_subcategory', 'in', self.request.GET.getlist('subcategory')))
 
         media_name = self.request.GET.get('media_name', '')
         source = self.request.GET.get('source', '')
         instrumentation = self.request.GET.get('instrumentation', '')
         if media_name != '':
-            data = data.filter(media_name__exact=media_name)
+            filters.append(('media_name', 'exact', media_name))
         if source != '':
-            data = data.filter(method_source__contains=source)
+            filters.append(('method_source', 'contains', source))
         if instrumentation != '':
-            data = data.filter(instrumentation_id__exact=instrumentation)
+            filters.append(('instrumentation_id', 'exact', instrumentation))
 
         if 'method_type' in self.request.GET:
-            data = data.filter(method_type_desc__in=self.request.GET.getlist('method_type'))
+            filters.append(('method_type_desc', 'in', self.request.GET.getlist('method_type')))
+
+        return filters
+
+    def get_queryset(self):
+        data = self.queryset.all()
+        filters = self.get_facet_filters()
+
+        if self.use_facet_index and self.facet_index is not None:
+            if filters:
+                data = data.filter(pk__in=self.facet_index.filter(filters))
+        else:
+            for (field, lookup, value) in filters:
+                data = data.filter(**{'%s__%s' % (field, lookup): value})
 
         return data
 
 
-class BaseResultsView(TemplateResponseMixin, View):
+class BaseResultsView(SingleFlightMixin, TemplateResponseMixin, View):
     '''
     Extends the standard View and TemplateResponse to implement the view which will return method
     results while adding a context variable to be used to specify the page's export_url.
     The view can be mixed with a child of ResultsMixin to implement method result page views or any
     mixin containing a get_queryset method and a get_context_data method.
+
+    If the request contains format=json, a page of the results is returned as a json object instead.
+    The page is specified by the request parameters sort (a field name, prefixed by '-' for descending order),
+    limit, and either offset or after. after should be the next value returned with the previous page and is used
+    to retrieve the following page using the values of the last row of the previous page (keyset pagination)
+    rather than an offset. json mode is only available when the queryset's rows are uniquely identified by
+    keyset_fields.
     '''
 
     export_url = None  # # Optional - url which will be used to download the contents of the results page.
 
+    allow_json = True  # Whether the results can be requested in json mode.
+    json_fields = None  # Fields returned in json mode. If None, field_names are used.
+    keyset_fields = ('method_id',)  # Fields which uniquely identify a row. The last field should be unique for the model.
+    default_limit = 50  # Number of rows returned in json mode when limit is not specified.
+    max_limit = 500  # Maximum number of rows which can be requested in json mode.
+
+    def get_json_fields(self):
+        fields = list(self.json_fields or getattr(self, 'field_names', []))
+        for field in self.keyset_fields:
+            if field not in fields:
+                fields.append(field)
+        return fields
+
+    def _keyset_q(self, sort_field, descending, after):
+        '''
+        Returns a Q object selecting the rows which follow the row with the sort and keyset field values in after.
+        Null sort values are ordered last and the keyset fields are always in ascending order.
+        '''
+        sort_value = after[0]
+
+        keyset_q = Q(pk__in=[])
+        equal_q = Q()
+        for (field, value) in zip(self.keyset_fields, after[1:]):
+            keyset_q = keyset_q | (equal_q & Q(**{'%s__gt' % field: value}))
+            equal_q = equal_q & Q(**{field: value})
+
+        if sort_value is None:
+            return Q(**{'%s__isnull' % sort_field: True}) & keyset_q
+
+        return (Q(**{'%s__%s' % (sort_field, 'lt' if descending else 'gt'): sort_value}) |
+                (Q(**{sort_field: sort_value}) & keyset_q) |
+                Q(**{'%s__isnull' % sort_field: True}))
+
+    def render_to_json_response(self, qs):
+        fields = self.get_json_fields()
+
+        sort = self.request.GET.get('sort', '') or self.keyset_fields[0]
+        sort_field = sort.lstrip('-')
+        if sort_field not in fields:
+            return HttpResponseBadRequest('Invalid sort field: %s' % sort_field)
+
+        try:
+            limit = min(int(self.request.GET.get('limit', self.default_limit)), self.max_limit)
+            offset = int(self.request.GET.get('offset', 0))
+            after = self.request.GET.get('after', '')
+            if after:
+                after = json.loads(urlsafe_base64_decode(after).decode('utf-8'))
+        except (ValueError, TypeError):
+            return HttpResponseBadRequest('Invalid paging parameters')
+        if limit < 1 or offset < 0 or (after and (not isinstance(after, list) or len(after) != len(self.keyset_fields) + 1)):
+            return HttpResponseBadRequest('Invalid paging parameters')
+
+        # Concurrent identical requests share the page.
+        content = self.single_flight('json', lambda: self.get_json_content(qs, fields, sort, limit, offset, after))
+        return HttpResponse(content, content_type='application/json')
+
+    def get_json_content(self, qs, fields, sort, limit, offset, after):
+        ''' Returns the json object containing the page of the rows of qs specified by the validated paging parameters.'''
+        sort_field = sort.lstrip('-')
+        descending = sort.startswith('-')
+        sort_expression = F(sort_field).desc(nulls_last=True) if descending else F(sort_field).asc(nulls_last=True)
+        rows_qs = qs.values(*fields).order_by(sort_expression, *self.keyset_fields)
+
+        if after:
+            rows = list(rows_qs.filter(self._keyset_q(sort_field, descending, after))[:limit])
+        else:
+            rows = list(rows_qs[offset:offset + limit])
+
+        next_page = None
+        if len(rows) == limit:
+            last_row = rows[-1]
+            next_page = urlsafe_base64_encode(json.dumps([last_row[sort_field]] + [last_row[f] for f in self.keyset_fields],
+                                                         cls=DjangoJSONEncoder).encode('utf-8'))
+
+        result = {'count': rows_qs.order_by().count(),
+                  'sort': sort,
+                  'limit': limit,
+                  'offset': None if after else offset,
+                  'next': next_page,
+                  'results': rows}
+
+        return json.dumps(result, cls=DjangoJSONEncoder)
+
+    def get_object_list(self):
+        ''' Returns the list of results shown on the page.'''
+        return list(self.get_queryset())
+
     def get(self, request, *args, **kwargs):
-        self.object_list = self.get_queryset()
+        if request.GET.get('format') == 'json':
+            if not self.allow_json:
+                return HttpResponseBadRequest('The json format is not supported by these results')
+            return self.render_to_json_response(self.get_queryset())
+
+        # Concurrent identical requests share the list of results.
+        self.object_list = self.single_flight('object_list', self.get_object_list)
         context = self.get_context_data(object_list=self.object_list)
         if self.export_url:
             context['export_url'] = self.export_url
         return self.render_to_response(context)
 
 
-class ExportBaseResultsView(View):
+class ExportBaseResultsView(SingleFlightMixin, View):
     '''
     Extends the standard View to implement a view which returns downloads method results. The view
     can be mixed with a child of ResultsMixin to implement method result page download results or any
@@ -328,37 +593,45 @@ class ExportBaseResultsView(View):
 
     def post(self, request, *args, **kwargs):
         if request.POST:
-            # Check to see if method id is in export_fields and add link_to_method_summary
-            fields = list(self.export_fields)
-            fields.insert(0, 'method_id')
-
-            method_ids = self.request.POST.getlist('method_id', [])
-            vl_qs = self.get_queryset().filter(method_id__in=method_ids).values_list(*fields)
-
-            # Get list of method summary urls in same order as values query set
-            result_set = []
-            for obj in vl_qs:
-                this_list = list(obj)
-                # This is not the "right way to get the url". However reverse is causing wsgi/nemi to be added on deployment.
-                # For now I am using an attribute to set the method_summary url this.
-                this_list.append('https://' + get_current_site(request).domain + self.method_summary_url + str(this_list[0]) + '/')
-                result_set.append(this_list)
-
-            fields.append('link_to_method_summary')
-            HEADINGS = [name.replace('_', ' ').title() for name in fields]
-
             export_type = kwargs.get('export', 'xls')
+            if export_type not in ('tsv', 'xls'):
+                raise Http404
+
+            # Concurrent identical requests share the exported rows.
+            (HEADINGS, result_set) = self.single_flight('export', lambda: self.get_export_rows(request))
             if export_type == 'tsv':
                 return tsv_response(HEADINGS, result_set, self.filename)
-
-            elif export_type == 'xls':
-                return xls_response(HEADINGS, result_set, self.filename)
-
             else:
-                raise Http404
+                return xls_response(HEADINGS, result_set, self.filename)
         else:
             raise Http404
 
+    def get_export_rows(self, request):
+        ''' Returns a tuple of the list of headings and the list of rows of the methods selected in request.'''
+        # Check to see if method id is in export_fields and add link_to_method_summary
+        fields = list(self.export_fields)
+        fields.insert(0, 'method_id')
+
+        method_ids = self.request.POST.getlist('method_id', [])
+
+        # Get list of method summary urls in same order as values query set
+        result_set = []
+        for obj in self.get_export_values(method_ids, fields):
+            this_list = list(obj)
+            # This is not the "right way to get the url". However reverse is causing wsgi/nemi to be added on deployment.
+            # For now I am using an attribute to set the method_summary url this.
+            this_list.append('https://' + get_current_site(request).domain + self.method_summary_url + str(this_list[0]) + '/')
+            result_set.append(this_list)
+
+        fields.append('link_to_method_summary')
+        HEADINGS = [name.replace('_', ' ').title() for name in fields]
+
+        return (HEADINGS, result_set)
+
+    def get_export_values(self, method_ids, fields):
+        ''' Returns an iterable of tuples containing the values of fields for the results with method_ids.'''
+        return self.get_queryset().filter(method_id__in=method_ids).values_list(*fields)
+
 
 class MethodResultsMixin(ResultsMixin):
     '''
@@ -366,16 +639,27 @@ class MethodResultsMixin(ResultsMixin):
     '''
 
     queryset = MethodVW.objects.all()
+    facet_index = method_index
+
+    def get_facet_filters(self):
+        filters = super(MethodResultsMixin, self).get_facet_filters()
+
+        matrix = self.request.GET.get('matrix', '')
+        if matrix != '':
+            filters.append(('matrix', 'exact', matrix))
+        return filters
 
     def get_queryset(self):
         data = super(MethodResultsMixin, self).get_queryset()
 
-        if 'method_number' in self.request.GET:
-            data = data.filter(source_method_identifier__icontains=self.request.GET.get('method_number'))
+        method_number = self.request.GET.get('method_number')
+        if method_number is not None:
+            if self.use_facet_index:
+                if method_number:
+                    data = data.filter(pk__in=method_identifier_index.search(method_number))
+            else:
+                data = data.filter(source_method_identifier__icontains=method_number)
 
-        matrix = self.request.GET.get('matrix', '')
-        if matrix != '':
-            data = data.filter(matrix__exact=matrix)
         return data
 
 
@@ -386,6 +670,7 @@ class MethodResultsView(MethodResultsMixin, FieldHelpMixin, BaseResultsView):
 
     template_name = 'methods/method_results.html'
     export_url = reverse_lazy('methods-export_results')
+    use_facet_index = True
     field_names = ['source_method_identifier',
                    'method_source',
                    'method_descriptive_name',
@@ -397,6 +682,81 @@ class MethodResultsView(MethodResultsMixin, FieldHelpMixin, BaseResultsView):
                    'matrix',
                    'relative_cost_symbol']
 
+    def get_context_data(self, **kwargs):
+        context = super(MethodResultsView, self).get_context_data(**kwargs)
+
+        # Suggest similar method numbers when a method number search finds nothing.
+        method_number = self.request.GET.get('method_number', '')
+        if method_number and not self.object_list:
+            context['suggestions'] = _suggestions_with_urls(get_suggestions(method_number, ['method_number']),
+                                                            self.request.GET, 'method_number')
+
+        return context
+
+
+class MethodFacetCountView(MethodResultsMixin, View):
+    '''
+    Extends MethodResultsMixin to return as a json object the number of methods which each choice
+    of the method search form would match, given the choices currently made. The request parameters
+    are the same as those of the method results page. The counts for a facet ignore the current choice
+    for that facet, so that the alternatives can be shown. The counts are computed from the facet index.
+    The search pages do not use this view; it is only provided for API clients.
+    '''
+
+    # Request parameter and index field for each facet returned.
+    facets = (('category', 'method_category'),
+              ('subcategory', 'method_subcategory'),
+              ('media_name', 'media_name'),
+              ('source', 'method_source'),
+              ('instrumentation', 'instrumentation_id'),
+              ('method_type', 'method_type_desc'),
+              ('matrix', 'matrix'))
+
+    # The source choices which group several method sources. Keys are the choice values and values
+    # are functions which return True if a method_source is in the group.
+    source_groups = (('EPA', lambda source: 'EPA' in source),
+                     ('USGS', lambda source: 'USGS' in source),
+                     ('DOE', lambda source: source.startswith('DOE')))
+
+    def get_source_counts(self, counts):
+        ''' Returns counts, a dictionary of method source counts, with the grouped sources
+        replaced by the group choice.
+        '''
+        result = {}
+        for (source, count) in counts.items():
+            for (group, in_group) in self.source_groups:
+                if in_group(source):
+                    source = group
+                    break
+            result[source] = result.get(source, 0) + count
+
+        return result
+
+    def get(self, request, *args, **kwargs):
+        filters = self.get_facet_filters()
+
+        within = None
+        if request.GET.get('method_number'):
+            within = frozenset(self.get_queryset().values_list('method_id', flat=True))
+
+        # The counts and the total are computed from the same version of the index.
+        index = self.facet_index.snapshot()
+        counts = index.facet_counts(filters, [field for (param, field) in self.facets], within)
+
+        pks = index.filter(filters)
+        if within is not None:
+            pks = pks & within
+
+        result = {'method_count': len(pks),
+                  'facets': {}}
+        for (param, field) in self.facets:
+            field_counts = counts[field]
+            if field == 'method_source':
+                field_counts = self.get_source_counts(field_counts)
+            result['facets'][param] = dict([(str(value), count) for (value, count) in field_counts.items()])
+
+        return HttpResponse(json.dumps(result), content_type='application/json')
+
 
 class ExportMethodResultsView(MethodResultsMixin, ExportBaseResultsView):
     '''
@@ -426,17 +786,27 @@ class AnalyteResultsMixin(ResultsMixin):
     '''
 
     queryset = MethodAnalyteAllVW.objects.all()
+    facet_index = method_analyte_index
 
     def get_queryset(self):
         data = super(AnalyteResultsMixin, self).get_queryset()
 
         if 'analyte_name' in self.request.GET and self.request.GET.get('analyte_name'):
             names = self.request.GET.getlist('analyte_name')
-            data = data.filter(analyte_name__iregex=r'(' + '|'.join(['^' + re.escape(n) + '$' for n in names]) + ')')
+            if self.use_facet_index:
+                # The view has a row for each synonym which share the analyte_method_id, so the rows are
+                # selected by name rather than by primary key. The index gives the stored spellings of the
+                # names so that the column is compared directly rather than case folded, which can use its index.
+                data = data.filter(analyte_name__in=self.facet_index.variants('analyte_name', names))
+            else:
+                data = data.filter(analyte_name__iregex=r'(' + '|'.join(['^' + re.escape(n) + '$' for n in names]) + ')')
 
         elif 'analyte_code' in self.request.GET and self.request.GET.get('analyte_code'):
             codes = self.request.GET.getlist('analyte_code')
-            data = data.filter(analyte_code__iregex=r'(' + '|'.join(['^' + re.escape(c) + '$' for c in codes]) + '$)')
+            if self.use_facet_index:
+                data = data.filter(analyte_code__in=self.facet_index.variants('analyte_code', codes))
+            else:
+                data = data.filter(analyte_code__iregex=r'(' + '|'.join(['^' + re.escape(c) + '$' for c in codes]) + '$)')
 
         else:
             data = data.filter(preferred__exact=-1)  # Only get the method for the preferred analyte
@@ -502,6 +872,9 @@ class AnalyteResultsView(AnalyteResultsMixin, FieldHelpMixin, BaseResultsView):
 
     template_name = 'methods/analyte_results.html'
     export_url = reverse_lazy('methods-export_analyte_results')
+    use_facet_index = True
+    # There is a row for each synonym of each analyte_method_id.
+    keyset_fields = ('method_id', 'analyte_method_id', 'analyte_name')
 
     field_names = ['source_method_identifier',
                    'method_source',
@@ -565,12 +938,35 @@ class StatisticalResultsMixin(ResultsMixin):
     '''
 
     queryset = MethodVW.objects.all()
+    facet_index = statistical_method_index
+
+    # Request parameters for the statistical method attributes held in other tables. Each is also a facet_index field.
+    related_params = ('item_type',
+                      'analysis_type',
+                      'publication_source_type',
+                      'study_objective',
+                      'media_emphasized',
+                      'special_topic')
+
+    def get_facet_filters(self):
+        filters = super(StatisticalResultsMixin, self).get_facet_filters()
+
+        complexity = self.request.GET.get('complexity', '')
+        if complexity != '':
+            filters.append(('sam_complexity', 'exact', complexity))
+
+        # The related attributes can only be filtered using the index. Otherwise get_queryset uses subqueries.
+        if self.use_facet_index:
+            filters.extend([(param, 'exact', self.request.GET.get(param))
+                            for param in self.related_params if self.request.GET.get(param, '') != ''])
+        return filters
 
     def get_queryset(self):
         data = super(StatisticalResultsMixin, self).get_queryset()
+        if self.use_facet_index:
+            return data
 
         item_type = self.request.GET.get('item_type', '')
-        complexity = self.request.GET.get('complexity', '')
         analysis_type = self.request.GET.get('analysis_type', '')
         publication_source_type = self.request.GET.get('publication_source_type', '')
         study_objective = self.request.GET.get('study_objective', '')
@@ -579,8 +975,6 @@ class StatisticalResultsMixin(ResultsMixin):
 
         if item_type != '':
             data = data.filter(source_citation_id__in=SourceCitationRef.objects.filter(item_type__exact=item_type).values('source_citation_id'))
-        if complexity != '':
-            data = data.filter(sam_complexity__exact=complexity)
         if analysis_type != '':
             data = data.filter(method_id__in=StatAnalysisRel.objects.filter(analysis_type__exact=analysis_type).values('method_id'))
         if publication_source_type != '':
@@ -602,12 +996,19 @@ class StatisticalResultsView(StatisticalResultsMixin, FieldHelpMixin, BaseResult
 
     template_name = 'methods/statistical_results.html'
     export_url = reverse_lazy('methods-export_statistical_results')
+    use_facet_index = True
 
     field_names = ['author',
                    'title',
                    'publication_year',
                    'method_source',
                    'link_to_full_method']
+    # The title column shows method_official_name.
+    json_fields = ['author',
+                   'method_official_name',
+                   'publication_year',
+                   'method_source',
+                   'link_to_full_method']
 
 
 class ExportStatisticalResultsView(StatisticalResultsMixin, ExportBaseResultsView):
@@ -633,10 +1034,10 @@ class RegulatoryResultsMixin(ResultsMixin):
     Extends the Results Mixin to implement regulatory method search.
     '''
 
-    queryset = RegQueryVW.objects.exclude(method_subcategory__in=['SAMPLE/PREPARATION', 'GENERAL'])
+    queryset = RegQueryVW.objects.exclude(method_subcategory__in=EXCLUDED_SUBCATEGORIES)
 
     def get_queryset(self):
-        data = self.queryset
+        data = self.queryset.all()
 
         if 'analyte_name' in self.request.GET and self.request.GET.get('analyte_name'):
             data = data.filter(analyte_name__iexact=self.request.GET.get('analyte_name'))
@@ -644,7 +1045,14 @@ class RegulatoryResultsMixin(ResultsMixin):
         elif 'analyte_code' in self.request.GET and self.request.GET.get('analyte_code'):
             data = data.filter(preferred=-1).filter(analyte_code__iexact=self.request.GET.get('analyte_code'))
 
-        return data.order_by('regulation', 'method_source', 'source_method_identifier')
+        return data.order_by(*REGULATORY_ORDERING)
+
+    def get_regulatory_results(self):
+        ''' Returns the precomputed RegulatoryResults matching the request. These are the same
+        results as get_queryset.
+        '''
+        return regulatory_results.get(analyte_name=self.request.GET.get('analyte_name', ''),
+                                      analyte_code=self.request.GET.get('analyte_code', ''))
 
 
 class RegulatoryResultsView(RegulatoryResultsMixin, FieldHelpMixin, BaseResultsView):
@@ -653,6 +1061,9 @@ class RegulatoryResultsView(RegulatoryResultsMixin, FieldHelpMixin, BaseResultsV
 
     template_name = 'methods/regulatory_results.html'
     export_url = reverse_lazy('methods-export_regulatory_results')
+    # The view has several rows for each revision (its declared primary key) and no unique column
+    # to page on, so json mode is not provided.
+    allow_json = False
 
     field_names = ['regulation',
                    'reg_location',
@@ -665,29 +1076,23 @@ class RegulatoryResultsView(RegulatoryResultsMixin, FieldHelpMixin, BaseResultsV
                    'instrumentation_description',
                    'relative_cost']
 
+    def get_object_list(self):
+        return self.get_regulatory_results().rows
+
 
 class ExportRegulatoryResultsView(RegulatoryResultsMixin, ExportBaseResultsView):
     '''
     Extends the ExportBaseResultView with RegulatoryResultsMixin to provide an Excel file for download.
     '''
 
-    export_fields = ('regulation',
-                     'regulation_name',
-                     'reg_location',
-                     'method_source',
-                     'source_method_identifier',
-                     'method_descriptive_name',
-                     'revision_information',
-                     'dl_value',
-                     'dl_units',
-                     'dl_type',
-                     'instrumentation',
-                     'instrumentation_description',
-                     'relative_cost_symbol',
-                     'relative_cost')
+    export_fields = REGULATORY_EXPORT_FIELDS
 
     filename = 'regulatory_method_results'
 
+    def get_export_values(self, method_ids, fields):
+        method_ids = set([str(method_id) for method_id in method_ids])
+        return [row for row in self.get_regulatory_results().export_rows if str(row[0]) in method_ids]
+
 
 class KeywordResultsView(TemplateResponseMixin, View):
     '''Extends the standard View to implement the keyword search view. This form only
@@ -698,8 +1103,8 @@ class KeywordResultsView(TemplateResponseMixin, View):
 
     def get(self, request, *args, **kwargs):
         '''Returns the http response for the keyword search form. If the form is bound
-        validate the form and the execute a raw SQL query to return matching methods. The resulting
-        query set will be shown using pagination and in score order.
+        validate the form and then search for the matching methods. The results will be shown using
+        pagination and in score order. Only the methods on the requested page are retrieved.
         '''
         if request.GET:
             # Form has been submitted.
@@ -712,23 +1117,8 @@ class KeywordResultsView(TemplateResponseMixin, View):
                 # Render a blank form
                 return self.render_to_response({'error' : True})
 
-            clean_keyword = _clean_keyword(keyword)
-
-            query = "SELECT DISTINCT MAX(score(1)) method_summary_score, mf.method_id, mf.source_method_identifier method_number, \
-mf.link_to_full_method, mf.mimetype, mf.method_official_name, mf.method_descriptive_name, mf.method_source, mf.method_category \
-FROM nemi_data.method_fact mf, nemi_data.revision_join rj \
-WHERE mf.revision_id = rj.revision_id (+) AND \
-(CONTAINS(mf.source_method_identifier, '" + clean_keyword + "', 1) > 0 \
-OR CONTAINS(rj.method_pdf, '" + clean_keyword + "', 2) > 0) \
-GROUP BY mf.method_id, mf.source_method_identifier, mf.link_to_full_method, mf.mimetype, mf.revision_id, mf.method_official_name, \
-mf.method_descriptive_name, mf.method_source, mf.method_category \
-ORDER BY method_summary_score desc;"
-
-            # Execute as raw query since  it uses a CONTAINS clause and context grammer.
-            cursor = connection.cursor()  # @UndefinedVariable
-            cursor.execute(query)
-            results_list = dictfetchall(cursor)
-            cursor.close()
+            # Only the requested page is retrieved from the database.
+            results_list = KeywordSearchResults(keyword, wait=get_remaining_time(request))
             paginator = Paginator(results_list, 20)
 
             try:
@@ -745,10 +1135,14 @@ ORDER BY method_summary_score desc;"
             path = request.get_full_path()
             # Remove the &page parameter.
             current_url = path.rsplit('&page=')[0]
-            return self.render_to_response({'keyword': keyword,
-                                            'current_url' : current_url,
-                                            'results' : results,
-                                            'total_found' : len(results_list)})
+            context = {'keyword': keyword,
+                       'current_url' : current_url,
+                       'results' : results,
+                       'total_found' : results_list.count()}
+            if not context['total_found']:
+                context['suggestions'] = _suggestions_with_urls(get_suggestions(keyword), request.GET, 'keyword_search_field')
+
+            return self.render_to_response(context)
 
         # Render a blank form
         return self.render_to_response({})
@@ -792,41 +1186,46 @@ class MethodSummaryView(FieldHelpMixin, DetailView):
 
     def get_object(self):
         ''' Override get_object to return the method details, method analytes, and method notes.
-        The returned object is a dictionary.
+        The returned object is a dictionary. The object is cached until the method is changed.
         '''
-        result = {}
         if 'method_id' in self.kwargs:
-            try:
-                result['details'] = MethodSummaryVW.objects.get(method_id=self.kwargs['method_id'])
+            method_id = self.kwargs['method_id']
+            cache_key = 'method_summary:%s:%s' % (method_id, get_method_version(method_id))
+            result = cache.get(cache_key)
+            if result is None:
+                result = self.get_summary()
+                cache.set(cache_key, result, getattr(settings, 'METHOD_SUMMARY_CACHE_TIMEOUT', 60 * 60 * 24))
 
-            except MethodSummaryVW.DoesNotExist:
-                result['details'] = None
+            return result
+        else:
+            raise Http404
 
-            # Get associated analyted data
-            result['analytes'] = []
+    def get_summary(self):
+        ''' Returns a dictionary containing the method details, method analytes, method notes, and revisions
+        for the method_id in kwargs.
+        '''
+        result = {}
+        try:
+            result['details'] = MethodSummaryVW.objects.get(method_id=self.kwargs['method_id'])
 
-            analyte_qs = _analyte_value_qs(self.kwargs['method_id'])
-            for r in analyte_qs:
-                name = r['analyte_name'].lower()
-                code = r['analyte_code'].lower()
-                inner_qs = AnalyteCodeVW.objects.filter(Q(ac_analyte_name__iexact=name) | Q(analyte_analyte_code__iexact=code)).values_list('analyte_analyte_code', flat=True).distinct()
-                qs = AnalyteCodeVW.objects.all().filter(analyte_analyte_code__in=inner_qs).order_by('ac_analyte_name').values('ac_analyte_name')
-                syn = []
-                for a in qs:
-                    syn.append(a['ac_analyte_name'])
+        except MethodSummaryVW.DoesNotExist:
+            result['details'] = None
 
-                result['analytes'].append({'r' : r, 'syn' : syn})
+        # Get associated analyted data
+        result['analytes'] = []
 
-            # Get description notes
-            result['notes'] = AnalyteSummaryVW.objects.filter(method_id__exact=self.kwargs['method_id']).values('precision_descriptor_notes', 'dl_note').distinct()
+        analyte_qs = list(_analyte_value_qs(self.kwargs['method_id']))
+        for (r, syn) in zip(analyte_qs, _analyte_synonyms(analyte_qs)):
+            result['analytes'].append({'r' : r, 'syn' : syn})
 
-            # Get revision information
-            result['latest_revision'] = RevisionSummaryVw.objects.get(revision_id=result['details'].revision_id)
-            result['revisions'] = RevisionSummaryVw.objects.filter(method_id__exact=self.kwargs['method_id']).order_by('-revision_id')
+        # Get description notes
+        result['notes'] = list(AnalyteSummaryVW.objects.filter(method_id__exact=self.kwargs['method_id']).values('precision_descriptor_notes', 'dl_note').distinct())
 
-            return result
-        else:
-            raise Http404
+        # Get revision information
+        result['latest_revision'] = RevisionSummaryVw.objects.get(revision_id=result['details'].revision_id)
+        result['revisions'] = list(RevisionSummaryVw.objects.filter(method_id__exact=self.kwargs['method_id']).order_by('-revision_id'))
+
+        return result
 
     def get_context_data(self, **kwargs):
         context = super(MethodSummaryView, self).get_context_data(**kwargs)
@@ -929,73 +1328,213 @@ class ExportMethodAnalyte(View):
             return response
 
 
-class MethodPdfView(PdfView):
-    '''
-    Extends the PdfView to serve a method's pdf file if it it exists in the database.
-    '''
+class DatabasePdfView(PdfView):
+    '''
+    Extends PdfView to stream the pdf of the row of table whose key column matches the key keyword argument.
+    The row's checksum_column, or the checksum_column of the row of checksum_table with the same revision_id,
+    may contain the checksum of a shared pdf in blob_table. The row's own pdf in its method_pdf column is used
+    in preference, as the database procedures may have replaced it without changing the checksum, so the checksum
+    is only used if the row has no pdf of its own or its pdf has the size and the last checked_bytes bytes
+    of the shared pdf. Otherwise, or if the shared pdf is missing, the row's own pdf is used without its checksum.
+
+    The checksum identifies the contents of the pdf, so it is used as the ETag and, if settings.PDF_CACHE_DIR is
+    set, to serve the pdf from the PdfFileCache in that directory, only reading it from the database when it is
+    not cached. Pdfs without a checksum are always read from the database. As the dates of the row only have the
+    day on which the pdf changed, they are sent without a Last-Modified date, but with a weak ETag derived from
+    the key, the validator_columns and modified_columns of the row, and the size of the pdf.
+    '''
+
+    table = None  # Table or view containing the mimetype and method_pdf columns.
+    key = None  # Column and keyword argument identifying the row.
+    filename_column = None  # Optional column used by get_filename.
+    modified_columns = ()  # Date columns which are updated when the pdf changes. The latest is used as Last-Modified.
+    validator_columns = ()  # Other columns which change with the pdf, used in the ETag of a pdf without a checksum.
+    checksum_column = None  # Optional column containing the checksum of a pdf in blob_table.
+    checksum_table = None  # Table containing checksum_column, joined on revision_id, if it is not in table.
+    blob_table = 'nemi_data.pdf_blob'
+    checked_bytes = 2000  # Number of bytes at the end of the row's pdf compared with the shared pdf.
+
+    cursor = None
+    row = None
+    checksum = None
+
+    def get_filename(self, row):
+        ''' Returns the filename, without suffix, for the pdf in row. By default the key is used.'''
+        return self.kwargs[self.key]
+
+    def get_pdf_cache(self):
+        ''' Returns the PdfFileCache used to serve the pdfs, or None if they are not cached on disk.'''
+        if getattr(settings, 'PDF_CACHE_DIR', None):
+            return PdfFileCache()
+        return None
+
+    def get_query(self):
+        ''' Returns the query selecting the row, with a parameter for the key. If checksum_column is set, the
+        query also selects checksum_valid, which is 1 if the shared pdf with the checksum exists and the row has no
+        pdf of its own or one which matches it.
+        '''
+        columns = ['mimetype', 'method_pdf']
+        if self.filename_column:
+            columns.append(self.filename_column)
+        columns.extend(self.modified_columns)
+        columns.extend(self.validator_columns)
+        columns = ['t.%s' % column for column in columns]
+
+        tables = ['%s t' % self.table]
+        conditions = []
+        if self.checksum_column:
+            checksum_alias = 't'
+            if self.checksum_table:
+                checksum_alias = 'c'
+                tables.append('%s c' % self.checksum_table)
+                conditions.append('t.revision_id = c.revision_id (+)')
+            tables.append('%s b' % self.blob_table)
+            conditions.append('b.checksum (+) = %s.%s' % (checksum_alias, self.checksum_column))
+
+            columns.append('%s.%s' % (checksum_alias, self.checksum_column))
+            columns.append(
+                'CASE WHEN b.checksum IS NULL THEN 0 '
+                'WHEN t.method_pdf IS NULL THEN 1 '
+                'WHEN dbms_lob.getlength(t.method_pdf) = b.pdf_size AND dbms_lob.compare('
+                't.method_pdf, b.pdf, {0}, greatest(b.pdf_size - {1}, 1), greatest(b.pdf_size - {1}, 1)) = 0 THEN 1 '
+                'ELSE 0 END checksum_valid'.format(self.checked_bytes, self.checked_bytes - 1))
+        conditions.append('t.%s=%%s' % self.key)
+
+        return 'SELECT %s from %s where %s' % (', '.join(columns), ', '.join(tables), ' and '.join(conditions))
+
+    def get_stored_checksum(self):
+        ''' Returns the checksum of the pdf in blob_table used by the row, or None if the row's own pdf is used.'''
+        if self.checksum_column and self.row['CHECKSUM_VALID']:
+            return self.row[self.checksum_column.upper()]
+        return None
+
+    def get_shared_pdf(self, checksum):
+        self.cursor.execute('SELECT pdf from %s where checksum=%%s' % self.blob_table, [checksum])
+        result = self.cursor.fetchone()
+        return result[0] if result else None
 
     def get_pdf_info(self):
-        cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, source_method_identifier from nemi_data.method_summary_vw where method_id=%s',
-                       [self.kwargs['method_id']])
-        results_list = dictfetchall(cursor)
+        self.cursor = connection.cursor()
+        self.cursor.execute(self.get_query(), [self.kwargs[self.key]])
+        results_list = dictfetchall(self.cursor)
+
         if results_list:
-            self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
-            self.filename = _clean_name(results_list[0]['SOURCE_METHOD_IDENTIFIER'])
+            self.row = results_list[0]
+            self.mimetype = self.row['MIMETYPE']
+            self.pdf = self.row['METHOD_PDF']
+            self.filename = self.get_filename(self.row)
+
+            checksum = self.get_stored_checksum()
+            if checksum:
+                pdf_cache = self.get_pdf_cache()
+                cached_file = pdf_cache.open(checksum) if pdf_cache is not None else None
+                if cached_file is not None:
+                    self.checksum = checksum
+                    self.pdf = cached_file
+                    self.close_pdf()
+                    return
+
+                shared_pdf = self.get_shared_pdf(checksum)
+                if shared_pdf is None:
+                    # Removed since the row was read, so the row's own pdf, if any, is used.
+                    return
+
+                self.checksum = checksum
+                self.pdf = shared_pdf
+                if pdf_cache is not None:
+                    self.pdf = self.get_cached_pdf(pdf_cache)
+
+    def get_cached_pdf(self, pdf_cache):
+        ''' Returns the open file containing the pdf after copying it from the database into pdf_cache. The pdf
+        in the database is returned if the file can not be opened.
+        '''
+        pdf_cache.store(BlobStream(self.pdf, chunk_size=self.chunk_size))
+        cached_file = pdf_cache.open(self.checksum)
+        if cached_file is None:
+            return self.pdf
 
-        cursor.close()
+        self.close_pdf()
+        return cached_file
 
+    def close_pdf(self):
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
 
-class RevisionPdfView(PdfView):
-    '''
-    Extends PdfView to serve a revision's pdf file if it exists in the database.
-    '''
-    def get_pdf_info(self):
-        cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, revision_information from nemi_data.revision_summary_vw where revision_id=%s', [self.kwargs['revision_id']])
-        results_list = dictfetchall(cursor)
+    def get_last_modified(self):
+        if not self.checksum:
+            return None
 
-        if results_list:
-            self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
-            self.filename = self.kwargs['revision_id']
+        dates = [self.row[column.upper()] for column in self.modified_columns if self.row[column.upper()] is not None]
+        if not dates:
+            return None
 
-        cursor.close()
+        return max([d if isinstance(d, datetime.datetime) else datetime.datetime.combine(d, datetime.time.min)
+                    for d in dates])
 
+    def get_checksum(self):
+        return self.checksum
 
-class RevisionPdfOnlineView(PdfView):
+    def get_etag(self):
+        if self.checksum:
+            return super(DatabasePdfView, self).get_etag()
+
+        length = blob_length(self.pdf)
+        if length is None:
+            return None
+        values = [self.kwargs[self.key]]
+        values.extend([self.row[column.upper()] for column in self.validator_columns + self.modified_columns])
+        values.append(length)
+        return 'W/"%s"' % hashlib.md5('-'.join([str(value) for value in values]).encode('utf-8')).hexdigest()
+
+
+class MethodPdfView(DatabasePdfView):
     '''
-    Extends PdfView to serve a revision's pdf file if it exists in the database.
+    Extends the DatabasePdfView to serve a method's pdf file if it it exists in the database.
     '''
-    def get_pdf_info(self):
-        cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, revision_information from nemi_data.revision_join_online where revision_id=%s', [self.kwargs['revision_id']])
-        results_list = dictfetchall(cursor)
 
-        if results_list:
-            self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
-            self.filename = self.kwargs['revision_id']
+    table = 'nemi_data.method_summary_vw'
+    key = 'method_id'
+    filename_column = 'source_method_identifier'
+    validator_columns = ('revision_id',)
+    checksum_column = 'pdf_checksum'
+    checksum_table = 'nemi_data.revision_join'
 
-        cursor.close()
+    def get_filename(self, row):
+        return _clean_name(row['SOURCE_METHOD_IDENTIFIER'])
 
+class RevisionPdfView(DatabasePdfView):
+    '''
+    Extends DatabasePdfView to serve a revision's pdf file if it exists in the database.
+    '''
+
+    table = 'nemi_data.revision_summary_vw'
+    key = 'revision_id'
+    modified_columns = ('pdf_insert_date', 'last_update_date')
+    checksum_column = 'pdf_checksum'
+    checksum_table = 'nemi_data.revision_join'
 
-class RevisionPdfStagingView(PdfView):
+
+class RevisionPdfOnlineView(DatabasePdfView):
     '''
-    Extends PdfView to serve a revision's pdf file if it exists in the database.
+    Extends DatabasePdfView to serve an online revision's pdf file if it exists in the database.
     '''
-    def get_pdf_info(self):
-        cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, revision_information from nemi_data.revision_join_stg where revision_id=%s', [self.kwargs['revision_id']])
-        results_list = dictfetchall(cursor)
 
-        if results_list:
-            self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
-            self.filename = self.kwargs['revision_id']
+    table = 'nemi_data.revision_join_online'
+    key = 'revision_id'
+    modified_columns = ('pdf_insert_date', 'last_update_date')
+    checksum_column = 'pdf_checksum'
+
+
+class RevisionPdfStagingView(DatabasePdfView):
+    '''
+    Extends DatabasePdfView to serve a staged revision's pdf file if it exists in the database.
+    '''
 
-        cursor.close()
+    table = 'nemi_data.revision_join_stg'
+    key = 'revision_id'
+    modified_columns = ('pdf_insert_date', 'last_update_date')
+    checksum_column = 'pdf_checksum'
 
 
 class WQPWebProxyView(SimpleWebProxyView):
@@ -1,8 +1,16 @@
 import re
 
 from django import http
+from django.conf import settings
+from django.db import DatabaseError
+from django.shortcuts import render
+from django.urls import resolve, Resolver404
 from django.utils.deprecation import MiddlewareMixin
 
+from common.utils.admission import get_client_address, AdmissionController
+from common.utils.cache import SingleFlightError
+from common.utils.query_budget import query_time_budget
+
 
 ACCESS_CONTROL_ALLOW_ORIGIN = 'Access-Control-Allow-Origin'
 ACCESS_CONTROL_EXPOSE_HEADERS = 'Access-Control-Expose-Headers'
@@ -62,3 +70,80 @@ class CorsMiddleware(MiddlewareMixin):
 
     def is_enabled(self, request):
             return re.match(CORS_URLS_REGEX, request.path_info)
+
+
+class QueryTimeBudgetMiddleware(object):
+    '''
+    Limits the time taken by the database statements of the views whose url names are in settings.QUERY_TIME_BUDGETS,
+    a dictionary of url name to the number of seconds allowed. A statement which is still running when the time runs
+    out is cancelled and a response asking the user to narrow their search is returned, with status 400. The same
+    response is returned to the requests which shared the result of a computation which has just failed (see single_flight).
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_budget(self, request):
+        ''' Returns the number of seconds allowed for the request or None if it is not limited.'''
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        return getattr(settings, 'QUERY_TIME_BUDGETS', {}).get(url_name)
+
+    def __call__(self, request):
+        seconds = self.get_budget(request)
+        if seconds is None:
+            return self.get_response(request)
+
+        with query_time_budget(seconds) as budget:
+            request.query_budget = budget
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        budget = getattr(request, 'query_budget', None)
+        if budget is None:
+            return None
+        if (isinstance(exception, DatabaseError) and budget.expired()) or isinstance(exception, SingleFlightError):
+            return render(request, 'query_too_broad.html', status=400)
+        return None
+
+
+class AdmissionControlMiddleware(object):
+    '''
+    Rejects requests with a 429 (Too Many Requests) response and a Retry-After header when the client has exceeded
+    the rate limit for the request's endpoint class, or when too many requests of that class are already being handled.
+    Endpoint classes are assigned by url name in settings.ADMISSION_ENDPOINT_CLASSES, with other requests in the
+    'page' class. The limits are set by settings.ADMISSION_RATE_LIMITS and settings.ADMISSION_MAX_IN_FLIGHT
+    (see AdmissionController).
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.controller = AdmissionController(getattr(settings, 'ADMISSION_RATE_LIMITS', {}),
+                                              getattr(settings, 'ADMISSION_MAX_IN_FLIGHT', {}))
+
+    def get_client(self, request):
+        ''' Returns the client's address (see get_client_address).'''
+        return get_client_address(request)
+
+    def get_endpoint_class(self, request):
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            url_name = None
+        return getattr(settings, 'ADMISSION_ENDPOINT_CLASSES', {}).get(url_name, 'page')
+
+    def __call__(self, request):
+        endpoint_class = self.get_endpoint_class(request)
+        outcome, retry_after = self.controller.admit(self.get_client(request), endpoint_class)
+        if outcome != 'admitted':
+            response = http.HttpResponse('Too many requests. Please try again in %s seconds.' % retry_after,
+                                         content_type='text/plain', status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
+        try:
+            return self.get_response(request)
+        finally:
+            self.controller.release(endpoint_class)
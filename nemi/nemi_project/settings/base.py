@@ -97,12 +97,14 @@ STATICFILES_FINDERS = (
 MIDDLEWARE = (
     'django.middleware.security.SecurityMiddleware',
     'nemi_project.middleware.CorsMiddleware',
+    'nemi_project.middleware.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'nemi_project.middleware.QueryTimeBudgetMiddleware',
 )
 
 ROOT_URLCONF = 'nemi_project.urls'
@@ -199,6 +201,132 @@ SESSION_COOKIE_AGE = 28800  # In seconds, this is eight hours
 # NEMI specific setting. List of emails to send new account notifications to.
 NEW_ACCOUNT_NOTIFICATIONS = ADMINS
 
+# The default cache is local to each server process. The data and method versions are kept in the
+# database so that a change made in one process, for instance publishing a method in the admin or
+# running the extract_pdf_text command, invalidates the indexes and cached responses of every process.
+# The results shared by concurrent identical requests are also kept in the database so that requests
+# to different processes are combined. Create the tables with "python manage.py createcachetable".
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'nemi_version_cache',
+        'OPTIONS': {
+            # There is a version for each published method.
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    'single_flight': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'nemi_single_flight_cache',
+    },
+}
+VERSION_CACHE = 'versions'
+SINGLE_FLIGHT_CACHE = 'single_flight'
+
+# Number of seconds the published data version is kept before being regenerated. In memory
+# indexes and cached responses built from the published data are rebuilt when it changes.
+DATA_VERSION_TIMEOUT = 60 * 60
+
+# Number of seconds each server process uses the data version it last read before reading it from the
+# versions cache again, so that the in memory indexes do not query the cache on every use.
+DATA_VERSION_CHECK_INTERVAL = 5
+
+# Number of seconds a method summary is cached. Cached summaries are also invalidated when the
+# method is published, archived, or approved.
+METHOD_SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Number of seconds the choice lists used by the search forms are cached.
+CHOICE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Number of seconds the methods matching a keyword search are cached. Cached matches are also
+# invalidated when the data version changes.
+KEYWORD_SEARCH_CACHE_TIMEOUT = 60 * 60
+
+# Concurrent identical requests to the results and export views share a single computation of their
+# result. The result is kept for SINGLE_FLIGHT_TIMEOUT seconds, and a request waits at most
+# SINGLE_FLIGHT_WAIT seconds, or the rest of its QUERY_TIME_BUDGETS time if that is less, for another
+# request's result before computing it itself. A failed computation is not repeated by the requests
+# sharing it for SINGLE_FLIGHT_FAILURE_TIMEOUT seconds. The results are kept in the SINGLE_FLIGHT_CACHE.
+SINGLE_FLIGHT_TIMEOUT = 10
+SINGLE_FLIGHT_WAIT = 10
+SINGLE_FLIGHT_FAILURE_TIMEOUT = 5
+
+# Backend used by the keyword search. Use 'methods.search.OracleTextBackend' to search with the
+# Oracle Text indexes or 'methods.search.SqliteFtsBackend' to search a local SQLite FTS5 index
+# which is stored in KEYWORD_SEARCH_INDEX_PATH and rebuilt when the data version changes.
+KEYWORD_SEARCH_BACKEND = 'methods.search.OracleTextBackend'
+KEYWORD_SEARCH_INDEX_PATH = os.path.join(SITE_HOME, 'keyword_search.sqlite3')
+
+# Directory containing the revision PDF text extracted by the extract_pdf_text command.
+PDF_TEXT_DIR = os.path.join(SITE_HOME, 'pdf_text')
+
+# Directory of the local cache of method and revision PDFs and the maximum number of bytes of PDFs kept in it.
+# Set PDF_CACHE_DIR to None to always read the PDFs from the database.
+PDF_CACHE_DIR = os.path.join(SITE_HOME, 'pdf_cache')
+PDF_CACHE_MAX_SIZE = 2 * 1024 ** 3
+
+# Uploaded revision PDFs are stored once in the shared pdf_blob table. Until the database procedures which
+# copy revisions between the staging, online and published tables also copy pdf_checksum, each revision
+# keeps its own copy in method_pdf as well. Set PDF_BLOB_ONLY to True once they do, so that only the shared
+# copy is kept and share_revision_pdfs clears the method_pdf columns.
+PDF_BLOB_ONLY = False
+
+# Number of threads in each server process which validate uploaded revision PDFs in the background.
+# Set to 0 to only validate them with the validate_revision_pdfs command.
+PDF_VALIDATION_WORKERS = 1
+
+# Number of seconds the database statements of a view may take, by url name. Statements still running
+# when the time runs out are cancelled and the user is asked to narrow their search.
+QUERY_TIME_BUDGETS = {
+    'methods-keyword': 20,
+    'methods-results': 10,
+    'methods-analyte_results': 15,
+    'methods-statistical_results': 10,
+    'methods-regulatory_results': 10,
+    'methods-export_results': 30,
+    'methods-export_analyte_results': 30,
+    'methods-export_statistical_results': 30,
+    'methods-export_regulatory_results': 30,
+}
+
+# Admission control. Requests are grouped into endpoint classes by url name; other requests are in the
+# 'page' class. ADMISSION_RATE_LIMITS gives, for each class, the (requests per minute, burst) allowed for
+# each client address and ADMISSION_MAX_IN_FLIGHT the number of requests handled at once by each server
+# process. Set ADMISSION_CLIENT_IP_HEADER (for instance to 'HTTP_X_FORWARDED_FOR') when behind a proxy, and
+# ADMISSION_TRUSTED_PROXY_HOPS to the number of proxies which append to that header, so that the address
+# added by the outermost trusted proxy is used rather than one supplied by the client. The admission metrics
+# are only shown to staff users and to the addresses in INTERNAL_IPS.
+ADMISSION_ENDPOINT_CLASSES = {
+    'methods-keyword': 'search',
+    'methods-results': 'search',
+    'methods-analyte_results': 'search',
+    'methods-statistical_results': 'search',
+    'methods-regulatory_results': 'search',
+    'methods-export_results': 'export',
+    'methods-export_analyte_results': 'export',
+    'methods-export_statistical_results': 'export',
+    'methods-export_regulatory_results': 'export',
+    'wqp_proxy': 'proxy',
+    'nemi_admission_metrics': 'metrics',
+}
+ADMISSION_RATE_LIMITS = {
+    'page': (600, 120),
+    'search': (60, 20),
+    'export': (20, 5),
+    'proxy': (60, 20),
+}
+ADMISSION_MAX_IN_FLIGHT = {
+    'search': 8,
+    'export': 4,
+    'proxy': 8,
+}
+ADMISSION_CLIENT_IP_HEADER = None
+ADMISSION_TRUSTED_PROXY_HOPS = 1
+INTERNAL_IPS = ['127.0.0.1']
+
 # Water Quality Portal URL
 WQP_URL = "http://www.waterqualitydata.us"
 
@@ -279,3 +407,13 @@ if any(arg in ('test', 'jenkins') for arg in sys.argv[1:]):
             return None
 
     MIGRATION_MODULES = DisableMigrations()
+
+    # Tests which do not use the database also use the versions and the single flight results.
+    CACHES['versions'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'versions',
+    }
+    CACHES['single_flight'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'single_flight',
+    }
@@ -48,53 +48,61 @@ Utils = {
             url : url,
             data : data,
             success : function(resp) {
-                var selectData = [];
-                var maxChar = 0; // Used to set the width to the display
-                                    // value with the most characters.
+                Utils.initSelectMenu(select2Id, resp.choices);
+            }
+        });
+    },
 
-                for ( var i = 0; i < resp.choices.length; i++) {
-                    selectData.push({
-                        id : resp.choices[i].value,
-                        text : resp.choices[i].display_value
-                    });
+    initSelectMenu : function(select2Id /* hidden element id */,
+            choices /* array [Objects] */) {
+        // Create a select2 option menu using choices, an array of Objects with
+        // the properties, value and display_value.
+        var selectData = [];
+        var maxChar = 0; // Used to set the width to the display
+                            // value with the most characters.
 
-                    if (resp.choices[i].display_value.length > maxChar) {
-                        maxChar = resp.choices[i].display_value.length;
-                    }
-                }
+        for ( var i = 0; i < choices.length; i++) {
+            selectData.push({
+                id : choices[i].value,
+                text : choices[i].display_value
+            });
 
-                var select2El = $('#' + select2Id);
+            if (choices[i].display_value.length > maxChar) {
+                maxChar = choices[i].display_value.length;
+            }
+        }
 
-                select2El.select2({
-                    width : 'off',
-                    data : selectData,
-                    placeholder : 'All',
-                    allowClear : true,
-                    minimumResultsForSearch : 15
-                });
+        var select2El = $('#' + select2Id);
 
-                var enableFn = select2El.data('enableFn');
-                if (enableFn) {
-                    Utils.setSelect2Enabled(select2El, enableFn());
-                }
-                //Set state of menu from web storage and set up change handler to store currents state
-                if (sessionStorage[select2Id]) {
-                    select2El.select2('val', sessionStorage[select2Id]);
-                } else {
-                    select2El.select2('val', 'all');
-                }
-                // This is hack to get aria-label on the links
-                $('.select2-choice').attr('aria-label', 'Select choice');
+        select2El.select2({
+            width : 'off',
+            data : selectData,
+            placeholder : 'All',
+            allowClear : true,
+            minimumResultsForSearch : 15
+        });
 
-                select2El.on('change', function(e) {
-                    sessionStorage[select2Id] = e.val;
+        var enableFn = select2El.data('enableFn');
+        if (enableFn) {
+            Utils.setSelect2Enabled(select2El, enableFn());
+        }
+        //Set state of menu from web storage and set up change handler to store currents state
+        if (sessionStorage[select2Id]) {
+            select2El.select2('val', sessionStorage[select2Id]);
+        } else {
+            select2El.select2('val', 'all');
+        }
+        // This is hack to get aria-label on the links
+        $('.select2-choice').attr('aria-label', 'Select choice');
 
-                    // Part of the hack
-                    $('.select2-search-choice-close').attr('aria-label', 'Close');
-                });
-            }
+        select2El.on('change', function(e) {
+            sessionStorage[select2Id] = e.val;
+
+            // Part of the hack
+            $('.select2-search-choice-close').attr('aria-label', 'Close');
         });
     },
+
     getHiddenInputHtml : function(name /* String */, value /* String */) {
         /* Return a string containing the html for a hidden input with name and value.
          */
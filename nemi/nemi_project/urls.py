@@ -30,6 +30,7 @@ sitemaps = {
 
 urlpatterns = [
     url(r'^version/', views.version, {}, name='nemi_version'),
+    url(r'^metrics/admission/$', views.admission_metrics, name='nemi_admission_metrics'),
     url(r'^admin/', admin.site.urls),
     url(r'^method-submission/', method_admin.urls),
 
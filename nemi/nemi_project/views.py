@@ -11,11 +11,12 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect
 from django.urls import reverse
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, FormView
 
+from common.utils.admission import get_client_address, stats as admission_stats
 from domhelp.views import FieldHelpMixin
 from newsfeed.views import RecentNewsMixin
 
@@ -99,3 +100,12 @@ def version(request):
     return HttpResponse(json.dumps({
         'version': __version__
     }), content_type='application/json')
+
+
+def admission_metrics(request):
+    ''' Returns the admission control counters of this process in the Prometheus text format. Only staff
+    users and clients with an address in settings.INTERNAL_IPS may see them.
+    '''
+    if not (request.user.is_staff or get_client_address(request) in getattr(settings, 'INTERNAL_IPS', [])):
+        return HttpResponseForbidden()
+    return HttpResponse(admission_stats.to_text(), content_type='text/plain; version=0.0.4')
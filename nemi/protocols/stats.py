@@ -0,0 +1,21 @@
+''' This module contains the number of protocols in NEMI, which is counted once per data version
+and then served from the cache. It does not use the method indexes, so that serving the count does
+not require them to be built.
+'''
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.models import SourceCitationRef
+from common.utils.cache import get_data_version
+
+
+def get_protocol_count():
+    ''' Returns the number of protocols for the current data version, counting them if the count is not in the cache.'''
+    key = 'protocol_count:%s' % get_data_version()
+    count = cache.get(key)
+    if count is None:
+        count = SourceCitationRef.protocol_objects.count()
+        cache.set(key, count, getattr(settings, 'DATA_VERSION_TIMEOUT', 60 * 60))
+
+    return count
@@ -4,6 +4,8 @@ from django.views.generic import View, ListView, DetailView
 
 from common.models import SourceCitationRef
 
+from .stats import get_protocol_count
+
 
 class ProtocolCountView(View):
     '''
@@ -11,7 +13,7 @@ class ProtocolCountView(View):
     '''
 
     def get(self, request, *args, **kwargs):
-        return HttpResponse('{"protocol_count" : "' + str(SourceCitationRef.protocol_objects.count()) + '"}', content_type="application/json");  
+        return HttpResponse('{"protocol_count" : "' + str(get_protocol_count()) + '"}', content_type="application/json");  
 
 
 class BrowseProtocolsView(ListView):
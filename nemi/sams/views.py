@@ -13,6 +13,7 @@ from common.models import SourceCitationRef, SourceCitationOnlineRef, SourceCita
 from common.models import Method, MethodOnline, MethodSubcategoryRef, MethodTypeRef, MethodStg, InstrumentationRef
 from common.models import StatAnalysisRelStg,  StatDesignRelStg, StatTopicRelStg, StatMediaRelStg
 from common.models import StatAnalysisRel, StatDesignRel, StatTopicRel, StatMediaRel
+from common.utils.cache import bump_data_version, bump_method_versions
 
 from .forms import StatMethodEditForm
 
@@ -360,6 +361,9 @@ class ApproveStatMethod(StaffuserRequiredMixin, TemplateResponseMixin, View):
             StatMediaRel.objects.create(method=method,
                                         media_name=t.media_name)
 
+        bump_data_version()
+        bump_method_versions([method.method_id])
+
         return self.render_to_response({'source_method_id' : method.source_method_identifier})
 
 